@@ -0,0 +1,66 @@
+"""
+Compares the report archive in report/archive.py with keeping the reports gzipped one by one and with one
+tar.gz of all reports: size, time to archive, time to read one report, and that every report is read back
+unchanged.
+
+Run from the repository root, with folders of reports (default: reports/):
+    python benchmarks/archive.py [report folder ...]
+"""
+import gzip
+import io
+import sys
+import tarfile
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from report import archive
+
+
+def main(folders: list) -> None:
+    files = archive.report_files(folders)
+    raw = sum(path.stat().st_size for path in files.values())
+
+    start = time.perf_counter()
+    gzipped = {name: gzip.compress(path.read_bytes(), compresslevel=9) for name, path in files.items()}
+    gzip_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as tar:
+        for name, path in files.items():
+            tar.add(path, arcname=name)
+    tar_time = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pack = Path(tmp) / "reports.pack"
+        start = time.perf_counter()
+        archive.add(pack, files)
+        pack_time = time.perf_counter() - start
+
+        with archive.Archive(pack) as reports:
+            start = time.perf_counter()
+            same = all(reports.read(name) == path.read_bytes() for name, path in files.items())
+            read_time = (time.perf_counter() - start) / len(files)
+            pack_size = pack.stat().st_size
+
+    start = time.perf_counter()
+    for data in gzipped.values():
+        gzip.decompress(data)
+    gzip_read = (time.perf_counter() - start) / len(files)
+
+    print(f"{len(files)} reports, {raw / 1024**2:.1f} MB")
+    print(f"{'storage':<18}{'size (MB)':>12}{'ratio':>8}{'write (s)':>12}{'read one (ms)':>16}")
+    rows = [
+        ("gzip per report", sum(len(x) for x in gzipped.values()), gzip_time, f"{gzip_read * 1000:.2f}"),
+        ("tar.gz", len(buffer.getvalue()), tar_time, "whole file"),
+        ("archive", pack_size, pack_time, f"{read_time * 1000:.2f}"),
+    ]
+    for name, size, seconds, read in rows:
+        print(f"{name:<18}{size / 1024**2:>12.2f}{raw / size:>8.1f}{seconds:>12.2f}{read:>16}")
+    print(f"all reports read back unchanged: {'yes' if same else 'NO'}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:] or [Path(__file__).resolve().parent.parent / "reports"])
@@ -0,0 +1,99 @@
+"""
+Compares the one-pass assembly statistics in utils/assembly_stats.py with reading the whole megahit contig table,
+on large synthetic assemblies: time, peak memory, and that the statistics are the same.
+
+Run from the repository root (Linux, the peak memory is read from /proc):
+    python benchmarks/assembly_stats.py [number of contigs]
+"""
+import multiprocessing
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from utils import assembly_stats
+
+
+def synthetic_assembly(folder: Path, contigs: int) -> tuple[Path, Path]:
+    """
+    Writes a megahit contig csv and the same contigs as FASTA. Returns (csv, fasta)
+    """
+    rng = np.random.default_rng(0)
+    lengths = np.minimum(rng.lognormal(6.5, 0.8, contigs).astype(int) + 200, 200_000)
+    bases = np.array(list("ACGT"))
+    # the sequences repeat a random block, so writing them is fast
+    block = "".join(bases[rng.integers(0, 4, lengths.max())])
+    sequences = [block[: n] for n in lengths]
+
+    csv = folder / "contigs.csv"
+    pd.DataFrame({"name": [f"k141_{i}" for i in range(contigs)], "length": lengths, "sequence": sequences}).to_csv(
+        csv, index=False
+    )
+    fasta = folder / "contigs.fa"
+    with open(fasta, "w") as f:
+        for i, sequence in enumerate(sequences):
+            f.write(f">k141_{i} len={len(sequence)}\n{sequence}\n")
+    return csv, fasta
+
+
+def full_table(file: Path) -> pd.DataFrame:
+    # the statistics from the whole table in memory
+    contigs = pd.read_csv(file)
+    lengths = np.sort(contigs.length.to_numpy())[::-1]
+    cumulative = np.cumsum(lengths)
+    n50 = np.searchsorted(cumulative, cumulative[-1] / 2)
+    gc = assembly_stats.gc_bases(contigs.sequence).sum()
+    return pd.DataFrame(
+        {
+            "statistic": ["Contigs", "Total length (nt)", "Median length (nt)", "N50 (nt)", "L50", "GC content (%)"],
+            "value": [len(lengths), lengths.sum(), np.median(lengths), lengths[n50], n50 + 1,
+                      round(gc * 100 / contigs.sequence.str.len().sum(), 2)],
+        }
+    )
+
+
+def _run(queue, func, path):
+    start = time.perf_counter()
+    result = func(path)
+    seconds = time.perf_counter() - start
+    table = result if isinstance(result, pd.DataFrame) else result.table()
+    # peak RSS of the process (VmHWM, in kB), which unlike ru_maxrss does not include the parent before exec
+    with open("/proc/self/status") as f:
+        peak = next(int(line.split()[1]) for line in f if line.startswith("VmHWM"))
+    queue.put((table, seconds, peak / 1024))
+
+
+def measure(func, path):
+    # in a new process, so the peak memory is only that of the method
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(target=_run, args=(queue, func, path))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def main(contigs: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        csv, fasta = synthetic_assembly(Path(tmp), contigs)
+
+        full, full_time, full_peak = measure(full_table, csv)
+        print(f"{'method':<22}{'time (s)':>10}{'peak RSS (MB)':>15}{'same stats':>12}")
+        print(f"{'whole table':<22}{full_time:>10.2f}{full_peak:>15.1f}{'':>12}")
+        for name, func, path in [
+            ("one pass (csv)", assembly_stats.from_csv, csv),
+            ("one pass (fasta)", assembly_stats.from_fasta, fasta),
+        ]:
+            stats, seconds, peak = measure(func, path)
+            table = stats.set_index("statistic").loc[full.statistic, "value"]
+            same = "yes" if list(table) == list(full.value) else "NO"
+            print(f"{name:<22}{seconds:>10.2f}{peak:>15.1f}{same:>12}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
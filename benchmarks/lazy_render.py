@@ -0,0 +1,98 @@
+"""
+Writes a benchmark page comparing the html report with eager and viewport-lazy chart rendering.
+
+Run from the repository root:
+    python benchmarks/lazy_render.py <sample folder> <output folder> [contig rows]
+    python -m http.server --directory <output folder>
+
+and open http://localhost:8000/benchmark.html. The page loads both reports several times in an iframe and
+shows the time until the header is interactive (DOMContentLoaded), until the load event, and the time the
+main thread was blocked by long tasks during the first seconds.
+"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from report.html_report import load_report_data, render_html
+
+ROUNDS = 5
+
+BENCHMARK_PAGE = """<!DOCTYPE html>
+<html>
+    <head>
+        <title>Report rendering benchmark</title>
+        <style>
+            body { font-family: Arial, sans-serif; }
+            table { border-collapse: collapse; }
+            th, td { border: 1px solid #ccc; padding: 6px 12px; text-align: right; }
+            iframe { width: 1200px; height: 800px; border: 1px solid #ccc; }
+        </style>
+    </head>
+    <body>
+        <h1>Report rendering benchmark</h1>
+        <table id="results">
+            <tr><th>page</th><th>round</th><th>interactive (ms)</th><th>load (ms)</th><th>long tasks (ms)</th></tr>
+        </table>
+        <iframe id="frame"></iframe>
+        <script type="text/javascript">
+            const pages = ["eager.html", "lazy.html"];
+            const rounds = ROUNDS;
+            const settle = 3000;
+
+            function measure(page) {
+                return new Promise((resolve) => {
+                    const frame = document.getElementById("frame");
+                    frame.onload = () => {
+                        const win = frame.contentWindow;
+                        let blocked = 0;
+                        try {
+                            new win.PerformanceObserver((list) => {
+                                for (const entry of list.getEntries()) blocked += entry.duration;
+                            }).observe({ type: "longtask", buffered: true });
+                        } catch (e) {
+                            blocked = NaN;
+                        }
+                        setTimeout(() => {
+                            const nav = win.performance.getEntriesByType("navigation")[0];
+                            const interactive = win.performance.getEntriesByName("report-interactive")[0];
+                            resolve({
+                                interactive: interactive ? interactive.startTime : NaN,
+                                load: nav.loadEventStart,
+                                blocked: blocked,
+                            });
+                        }, settle);
+                    };
+                    frame.src = `${page}?${Math.random()}`;
+                });
+            }
+
+            (async () => {
+                const table = document.getElementById("results");
+                for (let round = 1; round <= rounds; round++) {
+                    for (const page of pages) {
+                        const result = await measure(page);
+                        const row = table.insertRow();
+                        row.innerHTML = `<td>${page}</td><td>${round}</td>
+                            <td>${result.interactive.toFixed(1)}</td><td>${result.load.toFixed(1)}</td>
+                            <td>${result.blocked.toFixed(1)}</td>`;
+                    }
+                }
+            })();
+        </script>
+    </body>
+</html>
+"""
+
+
+def main(sample: str, out_dir: str, contig_rows: int = 10000) -> None:
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    data = load_report_data(sample, contig_rows=contig_rows)
+    (out_dir / "eager.html").write_text(render_html(**data, lazy=False))
+    (out_dir / "lazy.html").write_text(render_html(**data, lazy=True))
+    (out_dir / "benchmark.html").write_text(BENCHMARK_PAGE.replace("ROUNDS", str(ROUNDS)))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1], sys.argv[2], *(int(x) for x in sys.argv[3:4]))
@@ -0,0 +1,126 @@
+"""
+Compares the read engines in utils/read_engine.py (pandas and the multithreaded arrow csv reader)
+on large synthetic inputs, and checks that the tables and the charts are identical with both engines.
+
+Run from the repository root (needs pyarrow):
+    python benchmarks/read_engines.py [number of rows]
+"""
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from plotting import bracken_raw, kaiju_megahit, kaiju_raw
+from schema_memory import synthetic_tables
+from utils import assembly_stats, cat_lineage, read_engine, schemas
+
+ENGINES = ["pandas", "arrow"]
+
+# {kind of table: chart built from it}
+CHARTS = {
+    "bracken_raw": lambda file: bracken_raw.bar_chart_bracken_raw(file, number=10, virus_only=False),
+    "kaiju_raw": kaiju_raw.bar_chart_kaiju_raw,
+    "kaiju_megahit": kaiju_megahit.bar_chart_kaiju_megahit,
+    # the assembly statistics are cached per file, so they are computed again for each engine
+    "megahit_contigs": lambda file: assembly_stats.from_csv(file).table(),
+}
+
+
+def synthetic_outputs(folder: Path, rows: int) -> dict[str, Path]:
+    """
+    Writes synthetic kaiju, CAT and megahit outputs. Returns {kind: path}
+    """
+    rng = np.random.default_rng(1)
+    taxonomy = np.array([f"cellular organisms;Bacteria;fam{i % 40};gen{i % 200};sp{i};" for i in range(1000)])
+    names = np.array([f"Virus species {i}" for i in range(500)])
+    tables = {}
+
+    # kaiju: classified contigs have 8 fields, unclassified 3
+    path = folder / "kaiju_megahit.out"
+    classified = rng.random(rows) < 0.4
+    taxa = rng.integers(0, len(taxonomy), rows)
+    with open(path, "w") as f:
+        for i in range(rows):
+            if classified[i]:
+                f.write(f"C\tk141_{i}\t{10000 + taxa[i]}\t1\t2\t3\t4\t{taxonomy[taxa[i]]}\n")
+            else:
+                f.write(f"U\tk141_{i}\t0\n")
+    tables["kaiju_megahit"] = path
+
+    # CAT: unclassified contigs have empty ranks
+    path = folder / "cat_megahit.txt"
+    header = ["# contig", "classification", "reason", "lineage", "lineage scores", *schemas.RANKS]
+    with open(path, "w") as f:
+        f.write("\t".join(header) + "\n")
+        for i in range(rows):
+            if not classified[i]:
+                f.write(f"k141_{i}\tno taxid assigned\tno ORFs found" + "\t" * 9 + "\n")
+                continue
+            species = names[taxa[i] % len(names)]
+            ranks = ["Viruses: 1.00", "no support" if i % 17 == 0 else "PhylumA: 1.00", "ClassA: 0.99",
+                     "OrderA: 0.98", f"Family{taxa[i] % 30}: 0.97", f"Genus{taxa[i] % 90}: 0.96", f"{species}: 0.9{i % 10}"]
+            f.write(f"k141_{i}\ttaxid assigned\tbased on 2/2 ORFs\t1;10239;{2000 + taxa[i]}\t1.00;1.00;0.9{i % 10}\t" + "\t".join(ranks) + "\n")
+    tables["cat_megahit"] = path
+
+    path = folder / "megahit_contigs.csv"
+    pd.DataFrame(
+        {
+            "name": [f"k141_{i}" for i in range(rows)],
+            "length": rng.integers(200, 20000, rows),
+            "sequence": "ACGT",
+        }
+    ).to_csv(path, index=False)
+    tables["megahit_contigs"] = path
+
+    return tables
+
+
+def main(rows: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        tables = {kind: path for kind, (path, _) in synthetic_tables(Path(tmp), rows).items()}
+        tables |= synthetic_outputs(Path(tmp), rows)
+
+        print(f"{'table':<20}{'pandas (s)':>12}{'arrow (s)':>11}{'speedup':>9}{'identical':>11}")
+        for kind, path in tables.items():
+            times, frames = {}, {}
+            for engine in ENGINES:
+                start = time.perf_counter()
+                frames[engine] = schemas.read_table(kind, path, engine=engine)
+                times[engine] = time.perf_counter() - start
+            try:
+                pd.testing.assert_frame_equal(frames["pandas"], frames["arrow"])
+                identical = "yes"
+            except AssertionError:
+                identical = "NO"
+            print(
+                f"{kind:<20}{times['pandas']:>12.2f}{times['arrow']:>11.2f}"
+                f"{times['pandas'] / times['arrow']:>8.1f}x{identical:>11}"
+            )
+
+        print(f"\n{'chart':<20}{'identical':>11}")
+        for kind, chart in CHARTS.items():
+            specs = []
+            for engine in ENGINES:
+                read_engine.set_engine(engine)
+                specs.append(chart(tables[kind]).to_json())
+            print(f"{kind:<20}{'yes' if specs[0] == specs[1] else 'NO':>11}")
+
+        # the CAT chart is built from the rank table
+        parsed = []
+        for engine in ENGINES:
+            read_engine.set_engine(engine)
+            parsed.append(cat_lineage.parse(tables["cat_megahit"]))
+        identical = all(
+            np.array_equal(getattr(parsed[0], x), getattr(parsed[1], x), equal_nan=x == "lineage_scores")
+            for x in ("contigs", "assigned", "lineage", "lineage_scores", "codes")
+        ) and all(np.array_equal(parsed[0].labels[x], parsed[1].labels[x]) for x in schemas.RANKS)
+        print(f"{'cat_megahit':<20}{'yes' if identical else 'NO':>11}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
@@ -0,0 +1,106 @@
+"""
+Compares the memory of the tables read with plain pd.read_csv and with the schemas in utils/schemas.py
+on large synthetic inputs.
+
+Run from the repository root:
+    python benchmarks/schema_memory.py [number of rows]
+"""
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from utils import schemas
+
+
+def synthetic_tables(folder: Path, rows: int) -> dict[str, tuple[Path, dict]]:
+    """
+    Writes synthetic tables with realistic repetition of the taxonomy strings.
+    Returns {kind: (path, keyword arguments for plain pd.read_csv)}
+    """
+    rng = np.random.default_rng(0)
+    taxa = np.array([f"Taxon name number {i}" for i in range(2000)])
+    genera = np.array([f"Genus {i}" for i in range(300)])
+    domains = np.array(["Virus", "Bacteria", "Eukaryota", "Archaea"])
+    levels = np.array(list("DPKOFGS"))
+    tables = {}
+
+    path = folder / "bracken_raw.csv"
+    pd.DataFrame(
+        {
+            "name": taxa[rng.integers(0, len(taxa), rows)],
+            "level": levels[rng.integers(0, len(levels), rows)],
+            "percent": rng.random(rows) / 10,
+            "domain": domains[rng.integers(0, len(domains), rows)],
+            "new_est_reads": rng.integers(0, 100000, rows),
+        }
+    ).to_csv(path, index=False)
+    tables["bracken_raw"] = (path, {})
+
+    path = folder / "kaiju_raw.csv"
+    ids = rng.integers(0, len(taxa), rows)
+    pd.DataFrame(
+        {
+            "taxon_id": ids,
+            "percent": (ids / len(taxa)).round(4),
+            "taxon_name": taxa[ids],
+            "reads": ids * 10,
+            "taxonomy": genera[ids % len(genera)],
+        }
+    ).to_csv(path, index=False)
+    tables["kaiju_raw"] = (path, {})
+
+    path = folder / "contig_coverage.csv"
+    pd.DataFrame(
+        {
+            "contig": [f"k141_{i // 5000}" for i in range(rows)],
+            "position": np.arange(rows) % 5000 + 1,
+            "coverage": rng.integers(0, 500, rows),
+            "length": np.full(rows, 5000),
+        }
+    ).to_csv(path, index=False)
+    tables["contig_coverage"] = (path, {})
+
+    path = folder / "cat_kaiju_merged.csv"
+    pd.DataFrame(
+        {
+            "name": [f"k141_{i}" for i in range(rows)],
+            "taxon_id": ids,
+            "length": rng.integers(200, 20000, rows),
+            "last_level_kaiju": taxa[ids],
+            "last_level_cat": taxa[(ids + 1) % len(taxa)],
+        }
+    ).to_csv(path, index=False)
+    tables["cat_kaiju_merged"] = (path, {})
+
+    return tables
+
+
+def main(rows: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        tables = synthetic_tables(Path(tmp), rows)
+
+        print(f"{'table':<20}{'plain (MB)':>12}{'schema (MB)':>13}{'reduction':>11}{'plain (s)':>11}{'schema (s)':>12}")
+        for kind, (path, options) in tables.items():
+            start = time.perf_counter()
+            plain = pd.read_csv(path, **options)
+            plain_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            typed = schemas.read_table(kind, path)
+            typed_time = time.perf_counter() - start
+
+            plain_mb = plain.memory_usage(deep=True).sum() / 1024**2
+            typed_mb = typed.memory_usage(deep=True).sum() / 1024**2
+            print(
+                f"{kind:<20}{plain_mb:>12.1f}{typed_mb:>13.1f}{plain_mb / typed_mb:>10.1f}x"
+                f"{plain_time:>11.2f}{typed_time:>12.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
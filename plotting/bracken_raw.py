@@ -1,5 +1,6 @@
 import pandas as pd
 import altair as alt
+from utils import schemas
 
 alt.data_transformers.disable_max_rows()
 
@@ -29,7 +30,7 @@ def df_bracken_species_raw(
     }
 
     df = (
-        pd.read_csv(file)
+        schemas.read_table("bracken_raw", file)
         .loc[lambda x: x.level == taxonomy[level]]
         .loc[lambda x: x.percent > cutoff]
         .sort_values("percent", ascending=False)
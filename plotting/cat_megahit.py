@@ -1,6 +1,7 @@
 import pandas as pd
 import altair as alt
 import numpy as np
+from utils import cat_lineage
 
 alt.data_transformers.disable_max_rows()
 
@@ -12,25 +13,14 @@ def bar_chart_cat_megahit(file: str) -> alt.vegalite.v4.api.Chart:
     :param str file: Path to the CAT file made on megahit contigs.
     :return: Altair bar chart
     """
-    cat_raw = pd.read_csv(file, sep="\t")
+    table = cat_lineage.rank_table(file)
 
-    cat = (
-        cat_raw.rename(
-            columns={
-                "# contig": "name",
-                "species": "last_level_cat",
-                "genus": "second_level_cat",
-                "family": "third_level_cat",
-            }
-        )
-        .loc[lambda x: x.classification != "no taxid assigned"]
-        .loc[lambda x: x["superkingdom"] != "no support"]
-        .loc[lambda x: x["phylum"] != "no support"]
-    )
-    
-    # If all reads are filtered out, shape[0] == 0
+    # Contigs with a taxid assigned and support at superkingdom and phylum
+    classified = table.mask(supported=["superkingdom", "phylum"])
+
+    # If all reads are filtered out, classified.sum() == 0
     # Return mock fiugre
-    if cat.shape[0] == 0:
+    if not classified.any():
         return (
             alt.Chart(pd.DataFrame({"name": ["No contigs were found"]}))
             .mark_text()
@@ -39,13 +29,14 @@ def bar_chart_cat_megahit(file: str) -> alt.vegalite.v4.api.Chart:
             )
             .properties(width="container", height="container")
         )
-    
-    cat = (
-        cat
-        .drop(columns=["classification", "lineage", "lineage scores"])
-        .assign(kingdom_cat=lambda x: x["superkingdom"].str[:-6])
-        .drop(columns="superkingdom")
-        .loc[lambda x: x.last_level_cat != "no support"]
+
+    cat = table.view(
+        {
+            "family": "third_level_cat",
+            "genus": "second_level_cat",
+            "species": "last_level_cat",
+        },
+        mask=classified & table.supported("species"),
     )
 
     return (
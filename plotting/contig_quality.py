@@ -1,6 +1,7 @@
 import pandas as pd
 import altair as alt
 import numpy as np
+from utils import assembly_stats, schemas
 
 alt.data_transformers.disable_max_rows()
 
@@ -8,17 +9,39 @@ alt.data_transformers.disable_max_rows()
 def megahit_contig_histogram(file: str) -> alt.vegalite.v4.api.Chart:
     """
     Plots histogram of the contigs from the megahit assembled contigs.
-    :param str file: Path to the csv file for the megahit contigs.
+    The bins are counted in one pass over the contigs (see utils/assembly_stats.py), not in the browser.
+    :param str file: Path to the csv (or FASTA) file for the megahit contigs.
     :return: Altair histogram
     """
-    contigs = pd.read_csv(file)
+    bins = assembly_stats.assembly_stats(file).histogram(step=500)
 
     return (
-        alt.Chart(contigs, title="Megahit contigs size")
+        alt.Chart(bins, title="Megahit contigs size")
         .mark_bar()
         .encode(
-            alt.X("length:Q", bin=alt.Bin(step=500), title="Length (nt)"),
-            alt.Y("count(length):Q", title="Number of contigs"),
+            alt.X("start:Q", bin="binned", title="Length (nt)"),
+            alt.X2("end:Q"),
+            alt.Y("count:Q", title="Number of contigs"),
+        )
+        .properties(width="container", height="container")
+    )
+
+
+def gc_content_histogram(file: str) -> alt.vegalite.v4.api.Chart:
+    """
+    Plots histogram of the GC content of the contigs from the megahit assembled contigs.
+    The contigs are counted per GC percent in one pass over their sequences (see utils/assembly_stats.py).
+    :param str file: Path to the csv (with the sequences) or FASTA file for the megahit contigs.
+    :return: Altair histogram
+    """
+    gc = assembly_stats.assembly_stats(file).gc_histogram()
+
+    return (
+        alt.Chart(gc, title="GC content of megahit contigs")
+        .mark_bar()
+        .encode(
+            alt.X("gc:Q", title="GC content (%)", scale=alt.Scale(domain=[0, 100])),
+            alt.Y("count:Q", title="Number of contigs"),
         )
         .properties(width="container", height="container")
     )
@@ -27,33 +50,157 @@ def megahit_contig_histogram(file: str) -> alt.vegalite.v4.api.Chart:
 def megahit_contig_boxplot(file: str) -> alt.vegalite.v4.api.Chart:
     """
     Returns boxplot of the contigs from the megahit assembled contigs.
-    :param str file: Path to the csv file for the megahit contigs.
+    The quartiles are computed in one pass over the contigs (see utils/assembly_stats.py), not in the browser.
+    :param str file: Path to the csv (or FASTA) file for the megahit contigs.
     :return: Altair boxplot
     """
-    contigs = pd.read_csv(file).assign(group="group1")
+    stats = assembly_stats.assembly_stats(file)
+    quartiles = pd.DataFrame(
+        {
+            "group": ["group1"],
+            **{name: [stats.quantile(q)] for name, q in [("min", 0), ("q1", 0.25), ("median", 0.5), ("q3", 0.75), ("max", 1)]},
+        }
+    )
+
+    base = alt.Chart(quartiles, title="Boxplot of contigs in Megahit").encode(
+        alt.X("group:N", axis=alt.Axis(labels=False, title="Contigs", ticks=False))
+    )
+    whiskers = base.mark_rule().encode(alt.Y("min:Q", title="Length (nt)"), alt.Y2("max:Q"))
+    box = base.mark_bar(size=14).encode(alt.Y("q1:Q"), alt.Y2("q3:Q"))
+    median = base.mark_tick(color="white", size=14).encode(alt.Y("median:Q"))
+
+    return alt.layer(whiskers, box, median).properties(width=500, height=500)
+
+
+def assembly_stats_table(file: str) -> pd.DataFrame:
+    """
+    Returns the statistics of the megahit assembly: number of contigs, total length, N50/L50, N90/L90,
+    GC content and the contigs above the length thresholds.
+    :param str file: Path to the csv (or FASTA) file for the megahit contigs.
+    :return: pd.DataFrame with statistic and value
+    """
+    return assembly_stats.assembly_stats(file).table()
 
-    return (
-        alt.Chart(contigs, title="Boxplot of contigs in Megahit")
-        .mark_boxplot(extent="min-max")
-        .encode(
-            alt.X("group:N", axis=alt.Axis(labels=False, title="Contigs", ticks=False)),
-            alt.Y("length:Q", title="Length (nt)"),
+
+def lttb(x: np.ndarray, y: np.ndarray, points: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets downsampling.
+    Returns the indices of the `points` samples that best keep the visual shape of the line.
+    :param np.ndarray x: Sorted x values.
+    :param np.ndarray y: y values.
+    :param int points: Number of points to keep.
+    :returns: np.ndarray with the indices of the kept points.
+    """
+    n = len(x)
+    if points >= n or points < 3:
+        return np.arange(n)
+
+    # first and last point are always kept, the rest is split into points - 2 buckets
+    edges = np.linspace(1, n - 1, points - 1).astype(int)
+    keep = np.zeros(points, dtype=int)
+    keep[-1] = n - 1
+
+    for i in range(points - 2):
+        start, end = edges[i], edges[i + 1]
+        # average point of the next bucket (the last point for the last bucket)
+        if i + 2 < len(edges):
+            next_x = x[end:edges[i + 2]].mean()
+            next_y = y[end:edges[i + 2]].mean()
+        else:
+            next_x, next_y = x[-1], y[-1]
+        prev_x, prev_y = x[keep[i]], y[keep[i]]
+        area = np.abs(
+            (prev_x - next_x) * (y[start:end] - prev_y)
+            - (prev_x - x[start:end]) * (next_y - prev_y)
+        )
+        keep[i + 1] = start + area.argmax()
+
+    return keep
+
+
+def binned_coverage(
+    file: str, points: int = 500, method: str = "minmax", chunksize: int = 1_000_000
+) -> pd.DataFrame:
+    """
+    Streams the coverage csv (contig, position, coverage, length) and summarises the coverage of every contig
+    in at most `points` windows, so the size of the result does not depend on the length of the contigs.
+    :params str file: Path to the samtools mpileup file in the cleaned_files folder.
+    :params int points: Maximum number of points per contig. Default = 500
+    :params str method: "minmax": min, mean and max coverage per window.
+                        "lttb": Largest-Triangle-Three-Buckets on the mean of 4 * points windows. Default = "minmax"
+    :params int chunksize: Number of rows read at a time. Default = 1 000 000
+    :returns: pd.DataFrame with contig, length, position, coverage (mean), min and max.
+    """
+    windows = points * 4 if method == "lttb" else points
+    partials = []
+
+    for chunk in schemas.read_table(
+        "contig_coverage", file, usecols=["contig", "position", "coverage", "length"], chunksize=chunksize
+    ):
+        # rows without a position or length can not be placed in a window
+        chunk = chunk.dropna(subset=["position", "length"])
+        width = np.maximum(1, np.ceil(chunk.length.to_numpy("int64") / windows)).astype(int)
+        chunk = chunk.assign(window=(chunk.position.to_numpy("int64") - 1) // width)
+        partials.append(
+            chunk.groupby(["contig", "window"], as_index=False, observed=True).agg(
+                length=("length", "first"),
+                start=("position", "min"),
+                end=("position", "max"),
+                min=("coverage", "min"),
+                max=("coverage", "max"),
+                sum=("coverage", "sum"),
+                count=("coverage", "count"),
+            )
+        )
+
+    if not partials:
+        return pd.DataFrame(columns=["contig", "length", "position", "coverage", "min", "max"])
+
+    # windows can be split over two chunks
+    binned = (
+        pd.concat(partials)
+        .groupby(["contig", "window"], as_index=False, observed=True)
+        .agg(
+            length=("length", "first"),
+            start=("start", "min"),
+            end=("end", "max"),
+            min=("min", "min"),
+            max=("max", "max"),
+            sum=("sum", "sum"),
+            count=("count", "sum"),
         )
-        .properties(width=500, height=500)
+        .assign(
+            position=lambda x: (x.start + x.end) / 2,
+            coverage=lambda x: x["sum"] / x["count"],
+        )
+        [["contig", "length", "position", "coverage", "min", "max"]]
     )
 
+    if method == "lttb":
+        binned = binned.groupby("contig", group_keys=False, observed=True).apply(
+            lambda x: x.iloc[lttb(x.position.to_numpy(), x.coverage.to_numpy(), points)]
+        )
+
+    return binned.reset_index(drop=True)
 
-def megahit_contig_coverage_facet(file: str) -> list[alt.vegalite.v4.api.Chart]:
+
+def megahit_contig_coverage_facet(
+    file: str, points: int = 500, method: str = "minmax"
+) -> list[alt.vegalite.v4.api.Chart]:
     """
     Returns a list of plots for every contig in the csv file generated from samtools mpileup and the
     wrangle_contig_info.py script.
+    The coverage is downsampled with `binned_coverage`: the line is the mean coverage and the band the
+    min and max coverage of each window.
     :params str file: Path to the samtools mpileup file in the cleaned_files folder.
+    :params int points: Maximum number of points per contig. Default = 500
+    :params str method: Downsampling method, "minmax" or "lttb". Default = "minmax"
     :returns: List of altair facet wrap with plots in the categories: short, medium and long.
     """
     plots = []
 
     contigs_coverage = (
-        pd.read_csv(file)
+        binned_coverage(file, points=points, method=method)
         .assign(
             category=lambda x: pd.cut(
                 x.length,
@@ -72,18 +219,32 @@ def megahit_contig_coverage_facet(file: str) -> list[alt.vegalite.v4.api.Chart]:
 
     for contig in ["short", "medium", "long"]:
 
-        base = (
-            alt.Chart(contigs_coverage.loc[lambda x, contig=contig: x.category == contig])
+        x = alt.X(
+            "position:Q",
+            axis=alt.Axis(values=np.arange(0, 20000, step_size[contig])),
+        )
+
+        band = (
+            alt.Chart()
+            .mark_area(color=colors[contig], opacity=0.3)
+            .encode(x, alt.Y("min:Q", title="coverage"), alt.Y2("max:Q"))
+            .properties(width=300, height=300)
+        )
+
+        line = (
+            alt.Chart()
             .mark_line(color=colors[contig])
-            .encode(
-                alt.X(
-                    "position:N",
-                    axis=alt.Axis(values=np.arange(0, 20000, step_size[contig])),
-                ),
-                alt.Y("coverage:Q"),
-                alt.Facet("contig:N"),
+            .encode(x, alt.Y("coverage:Q"))
+            .properties(width=300, height=300)
+        )
+
+        base = (
+            alt.layer(
+                band,
+                line,
+                data=contigs_coverage.loc[lambda x, contig=contig: x.category == contig],
             )
-            .properties(width=300, height=300, title=f"Coverage of {contig} contigs")
+            .facet("contig:N", title=f"Coverage of {contig} contigs")
             .resolve_scale(y="independent", x="independent")
         )
 
@@ -1,6 +1,7 @@
 import pandas as pd
 import altair as alt
 import numpy as np
+from utils import schemas
 
 alt.data_transformers.disable_max_rows()
 
@@ -13,13 +14,7 @@ def bar_chart_kaiju_megahit(file: str) -> alt.vegalite.v4.api.Chart:
     :return: Altair bar chart
     """
 
-    kaiju_raw = pd.read_csv(
-        file,
-        sep="\t",
-        header=None,
-        usecols=[1, 2, 7],
-        names=["name", "taxon_id", "taxonomy"],
-    )
+    kaiju_raw = schemas.read_table("kaiju_megahit", file)
 
     kaiju = (
         kaiju_raw.dropna()
@@ -1,5 +1,6 @@
 import pandas as pd
 import altair as alt
+from utils import schemas
 
 alt.data_transformers.disable_max_rows()
 
@@ -16,16 +17,33 @@ def bar_chart_kaiju_raw(
     :return: altair.vegalite.v4.api.Chart
     """
 
+    keys = ["taxon_id", "percent", "taxon_name", "reads"]
+    kaiju = schemas.read_table("kaiju_raw", file)
+
+    # The cutoff and the top taxa are selected on the unique taxa first.
+    # The unique taxa are sorted on the keys before sorting on percent, so ties end up in the same order
+    # as they would after a groupby on the keys.
     df = (
-        pd.read_csv(file)
-        .groupby(["taxon_id", "percent", "taxon_name", "reads"], as_index=False)
-        .agg(taxonomy=("taxonomy", list))
+        kaiju[keys]
+        .dropna()
+        .drop_duplicates()
+        .sort_values(keys)
+        .reset_index(drop=True)
         .sort_values("percent", ascending=False)
         .loc[lambda x: x.percent > cutoff]
+        .head(number)
+    )
+
+    # The taxonomy of the taxa is only collected for the taxa that are plotted
+    taxonomy = (
+        kaiju.loc[lambda x: x.taxon_id.isin(df.taxon_id)]
+        .groupby(keys, observed=True)["taxonomy"]
+        .agg(list)
     )
+    df = df.join(taxonomy, on=keys)
 
     return (
-        alt.Chart(df.head(number))
+        alt.Chart(df)
         .mark_bar()
         .encode(
             alt.X("percent:Q", 
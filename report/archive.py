@@ -0,0 +1,568 @@
+import fcntl
+import functools
+import hashlib
+import html
+import json
+import mimetypes
+import os
+import re
+import struct
+import threading
+import time
+import zlib
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, quote, unquote, urlsplit
+
+from utils import atomic_write
+
+# Layout of the pack file:
+#   MAGIC
+#   one segment per add:
+#     records: the compressed dictionary (if a new one is built), the new chunks and the chunk list of each report
+#     chunk table: zlib compressed json with the chunks the segment added
+#     segment table: zlib compressed json with the reports the segment added (see Archive)
+#     footer: FOOTER_MAGIC, offset and length of the segment table
+# Each segment table points to the one before it, so adding reports only appends what they add, and the old
+# segments stay valid until the new footer is written.
+MAGIC = b"VHPACK2\n"
+FOOTER = struct.Struct(">8sQQ")
+FOOTER_MAGIC = b"VHINDEX2"
+
+# The index of the archive is kept next to the pack file (<pack>.index, zlib compressed json): the versions of every
+# report and the stored chunks, as of the segment table in its "head". It is only a cache, written after every add;
+# if it is missing or of another segment, the segments it does not have are read and added to it.
+INDEX_SUFFIX = ".index"
+
+
+# The reports are cut into chunks after a newline, "}," or ">" (so the json of the Panel reports, which is one
+# line, is cut too) when the crc32 of the piece since the previous such boundary ends with CHUNK_BITS zero bits.
+# The cuts only depend on the content around them, so the CSS, scripts and explanations that every report
+# repeats are cut into the same chunks, and stored once.
+BOUNDARY = re.compile(rb"\n|\},|>")
+CHUNK_BITS = 6
+MIN_CHUNK = 512
+MAX_CHUNK = 64 * 1024
+
+# zlib uses at most 32 KB of preset dictionary. It is built from up to DICTIONARY_REPORTS of the reports added.
+DICTIONARY_SIZE = 32 * 1024
+DICTIONARY_REPORTS = 16
+
+
+def split_chunks(
+    data: bytes, bits: int = CHUNK_BITS, min_size: int = MIN_CHUNK, max_size: int = MAX_CHUNK
+) -> list[bytes]:
+    """
+    Cuts the data into content defined chunks of min_size to max_size bytes.
+    """
+    mask = (1 << bits) - 1
+    chunks = []
+    start = piece = 0
+    for boundary in BOUNDARY.finditer(data):
+        end = boundary.end()
+        while end - start > max_size:
+            chunks.append(data[start : start + max_size])
+            start += max_size
+            piece = max(piece, start)
+        if end - start >= min_size and zlib.crc32(data[piece:end]) & mask == 0:
+            chunks.append(data[start:end])
+            start = end
+        piece = end
+    for offset in range(start, len(data), max_size):
+        chunks.append(data[offset : offset + max_size])
+    return chunks
+
+
+def file_sha256(file: str) -> str:
+    sha = hashlib.sha256()
+    with open(file, "rb") as f:
+        for block in iter(lambda: f.read(1024**2), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def chunk_digest(chunk: bytes) -> str:
+    return hashlib.blake2b(chunk, digest_size=16).hexdigest()
+
+
+def build_dictionary(reports: list[list[bytes]]) -> bytes:
+    """
+    Returns a preset dictionary for the chunks of reports like these (each a list of chunks): the chunks that are
+    in more than one report, the most common last (closest to the data), filled up with the start of each
+    report. Chunks compressed with it mostly store what differs between the reports.
+    """
+    counts = Counter(chunk for chunks in reports for chunk in set(chunks))
+    shared = [chunk for chunk, count in sorted(counts.items(), key=lambda x: x[1]) if count > 1]
+    dictionary = b"".join(shared)[-DICTIONARY_SIZE:]
+    if len(dictionary) < DICTIONARY_SIZE and reports:
+        fill = (DICTIONARY_SIZE - len(dictionary)) // len(reports)
+        dictionary = b"".join(b"".join(chunks)[:fill] for chunks in reports) + dictionary
+    return dictionary
+
+
+def compress(data: bytes, dictionary: bytes = None) -> bytes:
+    # raw deflate: the chunks are checked with their digest
+    options = {"zdict": dictionary} if dictionary else {}
+    compressor = zlib.compressobj(9, zlib.DEFLATED, -15, **options)
+    return compressor.compress(data) + compressor.flush()
+
+
+def decompress(data: bytes, dictionary: bytes = None) -> bytes:
+    decompressor = zlib.decompressobj(-15, **({"zdict": dictionary} if dictionary else {}))
+    return decompressor.decompress(data) + decompressor.flush()
+
+
+def _rfind(f, pattern: bytes, end: int, block: int = 1024**2) -> int:
+    # Returns the position of the last `pattern` before `end` in the file, or -1.
+    while end > 0:
+        start = max(end - block, 0)
+        f.seek(start)
+        found = f.read(end - start).rfind(pattern)
+        if found >= 0:
+            return start + found
+        if start == 0:
+            break
+        end = start + len(pattern) - 1
+    return -1
+
+
+def _read_record(f, offset: int, length: int) -> bytes:
+    f.seek(offset)
+    return f.read(length)
+
+
+def _read_json(f, offset: int, length: int):
+    return json.loads(zlib.decompress(_read_record(f, offset, length)))
+
+
+def _write_json(f, value) -> list[int]:
+    # Appends zlib compressed json and returns [offset, length] of the record.
+    record = zlib.compress(json.dumps(value, separators=(",", ":")).encode())
+    offset = f.tell()
+    f.write(record)
+    return [offset, len(record)]
+
+
+def index_path(pack: str) -> Path:
+    return Path(f"{pack}{INDEX_SUFFIX}")
+
+
+def _empty_index() -> dict:
+    return {"head": None, "reports": {}, "chunks": {}}
+
+
+def _load_index(pack: str, head: list) -> dict:
+    # Returns the index next to the pack file if it is of the segment `head`, otherwise None.
+    try:
+        index = json.loads(zlib.decompress(index_path(pack).read_bytes()))
+    except (FileNotFoundError, zlib.error, ValueError):
+        return None
+    return index if index.get("head") == head else None
+
+
+def _save_index(pack: str, index: dict) -> None:
+    atomic_write.write_atomic(index_path(pack), zlib.compress(json.dumps(index, separators=(",", ":")).encode()))
+
+
+def _update_index(index: dict, head: list, read_json, chunks: bool = True) -> dict:
+    # Returns the index ({"head": [offset, length] of its last segment table, "reports": {name: versions, the oldest
+    # first}, "chunks": {digest: [offset, length, dictionary offset, dictionary length, crc32]}}) with the segments
+    # after its head up to `head`, read with `read_json(offset, length)`. The chunks are left out without `chunks`.
+    tables, pointer = [], head
+    while pointer is not None and pointer != index["head"]:
+        tables.append(read_json(*pointer))
+        pointer = tables[-1]["previous"]
+    if pointer is None and index["head"] is not None:
+        # the head of the index is not in the archive (the pack file was replaced)
+        return _update_index(_empty_index(), head, read_json, chunks)
+
+    # a new index, so readers of the old one are not affected
+    reports = {name: list(versions) for name, versions in index["reports"].items()}
+    stored = dict(index["chunks"]) if chunks else {}
+    for table in reversed(tables):
+        for name, entry in table["reports"].items():
+            reports.setdefault(name, []).append(entry)
+        if chunks:
+            for digest, *chunk in read_json(*table["chunks"]):
+                stored[digest] = chunk
+    return {"head": head, "reports": reports, "chunks": stored}
+
+
+def _read_head(f, size: int) -> tuple[list, dict]:
+    # Returns [offset, length] and the segment table of the last segment, or (None, None) if the archive is empty.
+    # If an add was interrupted, the file ends with records without a footer and the last complete footer
+    # before them is used.
+    if size == 0:
+        return None, None
+    if _read_record(f, 0, len(MAGIC)) != MAGIC:
+        raise ValueError(f"{f.name} is not a report archive")
+
+    end = size
+    while end >= len(MAGIC) + FOOTER.size:
+        magic, offset, length = FOOTER.unpack(_read_record(f, end - FOOTER.size, FOOTER.size))
+        if magic == FOOTER_MAGIC and len(MAGIC) <= offset and offset + length == end - FOOTER.size:
+            try:
+                return [offset, length], _read_json(f, offset, length)
+            except (zlib.error, ValueError):
+                pass
+        found = _rfind(f, FOOTER_MAGIC, end - FOOTER.size)
+        if found < 0:
+            break
+        end = found + FOOTER.size
+    return None, None
+
+
+class Archive:
+    """
+    Reader of a report archive: one pack file with the reports cut into content addressed chunks, compressed
+    with a preset dictionary, so the parts that the reports share are stored once.
+    The versions of the reports are kept in an index, loaded from the file next to the pack (see INDEX_SUFFIX) or,
+    for the segments it does not have, from their segment tables, so a report is found with one lookup whatever
+    its age. The chunk list of a report is read with the report, and the report from the offsets of its chunks.
+
+    A segment table is {"previous": [offset, length] of the previous segment table or null,
+                        "dictionary": [offset, length] of the dictionary the new chunks are compressed with,
+                        "chunks": [offset, length] of the chunk table,
+                        "reports": {name: {"entry": [offset, length], "size": int, "sha256": str, "added": float}}}
+    with one version of each report the add changed. The chunk table is [[digest, offset, length, dictionary offset,
+    dictionary length, crc32]] and the entry of a report is {"dictionaries": [[offset, length]],
+    "chunks": [[offset, length, dictionary number, crc32]]}.
+    """
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._stat = None
+        self._fd = None
+        self._head = None
+        # {offset: segment table}; segments are never changed, so the tables read stay valid when reports are added
+        self._tables = {}
+        # the index without the chunks, which are only needed to add reports
+        self._index = _empty_index()
+        # the chunks shared by the reports stay in memory
+        self.dictionary = functools.lru_cache(maxsize=16)(self._dictionary)
+        self.chunk = functools.lru_cache(maxsize=1024)(self._chunk)
+        self.refresh()
+
+    def refresh(self) -> None:
+        """
+        Finds the last segment again if the pack file changed (reports were added), and adds the new segments
+        to the index.
+        """
+        with self._lock:
+            stat = os.stat(self.path)
+            if self._stat == (stat.st_size, stat.st_mtime_ns):
+                return
+            with open(self.path, "rb") as f:
+                head, table = _read_head(f, stat.st_size)
+            if head is not None:
+                self._tables[head[0]] = table
+            if self._fd is None:
+                self._fd = os.open(self.path, os.O_RDONLY)
+            if head != self._index["head"]:
+                index = _load_index(self.path, head)
+                if index is None:
+                    index = _update_index(self._index, head, self._segment, chunks=False)
+                self._index = {**index, "chunks": {}}
+            self._head = head
+            self._stat = (stat.st_size, stat.st_mtime_ns)
+
+    def close(self) -> None:
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _read_json(self, offset: int, length: int):
+        return json.loads(zlib.decompress(os.pread(self._fd, length, offset)))
+
+    def _segment(self, offset: int, length: int) -> dict:
+        if offset not in self._tables:
+            self._tables[offset] = self._read_json(offset, length)
+        return self._tables[offset]
+
+    def segments(self):
+        """
+        Yields the segment tables, the newest first.
+        """
+        pointer = self._head
+        while pointer is not None:
+            table = self._segment(*pointer)
+            yield table
+            pointer = table["previous"]
+
+    def reports(self) -> dict[str, list[dict]]:
+        """
+        Returns {name: versions of the report, the oldest first}.
+        """
+        reports = self._index["reports"]
+        return {name: list(reports[name]) for name in sorted(reports)}
+
+    def names(self) -> list[str]:
+        return sorted(self._index["reports"])
+
+    def versions(self, name: str) -> list[dict]:
+        """
+        Returns the versions of a report, the oldest first. Raises KeyError if it is not in the archive.
+        """
+        return list(self._index["reports"][name])
+
+    def latest(self, name: str) -> dict:
+        """
+        Returns the latest version of a report. Raises KeyError if it is not in the archive.
+        """
+        return self._index["reports"][name][-1]
+
+    def _dictionary(self, offset: int, length: int) -> bytes:
+        return decompress(os.pread(self._fd, length, offset))
+
+    def _chunk(self, offset: int, length: int, dictionary: tuple, crc: int) -> bytes:
+        # a chunk, checked against its crc32
+        chunk = decompress(os.pread(self._fd, length, offset), self.dictionary(*dictionary))
+        if zlib.crc32(chunk) != crc:
+            raise ValueError(f"The chunk at {offset} of {self.path} is corrupt")
+        return chunk
+
+    def read(self, name: str, version: int = -1) -> bytes:
+        """
+        Returns a report, by default its latest version.
+        """
+        entry = self.latest(name) if version == -1 else self.versions(name)[version]
+        chunks = self._read_json(*entry["entry"])
+        dictionaries = [tuple(x) for x in chunks["dictionaries"]]
+        return b"".join(
+            self.chunk(offset, length, dictionaries[dictionary], crc) for offset, length, dictionary, crc in chunks["chunks"]
+        )
+
+    def extract(self, name: str, out_dir: str, version: int = -1) -> Path:
+        """
+        Writes a report (atomically) to <out_dir>/<name> and returns its path.
+        """
+        output = Path(out_dir) / name
+        output.parent.mkdir(parents=True, exist_ok=True)
+        atomic_write.write_atomic(output, self.read(name, version))
+        return output
+
+    def stats(self) -> dict:
+        """
+        Returns the number of reports, versions, segments and chunks, the total size of the reports and the size
+        of the pack file.
+        """
+        tables = list(self.segments())
+        versions = [entry for table in tables for entry in table["reports"].values()]
+        return {
+            "reports": len({name for table in tables for name in table["reports"]}),
+            "versions": len(versions),
+            "segments": len(tables),
+            "chunks": sum(len(self._read_json(*table["chunks"])) for table in tables),
+            "report_bytes": sum(x["size"] for x in versions),
+            "pack_bytes": self.path.stat().st_size,
+        }
+
+
+def run_names(out_dir: str, names: list, run: str = None) -> dict[str, Path]:
+    """
+    Returns {<run>/<name>: path} of the reports a run wrote to `out_dir`, so that the reports of different runs
+    are not stored as versions of each other. The run is named after the output folder by default.
+    Reports that are not written (yet) are left out.
+    """
+    out_dir = Path(out_dir)
+    run = run or out_dir.resolve().name
+    return {f"{run}/{name}": out_dir / name for name in names if (out_dir / name).exists()}
+
+
+def report_files(paths: list) -> dict[str, Path]:
+    """
+    Returns {name: path} of report files, and of all files in report folders, named by the folder and their path
+    relative to it (e.g. <folder>/index.html and <folder>/data/<sample>.json.gz of a report set).
+    """
+    files = {}
+    for path in map(Path, paths):
+        if path.is_dir():
+            folder = path.resolve().name
+            files |= {f"{folder}/{x.relative_to(path).as_posix()}": x for x in sorted(path.rglob("*")) if x.is_file()}
+        else:
+            files[path.name] = path
+    return files
+
+
+def add(pack: str, files: dict, new_dictionary: bool = False) -> dict:
+    """
+    Adds reports to the archive (created if it does not exist). A report that is already in the archive
+    is added as a new version, unless it did not change. Each add appends one segment with only what it adds,
+    so adding many reports at once or one at a time takes about the same space, and updates the index next to the
+    pack file, so the next add does not read the segments again.
+    Processes adding to the same archive wait for each other (file lock).
+
+    :param str pack: Path to the pack file.
+    :param dict files: {name: path} of the reports (or any other files, e.g. the bundles of a report set).
+    :param bool new_dictionary: Compress the new chunks with a new dictionary built from the first of these
+                                reports, e.g. after the layout of the reports changed.
+                                Default = False (only the first add builds one)
+    :return: dict with {name: "added" | "updated" | "unchanged"}
+    """
+    fd = os.open(pack, os.O_RDWR | os.O_CREAT, 0o644)
+    with open(fd, "r+b") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        size = f.seek(0, os.SEEK_END)
+        head, table = _read_head(f, size)
+        if size == 0:
+            f.write(MAGIC)
+
+        # the versions of every report and {digest: chunk} of the stored chunks
+        index = _load_index(pack, head)
+        if index is None:
+            index = _update_index(_empty_index(), head, lambda offset, length: _read_json(f, offset, length))
+            _save_index(pack, index)
+        versions, stored = index["reports"], index["chunks"]
+
+        status, pending = {}, []
+        for name, file in files.items():
+            file = Path(file)
+            sha = file_sha256(file)
+            if name in versions and versions[name][-1]["sha256"] == sha:
+                status[name] = "unchanged"
+                continue
+            status[name] = "updated" if name in versions else "added"
+            pending.append((name, file, sha))
+        if not pending:
+            return status
+
+        # new records are appended after everything, also after the records of an interrupted add
+        f.seek(0, os.SEEK_END)
+        if new_dictionary or table is None:
+            # spread over the reports, e.g. both the html and the Panel reports of a run
+            step = -(-len(pending) // DICTIONARY_REPORTS)
+            samples = [split_chunks(file.read_bytes()) for _, file, _ in pending[::step]]
+            dictionary = build_dictionary(samples)
+            record = compress(dictionary)
+            dictionary_record = [f.tell(), len(record)]
+            f.write(record)
+        else:
+            dictionary_record = table["dictionary"]
+            dictionary = decompress(_read_record(f, *dictionary_record))
+            f.seek(0, os.SEEK_END)
+
+        new_chunks, reports = [], {}
+        for name, file, sha in pending:
+            data = file.read_bytes()
+            dictionaries, chunks = [], []
+            for chunk in split_chunks(data):
+                digest = chunk_digest(chunk)
+                if digest not in stored:
+                    record = compress(chunk, dictionary)
+                    stored[digest] = [f.tell(), len(record), *dictionary_record, zlib.crc32(chunk)]
+                    new_chunks.append([digest, *stored[digest]])
+                    f.write(record)
+                offset, length, *chunk_dictionary, crc = stored[digest]
+                if chunk_dictionary not in dictionaries:
+                    dictionaries.append(chunk_dictionary)
+                chunks.append([offset, length, dictionaries.index(chunk_dictionary), crc])
+            reports[name] = {
+                "entry": _write_json(f, {"dictionaries": dictionaries, "chunks": chunks}),
+                "size": len(data),
+                "sha256": sha,
+                "added": round(time.time(), 3),
+            }
+
+        segment = {"previous": head, "dictionary": dictionary_record, "chunks": _write_json(f, new_chunks), "reports": reports}
+        offset, length = _write_json(f, segment)
+        f.write(FOOTER.pack(FOOTER_MAGIC, offset, length))
+        f.flush()
+        os.fsync(f.fileno())
+
+        # after the segment is written, so the index is never ahead of the pack file
+        for name, entry in reports.items():
+            versions.setdefault(name, []).append(entry)
+        index["head"] = [offset, length]
+        _save_index(pack, index)
+    return status
+
+
+def content_type(name: str) -> str:
+    # like http.server: .gz files (the bundles of a report set) are served as they are stored
+    if name.endswith(".gz"):
+        return "application/gzip"
+    return mimetypes.guess_type(name)[0] or "application/octet-stream"
+
+
+def render_listing(archive: Archive) -> str:
+    rows = []
+    for name, versions in archive.reports().items():
+        added = time.strftime("%Y-%m-%d %H:%M", time.localtime(versions[-1]["added"]))
+        older = " ".join(f'<a href="/{quote(name)}?version={i}">{i}</a>' for i in range(len(versions) - 1))
+        rows.append(
+            f'<tr><td><a href="/{quote(name)}">{html.escape(name)}</a></td>'
+            f"<td>{versions[-1]['size'] / 1024:.0f} KB</td><td>{added}</td><td>{older}</td></tr>"
+        )
+    return f"""<!DOCTYPE html>
+<html>
+    <head>
+        <meta charset="utf-8">
+        <title>Report archive</title>
+    </head>
+    <body>
+        <h1>{html.escape(archive.path.name)}</h1>
+        <table>
+            <tr><th>Report</th><th>Size</th><th>Added</th><th>Older versions</th></tr>
+            {"".join(rows)}
+        </table>
+    </body>
+</html>
+"""
+
+
+class ArchiveHandler(BaseHTTPRequestHandler):
+    """
+    Serves the reports of the archive of the server: / lists the reports, /<name> is the latest version
+    of a report and /<name>?version=<n> an older one.
+    """
+
+    def do_GET(self):
+        archive = self.server.archive
+        archive.refresh()
+        url = urlsplit(self.path)
+        name = unquote(url.path).lstrip("/")
+
+        if name == "":
+            body, kind = render_listing(archive).encode(), "text/html; charset=utf-8"
+        else:
+            try:
+                version = int(parse_qs(url.query).get("version", ["-1"])[0])
+            except ValueError:
+                self.send_error(400, "The version is not a number")
+                return
+            try:
+                body, kind = archive.read(name, version), content_type(name)
+            except (KeyError, IndexError):
+                self.send_error(404, f"No version {version} of {name}")
+                return
+
+        self.send_response(200)
+        self.send_header("Content-Type", kind)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def serve(pack: str, host: str = "127.0.0.1", port: int = 8000) -> None:
+    """
+    Serves the reports of the archive over http until interrupted. Reports added while the server runs
+    are served too.
+    """
+    with Archive(pack) as archive:
+        server = ThreadingHTTPServer((host, port), ArchiveHandler)
+        server.archive = archive
+        print(f"Serving {pack} on http://{host}:{server.server_address[1]}/")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
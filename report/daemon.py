@@ -0,0 +1,225 @@
+import contextlib
+import json
+import os
+import signal
+import socket
+import socketserver
+import tempfile
+import threading
+import time
+import traceback
+from pathlib import Path
+
+from report import state
+from utils import scheduler
+
+# Socket of the report worker
+SOCKET_PATH = Path(os.environ.get("XDG_RUNTIME_DIR", tempfile.gettempdir())) / f"virushanter-worker-{os.getuid()}.sock"
+
+# Messages are one json object per line: a job ({"sample", "backend", "output", ...}) or {"command": "ping"/"stop"}
+BACKENDS = ["html", "panel"]
+
+
+def load_backends(cache=None) -> dict:
+    """
+    Imports the report modules (pandas, altair, panel and the panel extensions are loaded once here)
+    and returns {backend: function(job) -> path of the report}. The html reports use the chart `cache`.
+    """
+    from report import html_report, panel_report
+
+    def build_html(job):
+        html_report.create_report(job["sample"], job["output"], threads=job.get("threads", 1), cache=cache)
+        return Path(job["output"]) / f"{Path(job['sample']).parts[-1]}-report.html"
+
+    def build_panel(job):
+        panel_report.panel_report(
+            job["sample"],
+            job.get("coverage_plots", job["sample"]),
+            job["output"],
+            deferred_tabs=job.get("deferred_tabs", False),
+        )
+        return Path(job["output"]) / f"{Path(job['sample']).parts[-1]}_report.html"
+
+    return {"html": build_html, "panel": build_panel}
+
+
+class ReportServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Report worker listening on a Unix socket. The report modules are loaded once when the server starts,
+    so every job only pays for building its report.
+    At most `jobs` reports are built at the same time; Panel reports are built one at a time, since Panel
+    keeps global state while a report is saved.
+    The parsed files stay cached between jobs, so samples built again are fast; the caches are only cleared when
+    the memory of the worker is above `max_rss` (bytes) after a job and no other job is running.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, socket_path: str = SOCKET_PATH, jobs: int = 1, cache=None, max_rss: int = None):
+        self.socket_path = Path(socket_path)
+        self.backends = load_backends(cache)
+        self.slots = threading.Semaphore(jobs)
+        self.panel_lock = threading.Lock()
+        self.max_rss = max_rss
+        # jobs being built; the caches are cleared under this lock, so no job starts meanwhile
+        self.active = 0
+        self.active_lock = threading.Lock()
+        self.started = time.time()
+        self.done = 0
+        self.failed = 0
+        remove_stale_socket(self.socket_path)
+        super().__init__(str(self.socket_path), JobHandler)
+
+    def build(self, job: dict) -> dict:
+        """
+        Builds the report of a job and returns the response sent to the client.
+        """
+        backend = job.get("backend", "html")
+        if backend not in self.backends:
+            return {"status": "failed", "error": f"Unknown backend '{backend}', use one of {BACKENDS}"}
+        for key in ("sample", "output"):
+            if key not in job:
+                return {"status": "failed", "error": f"The job has no '{key}'"}
+
+        start = time.perf_counter()
+        lock = self.panel_lock if backend == "panel" else contextlib.nullcontext()
+        with self.slots:
+            with self.active_lock:
+                self.active += 1
+            try:
+                with lock:
+                    try:
+                        report = self.backends[backend](job)
+                    except Exception:
+                        self.failed += 1
+                        return {"status": "failed", "error": traceback.format_exc()}
+                    finally:
+                        if backend == "panel":
+                            # Panel keeps the document of every saved report
+                            state.reset_panel()
+            finally:
+                with self.active_lock:
+                    self.active -= 1
+                    if self.active == 0 and self.max_rss is not None and scheduler.current_rss() > self.max_rss:
+                        state.clear_file_caches()
+
+        self.done += 1
+        return {"status": "done", "report": str(report), "seconds": round(time.perf_counter() - start, 3)}
+
+    def status(self) -> dict:
+        return {
+            "status": "running",
+            "pid": os.getpid(),
+            "uptime": round(time.time() - self.started, 1),
+            "done": self.done,
+            "failed": self.failed,
+        }
+
+    def server_close(self):
+        super().server_close()
+        self.socket_path.unlink(missing_ok=True)
+
+
+class JobHandler(socketserver.StreamRequestHandler):
+    """
+    Reads one message from the client and writes one response.
+    """
+
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            # the client closed the connection without a message (e.g. remove_stale_socket checking the socket)
+            return
+        try:
+            message = json.loads(line)
+        except json.JSONDecodeError as e:
+            response = {"status": "failed", "error": f"Invalid message: {e}"}
+        else:
+            command = message.get("command", "build")
+            if command == "ping":
+                response = self.server.status()
+            elif command == "stop":
+                response = {"status": "stopping"}
+                # shutdown() waits for serve_forever(), so it must not run in the thread of a request
+                threading.Thread(target=self.server.shutdown).start()
+            else:
+                response = self.server.build(message)
+        self.wfile.write(f"{json.dumps(response)}\n".encode())
+
+
+def remove_stale_socket(socket_path: Path) -> None:
+    """
+    Removes the socket file left by a worker that is not running anymore.
+    Raises RuntimeError if a worker is listening on it.
+    """
+    if not socket_path.exists():
+        return
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.connect(str(socket_path))
+    except (ConnectionRefusedError, FileNotFoundError):
+        socket_path.unlink(missing_ok=True)
+    else:
+        raise RuntimeError(f"A report worker is already listening on {socket_path}")
+
+
+def serve(socket_path: str = SOCKET_PATH, jobs: int = 1, cache=None, max_rss: int = None) -> None:
+    """
+    Runs the report worker until it is stopped (stop command, SIGINT or SIGTERM).
+    """
+    with ReportServer(socket_path, jobs, cache, max_rss) as server:
+        signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown).start())
+        print(f"Report worker {os.getpid()} listening on {server.socket_path}", flush=True)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+def request(message: dict, socket_path: str = SOCKET_PATH, timeout: float = None) -> dict:
+    """
+    Sends a message to the report worker and waits for the response.
+    Raises ConnectionError if no worker is listening on the socket.
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.settimeout(timeout)
+        try:
+            client.connect(str(socket_path))
+        except (ConnectionRefusedError, FileNotFoundError) as e:
+            raise ConnectionError(f"No report worker is listening on {socket_path}") from e
+        client.sendall(f"{json.dumps(message)}\n".encode())
+        with client.makefile("rb") as response:
+            line = response.readline()
+    if not line:
+        raise ConnectionError("The report worker closed the connection")
+    return json.loads(line)
+
+
+def submit(
+    sample: str,
+    output: str,
+    backend: str = "html",
+    socket_path: str = SOCKET_PATH,
+    timeout: float = None,
+    **options,
+) -> dict:
+    """
+    Submits a report job to the worker and waits until it is done.
+
+    :param str sample: Path to the sample folder.
+    :param str output: Folder to write the report to.
+    :param str backend: "html" or "panel". Default = "html"
+    :param str socket_path: Socket of the worker. Default = SOCKET_PATH
+    :param float timeout: Seconds to wait for the report. Default = no limit
+    :param options: Other fields of the job (threads for html; coverage_plots and deferred_tabs for panel).
+    :return: dict with the status of the job ("done" or "failed"), the path to the report or the error
+    """
+    job = {
+        "sample": str(Path(sample).resolve()),
+        "output": str(Path(output).resolve()),
+        "backend": backend,
+        **options,
+    }
+    if "coverage_plots" in job:
+        job["coverage_plots"] = str(Path(job["coverage_plots"]).resolve())
+    return request(job, socket_path, timeout)
@@ -0,0 +1,634 @@
+import json
+from pathlib import Path
+from typing import BinaryIO
+import altair as alt
+# Import plotting functions from plotting
+from plotting import bracken_raw, contig_quality, kaiju_raw, kaiju_megahit, cat_megahit, bowtie2_alignment_plot
+from utils import atomic_write, cat_lineage, chart_cache, manifest, parse_bowtielog, parse_fastp_report, task_graph
+
+# css of the reports
+STYLE = """\
+                body {
+                font-family: Arial, sans-serif;
+                font-size: 16px;
+                line-height: 1.5;
+                }
+                header {
+                background: linear-gradient(to right, #000000, #333333);
+                color: white;
+                padding: 40px;
+                text-align: center;
+                box-shadow: 0 4px 8px 0 rgba(0, 0, 0, 0.2), 0 6px 20px 0 rgba(0, 0, 0, 0.19);
+                }
+                h1 {
+                font-size: 3em;
+                margin: 0;
+                text-align: center;
+                }
+                h2 {
+                font-size: 2em;
+                margin-bottom:30px;
+                text-align: center;
+                }
+                section {
+                margin: 80px 0;
+                }
+                hr {
+                border: 0;
+                height: 1px;
+                background: #333;
+                background-image: linear-gradient(to right, #ccc, #333, #ccc);
+                }
+                table {
+                border-collapse: collapse;
+                }
+                th, td {
+                border: 1px solid #ccc;
+                padding: 10px;
+                text-align: left;
+                }
+                th {
+                background-color: #eee;
+                }
+                .pending {
+                margin: 40px auto;
+                padding: 20px;
+                width: 60%;
+                border: 1px dashed #999;
+                color: #666;
+                text-align: center;
+                }"""
+
+# Sections of the preview: the read statistics and the raw read classification, which are cheap to build
+PREVIEW_TASKS = ["alignments", "bowtie_plot", "fastp_df", "species_and_domain_bracken", "kaiju_raw_plot"]
+
+# Seconds between reloads of a report with pending sections
+PREVIEW_REFRESH = 15
+
+# Placeholder of a section that is not built yet
+PENDING = (
+    '<div id="{id}" class="pending">Pending: this section is still being built. '
+    f'The page reloads every {PREVIEW_REFRESH} seconds until the report is complete.</div>'
+)
+
+# Renders a table ({"columns": [...], "chunks": ["[[index, values...], ...]", ...]}) into the container.
+# Every chunk of rows is parsed and added in its own animation frame, so large tables do not block the page.
+TABLE_JS = """
+            function renderTable(container, table) {
+                const el = document.createElement("table");
+                el.className = "dataframe";
+                el.border = 1;
+                const head = el.createTHead().insertRow();
+                for (const column of ["", ...table.columns]) {
+                    const th = document.createElement("th");
+                    th.textContent = column;
+                    head.appendChild(th);
+                }
+                const body = el.createTBody();
+                container.replaceChildren(el);
+                let chunk = 0;
+                function next() {
+                    const rows = document.createDocumentFragment();
+                    for (const [index, ...values] of JSON.parse(table.chunks[chunk])) {
+                        const tr = document.createElement("tr");
+                        const th = document.createElement("th");
+                        th.textContent = index;
+                        tr.appendChild(th);
+                        for (const value of values) {
+                            const td = document.createElement("td");
+                            td.textContent = value === null ? "" : value;
+                            tr.appendChild(td);
+                        }
+                        rows.appendChild(tr);
+                    }
+                    body.appendChild(rows);
+                    chunk += 1;
+                    if (chunk < table.chunks.length) requestAnimationFrame(next);
+                }
+                if (table.chunks.length) next();
+            }
+"""
+
+# svg that is read in for testing, if it exists in the working directory
+TEST_SVG = "visualization (1).svg"
+
+# function to read in svg code
+def return_svg(svg: str):
+    with open(svg, "r") as f:
+        return f.read()
+    
+# function to render the report
+def render_html(
+    sample_name: str,
+    total_reads: int,
+    number_aligned: int,
+    number_unaligned: int,
+    bowtie_plot: str,
+    fastp_df: str,
+    megahit_histogram: str,
+    assembly_stats: str,
+    gc_histogram: str,
+    kaiju_raw: str,
+    kraken_raw: str,
+    kaiju_and_cat: str,
+    cat_kaiju_df: str,
+    svg: str,
+    lazy: bool = True,
+) -> str:
+    """
+    Renders the html report.
+    The charts and the contig table are stored as json in the page. With `lazy` they are only rendered when their
+    container scrolls into view, otherwise all of them are rendered as soon as the page is loaded.
+    Sections that are None (not built yet, see create_report) are shown as pending placeholders, and the page
+    then reloads itself every PREVIEW_REFRESH seconds.
+    """
+
+    # json in a <script> must not close the script
+    def spec(x):
+        return x.replace("</", "<\\/")
+
+    # container of a chart or table and its json, or a placeholder if it is not built yet
+    def section(id, value, attributes):
+        if value is None:
+            return PENDING.format(id=id)
+        return f"""<div id="{id}" data-spec="{id}-spec"{attributes}></div>
+            <script type="application/json" id="{id}-spec">{spec(value)}</script>"""
+
+    centered = ' style="display:flex;justify-content:center;align-items:center;width:100%;height:100%;margin:40px;"'
+
+    if total_reads is None:
+        reads = f'<td colspan="3">{PENDING.format(id="reads")}</td>'
+    else:
+        reads = f"""<td>{total_reads:,}</td>
+                    <td>{number_aligned:,} ({number_aligned / total_reads * 100:.2f}%)</td>
+                    <td>{number_unaligned:,} ({number_unaligned / total_reads * 100:.2f}%)</td>"""
+
+    sections = [total_reads, bowtie_plot, fastp_df, megahit_histogram, assembly_stats, gc_histogram, kaiju_raw, kraken_raw, kaiju_and_cat, cat_kaiju_df]
+    refresh = (
+        f'\n            <meta http-equiv="refresh" content="{PREVIEW_REFRESH}">' if None in sections else ""
+    )
+
+    defer = " defer" if lazy else ""
+
+    html = f"""
+    <!DOCTYPE html>
+    <html>
+        <head>
+            <title>Report of {sample_name} </title>{refresh}
+            <script{defer} src="https://cdn.jsdelivr.net/npm/vega@5"></script>
+            <script{defer} src="https://cdn.jsdelivr.net/npm/vega-lite@4"></script>
+            <script{defer} src="https://cdn.jsdelivr.net/npm/vega-embed@6"></script>
+            
+            <style>
+{STYLE}
+            </style>
+
+        </head>
+        
+        <body>
+        
+            <header>
+                <h1>
+                Pandemic Prepardeness Report 
+                </h1>
+                <h2>
+                Report of {sample_name}
+                </h2>
+            </header>
+            
+            <h2>
+                Information about Reads
+            </h2>
+            <table style="margin-bottom:30px;">
+                <tr>
+                    <th>Total reads pairs</th>
+                    <th>Reads aligned to human genome</th>
+                    <th>Reads NOT aligned to human genome</th>
+                </tr>
+                <tr>
+                    {reads}
+                </tr>
+            </table>
+
+            {section("aligned", bowtie_plot, ' style="display:flex;width:100%;height:100%;"')}
+            
+            <h2>
+            Information from fastp
+            </h2>
+            <div style="margin: auto;">
+            {PENDING.format(id="fastp_df") if fastp_df is None else fastp_df}
+            </div>
+            
+            <hr />
+            
+            <!-- KRAKEN RAW -->
+            <h2> 
+            Raw reads classfied with Kraken and Kaiju
+            </h2>
+            
+            <div style="border: 1px solid black; padding: 10px; margin: 10px; width: 1000px; border-radius: 10px; box-shadow: 5px 5px 5px grey; background-color: #cccccc; display:flex;justify-content:center;">
+            <ul>
+            <li>KRAKEN2 and KAIJU are both popular bioinformatics tools for accurately and efficiently identifying and categorizing large numbers of short DNA sequences.</li>
+            <li>KRAKEN2 is based on a probabilistic model and uses a pre-constructed database of genomic sequences, while KAIJU uses a database of reference sequences and an efficient indexing method.</li>
+            <li>KRAKEN2 and KAIJU have been shown to produce highly accurate results in a short amount of time, but KRAKEN2 may require more computational resources.</li>
+            <li>Both KRAKEN2 and KAIJU are open-source and freely available for use, making them valuable resources for researchers in the field of genomics.</li>
+            </ul>
+            </div>
+
+            <h3>
+            Kraken classification
+            </h3>
+            {section("kraken_raw", kraken_raw, centered)}
+            
+            <!-- KAIJU RAW -->
+            <h3>
+            Kaiju classification
+            </h3>
+            {section("kaiju_raw", kaiju_raw, centered)}
+            
+            <hr />
+            
+            <h2>
+            Contig information
+            </h2>
+            <h3>
+            Histogram of megahit contigs
+            </h3>
+            <div style="border: 1px solid black; padding: 10px; margin: 10px; width: 1000px; border-radius: 10px; box-shadow: 5px 5px 5px grey; background-color: #cccccc; display:flex;justify-content:center;">
+            <ul>
+            <li>MEGAHIT is a popular and highly-efficient bioinformatics tool for assembling large and complex genomes.</li>
+            <li>It is based on a De Bruijn graph approach and is capable of accurately assembling millions of reads into a complete genome in a short amount of time.</li>
+            <li>MEGAHIT has been widely used in a variety of genomic studies and has been shown to produce high-quality assemblies that are comparable to those generated by other leading assemblers.</li>
+            </ul>
+            </div>
+
+
+            <!-- PLOT MEGAHIT -->
+            
+            {section("megahit_histo", megahit_histogram, centered)}
+
+            <h3>
+            Assembly statistics
+            </h3>
+            <div style="margin: auto;">
+            {PENDING.format(id="assembly_stats") if assembly_stats is None else assembly_stats}
+            </div>
+
+            <h3>
+            GC content of contigs
+            </h3>
+            {section("gc_histo", gc_histogram, centered)}
+            
+            <!-- PLOT Kaiju and Cat -->
+            <h3>
+            Contigs classified with Kaiju and CAT
+            </h3>
+            
+            <div style="border: 1px solid black; padding: 10px; margin: 10px; width: 1000px; border-radius: 10px; box-shadow: 5px 5px 5px grey; background-color: #cccccc; display:flex;justify-content:center;">
+            <ul>
+            <li>CAT (Classification and Annotation Tool) is a popular bioinformatics tool that uses a combination of machine learning algorithms and a pre-constructed database of genomic sequences to classify and annotate DNA sequences.</li>
+            <li>The BLASTP aspect of CAT involves using the Basic Local Alignment Search Tool (BLASTP) to compare a query sequence to the database of reference sequences and identify similar sequences.</li>
+            <li>BLASTP is a widely-used algorithm for sequence alignment and is known for its speed and accuracy in identifying similar sequences.</li>
+          </ul>
+          </div>
+            
+            {section("kaiju_and_cat", kaiju_and_cat, centered)}
+            
+            <h3>
+            Table containing information about contigs
+            </h3>
+            {section("cat_kaiju_df", cat_kaiju_df, ' data-kind="table"')}
+            <hr />
+
+            <script type="text/javascript">
+            {TABLE_JS}
+            function render(el) {{
+                const data = JSON.parse(document.getElementById(el.dataset.spec).textContent);
+                if (el.dataset.kind === "table") {{
+                    renderTable(el, data);
+                    performance.mark(`rendered-${{el.id}}`);
+                }} else {{
+                    vegaEmbed(el, data).then(() => performance.mark(`rendered-${{el.id}}`));
+                }}
+            }}
+
+            document.addEventListener("DOMContentLoaded", () => {{
+                performance.mark("report-interactive");
+                const containers = document.querySelectorAll("[data-spec]");
+                if (!{json.dumps(lazy)} || !("IntersectionObserver" in window)) {{
+                    containers.forEach(render);
+                    return;
+                }}
+                // render each chart when its container is about to scroll into view
+                const observer = new IntersectionObserver((entries) => {{
+                    for (const entry of entries) {{
+                        if (entry.isIntersecting) {{
+                            observer.unobserve(entry.target);
+                            render(entry.target);
+                        }}
+                    }}
+                }}, {{ rootMargin: "200px" }});
+                containers.forEach((el) => observer.observe(el));
+            }});
+            </script>
+        </body>
+    </html>
+    """
+
+    return html
+
+
+# function to create the report
+def html_template_report(sample_name: str, out_path: str, **fields) -> None:
+    """
+    Creates html report. `fields` are the arguments to render_html.
+    """
+    output = Path(out_path) / f"{sample_name}-report.html"
+    html = render_html(sample_name=sample_name, **fields)
+    atomic_write.write_atomic(output, f"{html}\n".encode())
+
+
+# function that returns the first file in the sample folder matching the first of the patterns that matches
+def find_file(sample: Path, patterns: list) -> Path:
+    for pattern in patterns:
+        matches = list(sample.rglob(pattern))
+        if matches:
+            return matches[0]
+    raise FileNotFoundError(f"No file matching {patterns} in {sample}")
+
+
+# bar plots of kraken species (virus only) and kraken domains side by side
+def bracken_species_and_domain(file: str, number: int = 10) -> str:
+    bracken_bar_plot = bracken_raw.bar_chart_bracken_raw(
+        file, number=number, virus_only=True
+    )
+
+    bracken_domain_bar_plot = bracken_raw.bar_chart_bracken_raw(
+        file, level="domain", virus_only=False
+    )
+
+    return (
+        alt.hconcat(bracken_bar_plot, bracken_domain_bar_plot)
+        .resolve_scale(color="independent")
+    ).to_json()
+
+
+# bar plots of the kaiju and CAT classification of the contigs side by side
+def kaiju_and_cat_chart(kaiju_file: str, cat_file: str) -> str:
+    kaiju_bar_plot = kaiju_megahit.bar_chart_kaiju_megahit(file=kaiju_file)
+    cat_bar_plot = cat_megahit.bar_chart_cat_megahit(file=cat_file)
+    return (
+        alt.hconcat(kaiju_bar_plot, cat_bar_plot)
+        .resolve_scale(color="independent")
+        .to_json()
+    )
+
+
+# html table with the summary from fastp
+def fastp_table(file: str) -> str:
+    return parse_fastp_report.parse_fastp(file).to_html(classes=["center-table"])
+
+
+# html table with the statistics of the assembly
+def assembly_stats_table(file: str) -> str:
+    return contig_quality.assembly_stats_table(file).to_html(classes=["center-table"], index=False)
+
+
+# table with the first contigs classified by kaiju and CAT, as json with the rows split in chunks
+# {"columns": [...], "chunks": ["[[index, values...], ...]", ...]} (rendered by TABLE_JS)
+def cat_kaiju_table(*files: str, rows: int = 10, chunk: int = 500) -> str:
+    df = cat_lineage.read_cat_kaiju(*files)[["name", "taxon_id", "length", "last_level_kaiju", "last_level_cat"]].head(rows)
+    table = json.loads(df.to_json(orient="split"))
+    data = [[index, *values] for index, values in zip(table["index"], table["data"])]
+    chunks = [json.dumps(data[i:i + chunk]) for i in range(0, len(data), chunk)]
+    return json.dumps({"columns": table["columns"], "chunks": chunks})
+
+
+# function that loads the results (files, parsed data, charts) of the report from the sample folder
+def load_report_results(
+    sample: str,
+    threads: int = 1,
+    files: dict = None,
+    cache: chart_cache.ChartCache = None,
+    contig_rows: int = 10,
+    targets: list = None,
+    budget: float = None,
+    results: dict = None,
+) -> dict:
+    """
+    Loads the results of the report: {task name: result}.
+    The files of the sample are found, read and plotted concurrently on a pool of `threads` threads.
+    Every plot is started as soon as the files it needs are found.
+    `files` ({artifact: path}, e.g. from the manifest) are used instead of searching the sample folder.
+    Charts and tables are taken from `cache` if one is given.
+    `contig_rows` is the number of contigs in the contig table.
+    Only the `targets` tasks (e.g. PREVIEW_TASKS) are run if given, and only the tasks that finish within
+    `budget` seconds are returned; the tasks still running then are returned as futures (see
+    task_graph.run_task_graph). Tasks in `results` (from an earlier call) are not run again.
+    """
+    # Sample
+    sample = Path(sample)
+    
+    # Number of bars to include in the figures:
+    number = 10
+
+    # Files (found in the sample folder if they are not given)
+    files = files or {}
+
+    def locate(name):
+        if name in files:
+            return lambda: files[name]
+        return lambda: find_file(sample, manifest.patterns(name))
+
+    def cat_kaiju_files():
+        # the merged csv, or the files the table is merged from
+        try:
+            return [locate("cat_kaiju_csv")()]
+        except FileNotFoundError:
+            return [locate(name)() for name in cat_lineage.CAT_KAIJU_SOURCES]
+
+    tasks = {name: (locate(name), []) for name in manifest.ARTIFACTS}
+    tasks["cat_kaiju_csv"] = (cat_kaiju_files, [])
+
+    # {name: (function, [dependencies])}
+    tasks |= {
+        # Number of reads and percent of reads aligned to reference genome (from bowtie2logfile)
+        "alignments": (parse_bowtielog.parse_alignments, ["bowtie2log"]),
+        # Bowtie2 alignment plot
+        "bowtie_plot": (
+            lambda log: chart_cache.build_chart(bowtie2_alignment_plot.plot_alignment, [log], cache=cache),
+            ["bowtie2log"],
+        ),
+        # fastp dataframe
+        "fastp_df": (
+            lambda report: chart_cache.build_chart(fastp_table, [report], cache=cache),
+            ["fastp_report"],
+        ),
+        # Raw bracken and kaiju plots
+        "species_and_domain_bracken": (
+            lambda file: chart_cache.build_chart(bracken_species_and_domain, [file], {"number": number}, cache),
+            ["cleaned_bracken_report"],
+        ),
+        "kaiju_raw_plot": (
+            lambda file: chart_cache.build_chart(kaiju_raw.bar_chart_kaiju_raw, [file], cache=cache),
+            ["cleaned_kaiju_report"],
+        ),
+        # Contigs (Megahit)
+        "megahit_histogram": (
+            lambda file: chart_cache.build_chart(contig_quality.megahit_contig_histogram, [file], cache=cache),
+            ["megahit_csv"],
+        ),
+        "assembly_stats": (
+            lambda file: chart_cache.build_chart(assembly_stats_table, [file], cache=cache),
+            ["megahit_csv"],
+        ),
+        "gc_histogram": (
+            lambda file: chart_cache.build_chart(contig_quality.gc_content_histogram, [file], cache=cache),
+            ["megahit_csv"],
+        ),
+        # Contigs (CAT and Kaiju)
+        "kaiju_and_cat": (
+            lambda kaiju_file, cat_file: chart_cache.build_chart(kaiju_and_cat_chart, [kaiju_file, cat_file], cache=cache),
+            ["kaiju_megahit_report", "cat_megahit_out"],
+        ),
+        # cat and kaiju dataframe
+        "cat_kaiju_df": (
+            lambda files: chart_cache.build_chart(cat_kaiju_table, files, {"rows": contig_rows}, cache),
+            ["cat_kaiju_csv"],
+        ),
+    }
+
+    return task_graph.run_task_graph(tasks, max_workers=threads, results=results, targets=targets, timeout=budget)
+
+
+# function that turns the results of the report into the arguments to render_html
+def report_data(sample: str, results: dict) -> dict:
+    """
+    Returns the arguments to render_html from the results of load_report_results.
+    Sections that are missing from the results, or still being built, are None (rendered as pending).
+    """
+    sample_name = Path(sample).parts[-1]
+    results = task_graph.finished(results)
+
+    total_reads = number_aligned = number_unaligned = None
+    if "alignments" in results:
+        total_reads, percent_aligned = results["alignments"]
+        number_aligned = int(total_reads * percent_aligned / 100)
+        number_unaligned = total_reads - number_aligned
+
+    # test svg
+    svg = return_svg(TEST_SVG) if Path(TEST_SVG).exists() else ""
+
+    return {
+        "sample_name": sample_name,
+        "total_reads": total_reads,
+        "number_aligned": number_aligned,
+        "number_unaligned": number_unaligned,
+        "kraken_raw": results.get("species_and_domain_bracken"),
+        "kaiju_raw": results.get("kaiju_raw_plot"),
+        "svg": svg,
+        "bowtie_plot": results.get("bowtie_plot"),
+        "fastp_df": results.get("fastp_df"),
+        "megahit_histogram": results.get("megahit_histogram"),
+        "assembly_stats": results.get("assembly_stats"),
+        "gc_histogram": results.get("gc_histogram"),
+        "kaiju_and_cat": results.get("kaiju_and_cat"),
+        "cat_kaiju_df": results.get("cat_kaiju_df"),
+    }
+
+
+# function that loads the data of the report from the sample folder
+def load_report_data(
+    sample: str,
+    threads: int = 1,
+    files: dict = None,
+    cache: chart_cache.ChartCache = None,
+    contig_rows: int = 10,
+) -> dict:
+    """
+    Loads the data of the report, returned as the arguments to render_html.
+    See load_report_results for the arguments.
+    """
+    results = load_report_results(sample, threads=threads, files=files, cache=cache, contig_rows=contig_rows)
+    return report_data(sample, results)
+
+
+# function that builds the report in memory
+def build_report(
+    sample: str = None,
+    data: dict = None,
+    stream: BinaryIO = None,
+    **options,
+) -> bytes:
+    """
+    Builds the html report of a sample in memory.
+
+    :param str sample: Path to the sample folder. Not needed if `data` is given.
+    :param dict data: Already loaded data (from load_report_data). Default = loaded from the sample folder
+    :param BinaryIO stream: If given, the report is also written to this stream. Default = None
+    :param options: Keyword arguments to load_report_data (threads, files, cache).
+    :return: bytes with the html report
+    """
+    if data is None:
+        data = load_report_data(sample, **options)
+
+    report = f"{render_html(**data)}\n".encode()
+    if stream is not None:
+        stream.write(report)
+    return report
+
+
+# function that writes the preview of the report
+def preview_report(
+    sample: str,
+    out_path: str,
+    threads: int = 1,
+    files: dict = None,
+    cache: chart_cache.ChartCache = None,
+    budget: float = None,
+) -> dict:
+    """
+    Writes (atomically) a report with only the preview sections (PREVIEW_TASKS) that are built within `budget`
+    seconds to <out_path>/<sample name>-report.html. The other sections are pending.
+    Returns the results, to be reused by create_report.
+    """
+    results = load_report_results(
+        sample, threads=threads, files=files, cache=cache, targets=PREVIEW_TASKS, budget=budget
+    )
+    output = Path(out_path) / f"{Path(sample).parts[-1]}-report.html"
+    atomic_write.write_atomic(output, build_report(data=report_data(sample, results)))
+    return results
+
+
+# function that writes the report using the right samples
+def create_report(
+    sample: str,
+    out_path: str,
+    threads: int = 1,
+    files: dict = None,
+    cache: chart_cache.ChartCache = None,
+    preview: bool = False,
+    budget: float = None,
+    results: dict = None,
+) -> None:
+    """
+    Generate the report and write it (atomically) to <out_path>/<sample name>-report.html
+    With `preview` the preview of the report (see preview_report) is written first and then replaced by the
+    full report. The results of the preview, or `results` from an earlier preview_report, are reused.
+    """
+    if preview and results is None:
+        results = preview_report(sample, out_path, threads, files, cache, budget)
+
+    results = load_report_results(sample, threads=threads, files=files, cache=cache, results=results)
+    output = Path(out_path) / f"{Path(sample).parts[-1]}-report.html"
+    atomic_write.write_atomic(output, build_report(data=report_data(sample, results)))
+
+
+def report_job(sample: str, sample_files: dict = None, **options) -> None:
+    """
+    Job of the batch runners (utils/scheduler.py and utils/work_queue.py): create_report with the artifacts of
+    the sample from `sample_files` ({sample name: files}). A module level function with picklable arguments,
+    so it also runs in worker processes that are spawned rather than forked.
+    """
+    files = sample_files.get(Path(sample).name) if sample_files else None
+    create_report(sample, files=files, **options)
@@ -0,0 +1,607 @@
+import base64
+import gzip
+import io
+import json
+import time
+import pandas as pd
+import numpy as np
+import panel as pn
+import altair as alt
+from bokeh import __version__
+from bokeh.document import Document
+from bokeh.embed.util import standalone_docs_json_and_render_items
+from panel.io.model import add_to_doc
+from pathlib import Path
+from typing import BinaryIO
+
+# Import plotting functions from plotting
+from plotting import (
+    bracken_raw,
+    contig_quality,
+    kaiju_raw,
+    kaiju_megahit,
+    cat_megahit,
+    bowtie2_alignment_plot,
+)
+from utils import atomic_write, cat_lineage, manifest, parse_bowtielog, parse_fastp_report, svg_assets
+
+pn.extension("tabulator")
+pn.extension("vega", sizing_mode="stretch_width", template="fast")
+pn.widgets.Tabulator.theme = "modern"
+
+# Script of a deferred tab. The serialized tab (gzipped json, in base64) is inflated and rendered into its container,
+# in the same page and with the same Bokeh runtime, the first time the container is shown. Hidden tabs have
+# visibility: hidden, and the tab headers switch the tab in their click handler, so the containers are checked after
+# every click.
+DEFERRED_LOADER = """
+(() => {
+    const id = "TARGET";
+    async function materialize() {
+        const target = document.getElementById(id);
+        if (target === null || target.dataset.loaded) return;
+        if (getComputedStyle(target).visibility === "hidden" || target.offsetWidth === 0) return;
+        target.dataset.loaded = "true";
+        document.removeEventListener("click", materialize);
+        const bytes = Uint8Array.from(atob(document.getElementById(`${id}-item`).textContent), (c) => c.charCodeAt(0));
+        const stream = new Blob([bytes]).stream().pipeThrough(new DecompressionStream("gzip"));
+        const item = JSON.parse(await new Response(stream).text());
+        Bokeh.embed.embed_item(item, id);
+    }
+    document.addEventListener("click", materialize);
+    requestAnimationFrame(materialize);
+})();
+"""
+
+
+# Tabs of the preview: the read statistics and the raw read classification, which are cheap to build
+PREVIEW_TABS = ["Alignment Stats", "Classification of Raw Reads", "Information About Programs"]
+
+
+# Header
+def header(
+    text: str,
+    bg_color: str = "#04c273",
+    height: int = 150,
+    fontsize: str = "px20",
+    textalign: str = "center",
+):
+    """
+    Template for markdown header like block
+    """
+    return pn.pane.Markdown(
+        f"""
+        {text}
+        """,
+        background=bg_color,
+        height=height,
+        margin=10,
+        style={
+            "color": "white",
+            "padding": "10px",
+            "text-align": f"{textalign}",
+            "font-size": f"{fontsize}",
+        },
+    )
+
+
+# Deferred tab
+def deferred(obj, name: str, height: int = 900) -> pn.pane.HTML:
+    """
+    Serializes the object to its Bokeh json and returns a pane with the gzipped json (in base64) and an empty
+    container. The json is only inflated, deserialized and rendered into the container the first time the tab is
+    shown, so the browser does not build its models when the report is opened.
+    """
+    doc = Document()
+    root = pn.panel(obj).get_root(doc)
+    add_to_doc(root, doc, True)
+    docs_json, _ = standalone_docs_json_and_render_items([root], suppress_callback_warning=True)
+    item = {"target_id": None, "root_id": root.ref["id"], "doc": list(docs_json.values())[0], "version": __version__}
+    target = f"deferred-{root.ref['id']}"
+    # base64 can not close the script
+    payload = base64.b64encode(gzip.compress(json.dumps(item).encode(), mtime=0)).decode()
+
+    return pn.pane.HTML(
+        f"""<div id="{target}" style="width:100%;height:{height - 20}px;overflow:auto;"></div>
+        <script type="application/octet-stream" id="{target}-item">{payload}</script>
+        <script type="text/javascript">{DEFERRED_LOADER.replace("TARGET", target)}</script>""",
+        height=height,
+        sizing_mode="stretch_width",
+        disable_math=True,
+        name=name,
+    )
+
+
+# Placeholder of a tab that is not built yet
+def pending(name: str) -> pn.pane.Markdown:
+    """
+    Placeholder of a section that is not built yet in a preview report.
+    """
+    return pn.pane.Markdown(
+        f"""
+        ## {name}
+        Pending: this section is still being built. Reload the page when the full report is written.
+        """,
+        name=name,
+    )
+
+
+# Coverage plot
+def coverage_pane(plot: Path, name: str, svg_processor: svg_assets.SvgProcessor = None):
+    """
+    Returns the pane of a coverage plot. The svg is embedded as it is, or the asset made by `svg_processor`
+    (an optimized svg, or a png/webp if the svg is too large).
+    """
+    if svg_processor is None:
+        return pn.pane.SVG(plot, name=name)
+
+    asset = svg_processor.process(plot)
+    if asset.suffix == ".svg":
+        return pn.pane.SVG(asset, name=name)
+    if asset.suffix == ".png":
+        return pn.pane.PNG(asset, name=name)
+
+    image = base64.b64encode(asset.read_bytes()).decode()
+    return pn.pane.HTML(
+        f'<img src="data:image/{asset.suffix[1:]};base64,{image}" style="max-width:100%;" />', name=name
+    )
+
+
+# Build the layout of the report
+def panel_layout(
+    sample: str,
+    coverage_plot_path: str,
+    files: dict = None,
+    deferred_tabs: bool = False,
+    svg_processor: svg_assets.SvgProcessor = None,
+    preview: bool = False,
+    budget: float = None,
+    sections: dict = None,
+) -> pn.Column:
+    """
+    Builds the Panel layout of the report.
+    `files` ({artifact: path}, e.g. from the manifest) are used instead of searching the sample folder.
+    With `deferred_tabs` every tab except the first is stored compressed and only rendered when it is clicked.
+    With `svg_processor` the coverage plots are optimized (or rasterized) before they are embedded.
+    With `preview` only the PREVIEW_TABS are built, and no more of them are started after `budget` seconds;
+    the other tabs are pending placeholders.
+    The built sections are stored in `sections` ({tab name: section}) if it is given, and sections already in it
+    are not built again, so a full layout built after a preview reuses the sections of the preview.
+    """
+    # --- IO --- #
+    sample = Path(sample)
+    sample_name = sample.parts[-1]
+    files = files or {}
+
+    def artifact(name):
+        if name in files:
+            return files[name]
+        for pattern in manifest.patterns(name):
+            matches = list(sample.rglob(pattern))
+            if matches:
+                return matches[0]
+        raise FileNotFoundError(f"No {name} in {sample}")
+
+    # --- Alignment and Read Statistics --- #
+    def build_alignment():
+        # Number of reads and number of reads aligned to reference genome (from bowtie2logfile)
+        bowtie2log = artifact("bowtie2log")
+
+        total_reads, percent_aligned = parse_bowtielog.parse_alignments(bowtie2log)
+        number_aligned = int(total_reads * percent_aligned / 100)
+        number_unaligned = total_reads - number_aligned
+
+        # Markdown with above text
+        alignment_stats = pn.pane.Markdown(
+            f"""
+            ### Total Number of Reads: 
+            {total_reads}
+            ### Reads aligned to Human Genome: 
+            {number_aligned} ({percent_aligned}%)
+            ### Reads NOT aligned to Human Genome:
+            {number_unaligned} ({100 - percent_aligned}%)
+            """,
+            name="Alignment Stats",
+        )
+
+        # Bowtie2 alignment plot:
+        bowtie_plot = bowtie2_alignment_plot.plot_alignment(bowtie2log).interactive()
+        bowtie_plot_pane = pn.pane.Vega(
+            bowtie_plot, sizing_mode="stretch_both", name="Alignment Plot"
+        )
+
+        # fastp report
+        fastp_report = artifact("fastp_report")
+
+        fastp_df = parse_fastp_report.parse_fastp(fastp_report)
+
+        fastp_table = pn.widgets.Tabulator(
+            fastp_df, layout="fit_columns", show_index=False, name="Read Summary from FASTP"
+        )
+
+        # Header for this section
+        alignment_subheader = header(
+            text=f"## Alignment and Read statistics",
+            bg_color="#04c273",
+            height=80,
+            textalign="left",
+        )
+
+        bowtie_and_stats = pn.Column(
+            alignment_stats, pn.layout.Divider(), bowtie_plot_pane, name="Alignment"
+        )
+
+        # Section
+        alignment_tab = pn.Tabs(bowtie_and_stats, fastp_table)
+        alignment_section = pn.Column(alignment_subheader, alignment_tab)
+        return alignment_section
+
+    # --- Raw Classification --- #
+    def build_raw():
+        number = 10
+        # Raw bracken and kaiju report
+        cleaned_bracken_report = artifact("cleaned_bracken_report")
+        cleaned_kaiju_report = artifact("cleaned_kaiju_report")
+
+        # Raw bracken and kaiju plots
+        bracken_bar_plot = bracken_raw.bar_chart_bracken_raw(
+            cleaned_bracken_report, number=number, virus_only=True
+        ).interactive()
+
+        bracken_domain_bar_plot = bracken_raw.bar_chart_bracken_raw(
+            cleaned_bracken_report, level="domain", virus_only=False
+        ).interactive()
+
+        kaiju_raw_plot = kaiju_raw.bar_chart_kaiju_raw(
+            file=cleaned_kaiju_report
+        ).interactive()
+
+        # Vega panes
+        bracken_bar_plot_pane = pn.pane.Vega(
+            bracken_bar_plot, sizing_mode="stretch_both", name="Kraken Virus Only"
+        )
+        bracken_domain_bar_plot_pane = pn.pane.Vega(
+            bracken_domain_bar_plot, sizing_mode="stretch_both", name="Kraken All Domains"
+        )
+        kaiju_raw_plot_pane = pn.pane.Vega(
+            kaiju_raw_plot, sizing_mode="stretch_both", name="Kaiju"
+        )
+
+        # Header for this section
+        raw_header = header(
+            text=f"## Classification of Raw Reads",
+            bg_color="#04c273",
+            height=80,
+            textalign="left",
+        )
+
+        # Section
+        raw_tab = pn.Tabs(
+            bracken_bar_plot_pane, bracken_domain_bar_plot_pane, kaiju_raw_plot_pane
+        )
+        raw_section = pn.Column(raw_header, raw_tab)
+        return raw_section
+
+    # --- Contig Classification --- #
+    def build_contigs():
+        # Contigs (Megahit)
+        megahit_csv = artifact("megahit_csv")
+        megahit_histogram = contig_quality.megahit_contig_histogram(
+            file=megahit_csv
+        ).interactive()
+        gc_histogram = contig_quality.gc_content_histogram(file=megahit_csv).interactive()
+
+        # Contigs (CAT and Kaiju)
+        kaiju_megahit_report = artifact("kaiju_megahit_report")
+        cat_megahit_out = artifact("cat_megahit_out")
+
+        # plots
+        kaiju_bar_plot = kaiju_megahit.bar_chart_kaiju_megahit(
+            file=kaiju_megahit_report
+        ).interactive()
+        cat_bar_plot = cat_megahit.bar_chart_cat_megahit(file=cat_megahit_out).interactive()
+
+        # Vega panes
+        megahit_histogram_pane = pn.pane.Vega(
+            megahit_histogram, sizing_mode="stretch_both", name="Contig Histogram"
+        )
+        gc_histogram_pane = pn.pane.Vega(
+            gc_histogram, sizing_mode="stretch_both", name="GC Content"
+        )
+        assembly_stats_table = pn.widgets.Tabulator(
+            contig_quality.assembly_stats_table(megahit_csv),
+            layout="fit_columns",
+            show_index=False,
+            name="Assembly Statistics",
+        )
+        kaiju_bar_plot_pane = pn.pane.Vega(
+            kaiju_bar_plot, sizing_mode="stretch_both", name="Kaiju"
+        )
+        cat_bar_plot_pane = pn.pane.Vega(
+            cat_bar_plot, sizing_mode="stretch_both", name="CAT"
+        )
+
+        # cat and kaiju dataframe
+        # (merged from the kaiju, CAT and contig files if there is no merged csv)
+        try:
+            cat_kaiju_files = [artifact("cat_kaiju_csv")]
+        except FileNotFoundError:
+            cat_kaiju_files = [artifact(name) for name in cat_lineage.CAT_KAIJU_SOURCES]
+        cat_kaiju_df = cat_lineage.read_cat_kaiju(*cat_kaiju_files)[
+            ["name", "taxon_id", "length", "last_level_kaiju", "last_level_cat", "sequence"]
+        ]
+        cat_kaiju_table = pn.widgets.Tabulator(
+            cat_kaiju_df,
+            editors={"sequence": {"type": "editable", "value": False}},
+            layout="fit_columns",
+            pagination="local",
+            page_size=15,
+            show_index=False,
+            name="Contig Table",
+        )
+
+        # Header for this section
+        contig_header = header(
+            text=f"## Classification of Contigs",
+            bg_color="#04c273",
+            height=80,
+            textalign="left",
+        )
+
+        # Section
+        contig_tab = pn.Tabs(
+            megahit_histogram_pane, assembly_stats_table, gc_histogram_pane, kaiju_bar_plot_pane, cat_bar_plot_pane, cat_kaiju_table
+        )
+        contig_section = pn.Column(contig_header, contig_tab)
+        return contig_section
+
+    # --- Coverage plots --- #
+    def build_coverage():
+        # IO
+        coverage_plots = [
+            x
+            for x in Path(coverage_plot_path).rglob(f"{sample_name}/*.svg")
+            if not "ipynb" in str(x)
+        ]
+
+        coverage_tab = pn.Tabs()
+        if coverage_plots:
+            for plot in coverage_plots:
+                name = plot.stem.split("_")[-1].replace(".", " ")
+                coverage_tab.append(coverage_pane(plot, name, svg_processor))
+        else:
+            no_plots = pn.pane.Markdown(
+                "## No Coverage plots Available", name="No Coverage Plots"
+            )
+            coverage_tab.append(no_plots)
+
+        # Header for this section
+        coverage_header = header(
+            text=f"## Alignment Coverage", bg_color="#04c273", height=80, textalign="left"
+        )
+
+        # Section
+        coverage_section = pn.Column(coverage_header, coverage_tab)
+        return coverage_section
+
+    # --- Information about programs used --- #
+    def build_information():
+        kaiju_and_kraken_info = pn.pane.Markdown(
+            f"""
+            ## Kaiju and Kraken2
+            Kaiju and Kraken2 are both programs for taxonomic classification of DNA sequences.
+            They both use a database of known genetic markers and a sequence alignment algorithm to compare a query sequence to the reference 
+            index and score the alignments between the two
+        
+            * Algorithms: Kaiju uses the MEGAN algorithm for taxonomic classification, while Kraken2 uses a custom algorithm called "k-mer counting." 
+            The specific algorithm used can affect the speed and accuracy of the classification.
+            * Reference database: Kaiju and Kraken2 use different reference databases for taxonomic classification. 
+            Kaiju uses a database called "NINJA" (Non-redundant Improved and Normalized Just-in-time Annotations), 
+            which includes annotations for a wide variety of organisms.
+            Kraken2 uses a database called "Minikraken," 
+            which includes annotations for a more limited set of organisms but is more comprehensive for those organisms.
+            """,
+            name="Kaiju and Kraken",
+        )
+        megahit_info = pn.pane.Markdown(
+            f"""
+            ## MEGAHIT
+            MegaHit is a program for assembling DNA sequences, also known as "contigs," from raw sequencing data. 
+            It is designed to take a large number of short DNA sequences, called reads, 
+            and use them to reconstruct the full-length sequences from which they were derived.
+        
+            * MEGAHIT processes the raw sequencing data to filter out low-quality reads and remove contaminants.
+            * It aligns the reads to a set of known sequences called "k-mers," which are short, fixed-length substrings of the genome.
+            * Based on the alignments, MegaHit identifies overlaps between the reads and assembles them into longer contigs using a de Bruijn graph algorithm.
+            * The final output of MegaHit is a set of assembled contigs, which can be used for further analysis such as gene prediction or phylogenetic analysis.
+            """,
+            name="MEGAHIT",
+        )
+
+        cat_info = pn.pane.Markdown(
+            f"""
+            ## CAT
+            CAT is designed to identify the species or other taxonomic group of origin for a given DNA sequence, 
+            based on the presence or absence of specific genetic markers.
+        
+            * CAT uses a database of known genetic markers for different taxonomic groups to create a reference index.
+            * The DNA sequence to be classified is compared to the reference index using a sequence alignment algorithm, such as BLAST.
+            * CAT scores each alignment between the amplicon and the reference markers based on how well they match.
+            * The taxonomic group with the highest score is considered the most likely origin of the sequence.
+            """,
+            name="CAT",
+        )
+
+        # Header for this section
+        information_header = header(
+            text=f"## Information About Programs Used",
+            bg_color="#04c273",
+            height=80,
+            textalign="left",
+        )
+
+        # Section
+        information_tab = pn.Tabs(kaiju_and_kraken_info, megahit_info, cat_info)
+        information_section = pn.Column(information_header, information_tab)
+        return information_section
+
+    # --- Create the report --- #
+
+    # header
+    head = header(
+        text=f"""
+        # Pandemic Preparedness Report
+        ## Report of Sample {sample.parts[-1]}
+        """,
+        fontsize="20px",
+        bg_color="#011a01",
+        height=185,
+    )
+
+    builders = {
+        "Alignment Stats": build_alignment,
+        "Classification of Raw Reads": build_raw,
+        "Classification of Contigs": build_contigs,
+        "Alignment Coverage": build_coverage,
+        "Information About Programs": build_information,
+    }
+
+    sections = {} if sections is None else sections
+    start = time.monotonic()
+    tabs = []
+    for name, build in builders.items():
+        over_budget = budget is not None and time.monotonic() - start > budget
+        if name not in sections and preview and (name not in PREVIEW_TABS or over_budget):
+            tabs.append((name, pending(name)))
+            continue
+        if name not in sections:
+            sections[name] = build()
+        tabs.append((name, sections[name]))
+
+    if deferred_tabs:
+        tabs = tabs[:1] + [(name, deferred(section, name)) for name, section in tabs[1:]]
+
+    all_tabs = pn.Tabs(*tabs, tabs_location="left")
+
+    return pn.Column(
+        head,
+        pn.layout.Divider(),
+        all_tabs,
+    )
+
+
+# Build the report in memory
+def build_panel_report(
+    sample: str,
+    coverage_plot_path: str = None,
+    files: dict = None,
+    layout: pn.Column = None,
+    stream: BinaryIO = None,
+    deferred_tabs: bool = False,
+    svg_processor: svg_assets.SvgProcessor = None,
+    preview: bool = False,
+    budget: float = None,
+    sections: dict = None,
+) -> bytes:
+    """
+    Builds the Panel report of a sample in memory.
+
+    :param str sample: Path to the sample folder.
+    :param str coverage_plot_path: Folder with the coverage plots (<coverage_plot_path>/<sample name>/*.svg).
+    :param dict files: {artifact: path} used instead of searching the sample folder. Default = None
+    :param pn.Column layout: Already built layout (from panel_layout). Default = built from the sample folder
+    :param BinaryIO stream: If given, the report is also written to this stream. Default = None
+    :param bool deferred_tabs: Only render the hidden tabs when they are clicked. Default = False
+    :param SvgProcessor svg_processor: Optimizes the coverage plots before they are embedded. Default = None
+    :param bool preview: Only build the preview tabs (see panel_layout). Default = False
+    :param float budget: Seconds to build the preview in. Default = no limit
+    :param dict sections: Built sections, reused and added to (see panel_layout). Default = None
+    :return: bytes with the html report
+    """
+    sample_name = Path(sample).parts[-1]
+    if layout is None:
+        layout = panel_layout(
+            sample, coverage_plot_path, files, deferred_tabs, svg_processor, preview, budget, sections
+        )
+
+    page = io.StringIO()
+    layout.save(page, title=f"Report {sample_name}")
+
+    report = page.getvalue().encode()
+    if stream is not None:
+        stream.write(report)
+    return report
+
+
+# Generate the preview of the report
+def panel_preview(
+    sample: str,
+    coverage_plot_path: str,
+    outfolder: str,
+    files: dict = None,
+    deferred_tabs: bool = False,
+    svg_processor: svg_assets.SvgProcessor = None,
+    budget: float = None,
+    sections: dict = None,
+) -> dict:
+    """
+    Writes (atomically) a Panel report with only the preview tabs (see panel_layout) to
+    <outfolder>/<sample name>_report.html. Returns the built sections, to be reused by panel_report.
+    """
+    sections = {} if sections is None else sections
+    report = build_panel_report(
+        sample,
+        coverage_plot_path,
+        files,
+        deferred_tabs=deferred_tabs,
+        svg_processor=svg_processor,
+        preview=True,
+        budget=budget,
+        sections=sections,
+    )
+    atomic_write.write_atomic(Path(outfolder) / f"{Path(sample).parts[-1]}_report.html", report)
+    return sections
+
+
+# Generate the report
+def panel_report(
+    sample: str,
+    coverage_plot_path: str,
+    outfolder: str,
+    files: dict = None,
+    deferred_tabs: bool = False,
+    svg_processor: svg_assets.SvgProcessor = None,
+    preview: bool = False,
+    budget: float = None,
+    sections: dict = None,
+) -> None:
+    """
+    Generates Panel report and writes it (atomically) to <outfolder>/<sample name>_report.html
+    With `preview` the preview of the report (see panel_preview) is written first and then replaced by the full
+    report. The sections of the preview, or `sections` from an earlier panel_preview, are reused.
+    """
+    if preview and sections is None:
+        sections = panel_preview(
+            sample, coverage_plot_path, outfolder, files, deferred_tabs, svg_processor, budget
+        )
+
+    sample_name = Path(sample).parts[-1]
+    report = build_panel_report(
+        sample,
+        coverage_plot_path,
+        files,
+        deferred_tabs=deferred_tabs,
+        svg_processor=svg_processor,
+        sections=sections,
+    )
+    outfile = Path(outfolder) / f"{sample_name}_report.html"
+    atomic_write.write_atomic(outfile, report)
+
+
+def panel_job(sample: str, sample_files: dict = None, **options) -> None:
+    """
+    Job of the batch runner (utils/scheduler.py): panel_report with the artifacts of the sample from `sample_files`
+    ({sample name: files}). A module level function with picklable arguments, so it also runs in worker processes
+    that are spawned rather than forked.
+    """
+    files = sample_files.get(Path(sample).name) if sample_files else None
+    panel_report(sample, files=files, **options)
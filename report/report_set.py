@@ -0,0 +1,270 @@
+import gzip
+import json
+from pathlib import Path
+from report.html_report import STYLE, TABLE_JS, load_report_data
+from utils import atomic_write, chart_cache
+
+# Charts in the report: {id of the div: key in the report data}
+CHARTS = {
+    "aligned": "bowtie_plot",
+    "kraken_raw": "kraken_raw",
+    "kaiju_raw": "kaiju_raw",
+    "megahit_histo": "megahit_histogram",
+    "gc_histo": "gc_histogram",
+    "kaiju_and_cat": "kaiju_and_cat",
+}
+
+# Number of samples kept in memory in the browser
+CACHED_SAMPLES = 10
+
+
+def sample_bundle(data: dict) -> dict:
+    """
+    Returns the data of one sample as it is sent to the viewer: the charts as Vega-Lite specs, the fastp and assembly
+    statistics tables as html and the contig table as json chunks.
+    """
+    return {
+        "sample_name": data["sample_name"],
+        "total_reads": data["total_reads"],
+        "number_aligned": data["number_aligned"],
+        "number_unaligned": data["number_unaligned"],
+        "charts": {div: json.loads(data[key]) for div, key in CHARTS.items()},
+        "fastp_df": data["fastp_df"],
+        "assembly_stats": data["assembly_stats"],
+        "cat_kaiju_df": json.loads(data["cat_kaiju_df"]),
+    }
+
+
+def cohort_row(data: dict) -> dict:
+    """
+    Returns the row of the sample in the cohort table of the index page.
+    """
+    total = data["total_reads"]
+    return {
+        "sample": data["sample_name"],
+        "total_reads": total,
+        "aligned": data["number_aligned"],
+        "percent_aligned": round(data["number_aligned"] / total * 100, 2) if total else None,
+        "unaligned": data["number_unaligned"],
+    }
+
+
+def failed_row(sample_name: str, error: str) -> dict:
+    """
+    Returns the row of a sample whose report could not be built.
+    """
+    return {"sample": sample_name, "error": error}
+
+
+def render_index(rows: list[dict]) -> str:
+    """
+    Renders the index page with the sample picker, the cohort table and the viewer.
+    Samples that failed are listed in the cohort table with their error, but can not be selected.
+    """
+    # json in a <script> must not close the script
+    samples = json.dumps(rows).replace("</", "<\\/")
+    return f"""<!DOCTYPE html>
+<html>
+    <head>
+        <title>Pandemic Prepardeness Report</title>
+        <script src="https://cdn.jsdelivr.net/npm/vega@5"></script>
+        <script src="https://cdn.jsdelivr.net/npm/vega-lite@4"></script>
+        <script src="https://cdn.jsdelivr.net/npm/vega-embed@6"></script>
+        <style>
+{STYLE}
+                #cohort tr.sample-row {{
+                cursor: pointer;
+                }}
+                #cohort tr.selected td {{
+                background-color: #e0f0e0;
+                }}
+                #cohort tr.failed td {{
+                color: #b00020;
+                }}
+                .chart {{
+                display:flex;justify-content:center;align-items:center;width:100%;height:100%;margin:40px;
+                }}
+        </style>
+    </head>
+    <body>
+        <header>
+            <h1>Pandemic Prepardeness Report</h1>
+            <h2 id="title">{len(rows)} samples</h2>
+            <select id="picker"></select>
+        </header>
+
+        <h2>Samples</h2>
+        <table id="cohort" style="margin: auto;">
+            <tr>
+                <th>Sample</th>
+                <th>Total reads pairs</th>
+                <th>Reads aligned to human genome</th>
+                <th>Reads NOT aligned to human genome</th>
+            </tr>
+        </table>
+
+        <div id="report" style="display:none;">
+            <hr />
+            <h2>Information about Reads</h2>
+            <table id="reads" style="margin-bottom:30px;"></table>
+            <div id="aligned" class="chart"></div>
+
+            <h2>Information from fastp</h2>
+            <div id="fastp_df" style="margin: auto;"></div>
+
+            <hr />
+            <h2>Raw reads classfied with Kraken and Kaiju</h2>
+            <h3>Kraken classification</h3>
+            <div id="kraken_raw" class="chart"></div>
+            <h3>Kaiju classification</h3>
+            <div id="kaiju_raw" class="chart"></div>
+
+            <hr />
+            <h2>Contig information</h2>
+            <h3>Histogram of megahit contigs</h3>
+            <div id="megahit_histo" class="chart"></div>
+            <h3>Assembly statistics</h3>
+            <div id="assembly_stats" style="margin: auto;"></div>
+            <h3>GC content of contigs</h3>
+            <div id="gc_histo" class="chart"></div>
+            <h3>Contigs classified with Kaiju and CAT</h3>
+            <div id="kaiju_and_cat" class="chart"></div>
+            <h3>Table containing information about contigs</h3>
+            <div id="cat_kaiju_df"></div>
+        </div>
+
+        <script type="text/javascript">
+            const samples = {samples};
+            const charts = {json.dumps(list(CHARTS))};
+            const maxCached = {CACHED_SAMPLES};
+            // recently viewed samples, oldest first
+            const cache = new Map();
+            let current = null;
+            {TABLE_JS}
+
+            const fmt = (x) => x.toLocaleString("en-US");
+
+            async function loadBundle(name) {{
+                if (cache.has(name)) {{
+                    const bundle = cache.get(name);
+                    cache.delete(name);
+                    cache.set(name, bundle);
+                    return bundle;
+                }}
+                const response = await fetch(`data/${{encodeURIComponent(name)}}.json.gz`);
+                let bytes = new Uint8Array(await response.arrayBuffer());
+                // the server may already have decompressed the file (Content-Encoding: gzip)
+                if (bytes[0] === 0x1f && bytes[1] === 0x8b) {{
+                    const stream = new Blob([bytes]).stream().pipeThrough(new DecompressionStream("gzip"));
+                    bytes = new Uint8Array(await new Response(stream).arrayBuffer());
+                }}
+                const bundle = JSON.parse(new TextDecoder().decode(bytes));
+                cache.set(name, bundle);
+                if (cache.size > maxCached) {{
+                    cache.delete(cache.keys().next().value);
+                }}
+                return bundle;
+            }}
+
+            async function show(name) {{
+                current = name;
+                const bundle = await loadBundle(name);
+                // another sample was selected while loading
+                if (current !== name) return;
+
+                document.getElementById("picker").value = name;
+                document.getElementById("title").textContent = `Report of ${{name}}`;
+                document.querySelectorAll("#cohort tr.sample-row").forEach(
+                    (row) => row.classList.toggle("selected", row.dataset.sample === name)
+                );
+
+                const total = bundle.total_reads;
+                const pct = (x) => total ? (x / total * 100).toFixed(2) : "0.00";
+                document.getElementById("reads").innerHTML = `
+                    <tr><th>Total reads pairs</th><th>Reads aligned to human genome</th><th>Reads NOT aligned to human genome</th></tr>
+                    <tr><td>${{fmt(total)}}</td>
+                        <td>${{fmt(bundle.number_aligned)}} (${{pct(bundle.number_aligned)}}%)</td>
+                        <td>${{fmt(bundle.number_unaligned)}} (${{pct(bundle.number_unaligned)}}%)</td></tr>`;
+                document.getElementById("fastp_df").innerHTML = bundle.fastp_df;
+                document.getElementById("assembly_stats").innerHTML = bundle.assembly_stats;
+                renderTable(document.getElementById("cat_kaiju_df"), bundle.cat_kaiju_df);
+                document.getElementById("report").style.display = "block";
+                for (const chart of charts) {{
+                    vegaEmbed(`#${{chart}}`, bundle.charts[chart]);
+                }}
+            }}
+
+            const picker = document.getElementById("picker");
+            const cohort = document.getElementById("cohort");
+            for (const row of samples) {{
+                const tr = cohort.insertRow();
+                // the sample name and the error are text, not html
+                tr.insertCell().textContent = row.sample;
+                if (row.error !== undefined) {{
+                    tr.className = "failed";
+                    const cell = tr.insertCell();
+                    cell.colSpan = 3;
+                    cell.textContent = `Failed: ${{row.error}}`;
+                    continue;
+                }}
+                picker.add(new Option(row.sample, row.sample));
+                tr.className = "sample-row";
+                tr.dataset.sample = row.sample;
+                // no percent without reads
+                const pctAligned = row.percent_aligned === null ? "n/a" : `${{row.percent_aligned}}%`;
+                const cells = [fmt(row.total_reads), `${{fmt(row.aligned)}} (${{pctAligned}})`, fmt(row.unaligned)];
+                for (const text of cells) {{
+                    tr.insertCell().textContent = text;
+                }}
+                tr.addEventListener("click", () => show(row.sample));
+            }}
+            picker.addEventListener("change", () => show(picker.value));
+            const first = samples.find((row) => row.error === undefined);
+            if (first) show(first.sample);
+        </script>
+    </body>
+</html>
+"""
+
+
+def build_report_set(
+    samples: list,
+    out_dir: str,
+    threads: int = 1,
+    files: dict = None,
+    cache: chart_cache.ChartCache = None,
+) -> dict[str, str]:
+    """
+    Builds a report set: one index page with a sample picker and a cohort table (<out_dir>/index.html),
+    and one gzipped json bundle per sample (<out_dir>/data/<sample>.json.gz) that the page only fetches
+    when the sample is selected.
+    The bundles are fetched, so the folder has to be served (e.g. python -m http.server) rather than opened as a file.
+
+    :param list samples: Paths to the sample folders.
+    :param str out_dir: Folder to write the report set to.
+    :param int threads: Number of threads to load each sample with. Default = 1
+    :param dict files: {sample: {artifact: path}}, e.g. from the manifest. Default = None
+    :param ChartCache cache: Chart cache. Default = None
+    :return: {sample: error} of the samples whose data could not be loaded, which are listed as failed in the cohort table
+    """
+    out_dir = Path(out_dir)
+    (out_dir / "data").mkdir(parents=True, exist_ok=True)
+    files = files or {}
+
+    rows, failures = [], {}
+    for sample in samples:
+        try:
+            data = load_report_data(sample, threads=threads, files=files.get(sample), cache=cache)
+            bundle = json.dumps(sample_bundle(data)).encode()
+        except Exception as e:
+            # one broken sample does not stop the others
+            failures[Path(sample).name] = f"{type(e).__name__}: {e}"
+            rows.append(failed_row(Path(sample).name, failures[Path(sample).name]))
+            continue
+        atomic_write.write_atomic(
+            out_dir / "data" / f"{data['sample_name']}.json.gz", gzip.compress(bundle, mtime=0)
+        )
+        rows.append(cohort_row(data))
+
+    atomic_write.write_atomic(out_dir / "index.html", render_index(rows).encode())
+    return failures
@@ -0,0 +1,56 @@
+import gc
+import sys
+
+# Modules that keep the parsed files of a sample in memory, with their cached function
+FILE_CACHES = {"utils.cat_lineage": "_cached", "utils.assembly_stats": "_cached"}
+
+
+def clear_file_caches() -> None:
+    """
+    Clears the parsed CAT tables and assembly statistics kept in memory per file.
+    Only modules that are already imported are cleared.
+    """
+    for module, cached in FILE_CACHES.items():
+        if module in sys.modules:
+            getattr(sys.modules[module], cached).cache_clear()
+    gc.collect()
+
+
+def reset_panel() -> None:
+    """
+    Clears the documents Panel keeps of every saved report (pn.state._views).
+    """
+    if "panel" in sys.modules:
+        import panel as pn
+
+        # private to Panel: other versions may not have it
+        views = getattr(pn.state, "_views", None)
+        if views is not None:
+            views.clear()
+
+
+def reset() -> None:
+    """
+    Resets the global state the report libraries keep between reports, so a process that builds many reports
+    does not grow with every sample:
+
+    * the parsed CAT tables and assembly statistics kept in memory per file
+    * the documents Panel keeps of every saved report (pn.state._views)
+    * the altair data transformer, back to the one the plotting modules enable (no row limit)
+
+    Only modules that are already imported are reset, so importing this module is cheap.
+    Only call it while no report is being built.
+    """
+    reset_panel()
+    if "panel" in sys.modules:
+        import panel as pn
+
+        pn.state.clear_caches()
+
+    if "altair" in sys.modules:
+        import altair as alt
+
+        # one call, so reports built at the same time never see the row limit
+        alt.data_transformers.enable("default", max_rows=None)
+
+    clear_file_caches()
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# the tests import the modules of the repository like the scripts do, from its root
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,192 @@
+import random
+import zlib
+
+import pytest
+from report import archive
+
+
+def report(number: int, lines: int = 400) -> bytes:
+    # reports share their layout and differ in the values
+    random.seed(number)
+    rows = "".join(f"<tr><td>contig_{i}</td><td>{random.random():.6f}</td></tr>\n" for i in range(lines))
+    return f"<html><head><style>td {{ padding: 4px; }}</style></head><body><table>\n{rows}</table></body></html>\n".encode()
+
+
+def write_reports(folder, numbers):
+    folder.mkdir(exist_ok=True)
+    files = {}
+    for number in numbers:
+        files[f"sample{number}-report.html"] = folder / f"sample{number}-report.html"
+        files[f"sample{number}-report.html"].write_bytes(report(number))
+    return files
+
+
+def test_split_chunks_round_trip():
+    data = report(1, lines=3000) + b"x" * 200_000
+    chunks = archive.split_chunks(data)
+    assert b"".join(chunks) == data
+    assert all(len(chunk) <= archive.MAX_CHUNK for chunk in chunks)
+    assert all(len(chunk) >= archive.MIN_CHUNK for chunk in chunks[:-1])
+
+
+def test_split_chunks_cuts_shared_content_the_same():
+    shared = report(1, lines=2000)
+    first, second = archive.split_chunks(b"first\n" + shared), archive.split_chunks(b"second report\n" + shared)
+    assert len(set(first) & set(second)) > len(first) // 2
+
+
+def test_add_and_extract(tmp_path):
+    files = write_reports(tmp_path / "reports", range(3))
+    pack = tmp_path / "reports.pack"
+    assert archive.add(pack, files) == {name: "added" for name in files}
+    with archive.Archive(pack) as reports:
+        assert reports.names() == sorted(files)
+        for name, file in files.items():
+            assert reports.read(name) == file.read_bytes()
+        output = reports.extract("sample1-report.html", tmp_path / "out")
+    assert output.read_bytes() == files["sample1-report.html"].read_bytes()
+
+
+def test_versions(tmp_path):
+    files = write_reports(tmp_path / "reports", [1])
+    pack = tmp_path / "reports.pack"
+    archive.add(pack, files)
+    assert archive.add(pack, files) == {"sample1-report.html": "unchanged"}
+    first = files["sample1-report.html"].read_bytes()
+    files["sample1-report.html"].write_bytes(report(2))
+    assert archive.add(pack, files) == {"sample1-report.html": "updated"}
+
+    with archive.Archive(pack) as reports:
+        assert len(reports.versions("sample1-report.html")) == 2
+        assert reports.read("sample1-report.html") == report(2)
+        assert reports.read("sample1-report.html", 0) == first
+        assert reports.read("sample1-report.html", -2) == first
+        with pytest.raises(IndexError):
+            reports.read("sample1-report.html", 2)
+        with pytest.raises(KeyError):
+            reports.read("missing.html")
+
+
+def test_interrupted_add(tmp_path):
+    pack = tmp_path / "reports.pack"
+    archive.add(pack, write_reports(tmp_path / "reports", [1]))
+    size = pack.stat().st_size
+    archive.add(pack, write_reports(tmp_path / "reports", [2]))
+    # the second add stopped before its footer was written
+    with open(pack, "r+b") as f:
+        f.truncate(pack.stat().st_size - archive.FOOTER.size // 2)
+    assert pack.stat().st_size > size
+
+    with archive.Archive(pack) as reports:
+        assert reports.names() == ["sample1-report.html"]
+    files = write_reports(tmp_path / "reports", [2, 3])
+    assert archive.add(pack, files) == {name: "added" for name in files}
+    with archive.Archive(pack) as reports:
+        assert reports.names() == ["sample1-report.html", "sample2-report.html", "sample3-report.html"]
+        assert reports.read("sample2-report.html") == report(2)
+
+
+def test_adding_one_report_at_a_time_grows_linearly(tmp_path):
+    pack = tmp_path / "reports.pack"
+    sizes = []
+    for number in range(40):
+        archive.add(pack, write_reports(tmp_path / "reports", [number]))
+        sizes.append(pack.stat().st_size)
+    growth = [b - a for a, b in zip(sizes, sizes[1:])]
+    # each add stores about one report, not the index of all reports before it
+    assert max(growth[-5:]) < 1.5 * max(growth[:5])
+
+    with archive.Archive(pack) as reports:
+        assert reports.stats()["segments"] == 40
+        assert reports.read("sample39-report.html") == report(39)
+
+
+def test_reports_are_found_without_reading_the_segments(tmp_path, monkeypatch):
+    pack = tmp_path / "reports.pack"
+    for number in range(5):
+        archive.add(pack, write_reports(tmp_path / "reports", [number]))
+    tables = []
+    with archive.Archive(pack) as reports:
+        read_json = reports._read_json
+        monkeypatch.setattr(reports, "_read_json", lambda *x: tables.append(x) or read_json(*x))
+        # only the chunk list of the report, whatever its age
+        assert reports.read("sample4-report.html") == report(4)
+        assert reports.read("sample0-report.html") == report(0)
+        assert len(tables) == 2
+
+
+def test_add_does_not_read_the_segments_again(tmp_path, monkeypatch):
+    pack = tmp_path / "reports.pack"
+    for number in range(5):
+        archive.add(pack, write_reports(tmp_path / "reports", [number]))
+    tables = []
+    read_json = archive._read_json
+    monkeypatch.setattr(archive, "_read_json", lambda *x: tables.append(x[1:]) or read_json(*x))
+    files = write_reports(tmp_path / "reports", [0, 5])
+    assert archive.add(pack, files) == {"sample0-report.html": "unchanged", "sample5-report.html": "added"}
+    # the last segment table, to find the end of the archive
+    assert len(tables) == 1
+
+
+def test_index_is_rebuilt_from_the_segments(tmp_path):
+    pack = tmp_path / "reports.pack"
+    archive.add(pack, write_reports(tmp_path / "reports", [1, 2]))
+    stale = archive.index_path(pack).read_bytes()
+    archive.add(pack, write_reports(tmp_path / "reports", [3]))
+    with archive.Archive(pack) as reports:
+        for index in [None, stale]:
+            # a missing index, or the index of an earlier add
+            archive.index_path(pack).unlink(missing_ok=True)
+            if index is not None:
+                archive.index_path(pack).write_bytes(index)
+            reports._stat = None
+            reports._index = archive._empty_index()
+            reports.refresh()
+            assert reports.names() == ["sample1-report.html", "sample2-report.html", "sample3-report.html"]
+            assert reports.read("sample1-report.html") == report(1)
+    # chunks stored before are not stored again
+    size = pack.stat().st_size
+    files = write_reports(tmp_path / "copy", [1])
+    assert archive.add(pack, {"copy.html": files["sample1-report.html"]}) == {"copy.html": "added"}
+    assert pack.stat().st_size - size < len(report(1)) // 10
+
+
+def test_open_archive_sees_the_reports_added_since(tmp_path):
+    pack = tmp_path / "reports.pack"
+    archive.add(pack, write_reports(tmp_path / "reports", [1]))
+    with archive.Archive(pack) as reports:
+        archive.add(pack, write_reports(tmp_path / "reports", [2]))
+        files = write_reports(tmp_path / "reports", [1, 3])
+        files["sample1-report.html"].write_bytes(report(4))
+        archive.add(pack, files)
+        # the new segments are read from the pack file
+        archive.index_path(pack).unlink()
+        reports.refresh()
+        assert reports.names() == ["sample1-report.html", "sample2-report.html", "sample3-report.html"]
+        assert [reports.read("sample1-report.html", version) for version in (0, 1)] == [report(1), report(4)]
+
+
+def test_corrupt_chunk_is_detected(tmp_path):
+    pack = tmp_path / "reports.pack"
+    archive.add(pack, write_reports(tmp_path / "reports", [1]))
+    with archive.Archive(pack) as reports:
+        chunks = reports._read_json(*reports.latest("sample1-report.html")["entry"])
+        offset, length, dictionary, crc = chunks["chunks"][0]
+        dictionary = tuple(chunks["dictionaries"][dictionary])
+        with pytest.raises(ValueError, match="corrupt"):
+            reports.chunk(offset, length, dictionary, crc ^ 1)
+        assert zlib.crc32(reports.chunk(offset, length, dictionary, crc)) == crc
+
+
+def test_runs_are_named_apart(tmp_path):
+    for run in ("run1", "run2"):
+        write_reports(tmp_path / run, [1])
+    pack = tmp_path / "reports.pack"
+    for run in ("run1", "run2"):
+        files = archive.run_names(tmp_path / run, ["sample1-report.html", "sample2-report.html"])
+        assert list(files) == [f"{run}/sample1-report.html"]
+        assert archive.add(pack, files) == {f"{run}/sample1-report.html": "added"}
+    assert list(archive.run_names(tmp_path / "run1", ["sample1-report.html"], run="first")) == [
+        "first/sample1-report.html"
+    ]
+    assert list(archive.report_files([tmp_path / "run1"])) == ["run1/sample1-report.html"]
@@ -0,0 +1,100 @@
+import gzip
+import json
+import numpy as np
+import pandas as pd
+import pytest
+from plotting import contig_quality
+from utils import assembly_stats
+
+
+def naive_nx(lengths, x):
+    lengths = np.sort(lengths)[::-1]
+    bases = np.cumsum(lengths)
+    i = np.searchsorted(bases, lengths.sum() * x / 100)
+    return int(lengths[i]), int(i + 1)
+
+
+@pytest.fixture
+def lengths():
+    rng = np.random.default_rng(3)
+    return np.concatenate([rng.integers(200, 5000, 3000), rng.integers(5000, 200_000, 40), [2_000_000]])
+
+
+def test_statistics_are_exact(lengths):
+    stats = assembly_stats.AssemblyStats()
+    # added in chunks, like the readers do
+    for chunk in np.array_split(lengths, 7):
+        stats.add(chunk)
+
+    assert stats.contigs == len(lengths)
+    assert stats.total_length == lengths.sum()
+    for q in [0, 0.1, 0.25, 0.5, 0.75, 1]:
+        assert stats.quantile(q) == pytest.approx(np.quantile(lengths, q))
+    assert stats.nx(50) == naive_nx(lengths, 50)
+    assert stats.nx(90) == naive_nx(lengths, 90)
+    assert stats.above(5000) == (int((lengths >= 5000).sum()), int(lengths[lengths >= 5000].sum()))
+
+    histogram = stats.histogram(step=500)
+    counts, _ = np.histogram(lengths, bins=np.append(histogram.start, histogram.end.iloc[-1]))
+    assert histogram["count"].tolist() == counts.tolist()
+    assert histogram.start.iloc[0] == 0 and histogram.end.iloc[-1] == 2_000_500
+
+
+def test_memory_is_bounded_by_the_distinct_lengths():
+    stats = assembly_stats.AssemblyStats()
+    stats.add([10**12, 5, 5])
+    stats.add([5, 10**12])
+    assert stats.lengths.tolist() == [5, 10**12]
+    assert stats.length_counts.tolist() == [3, 2]
+    assert stats.nx(50) == (10**12, 2)
+
+
+def test_empty_assembly():
+    stats = assembly_stats.AssemblyStats()
+    assert stats.contigs == 0 and stats.total_length == 0
+    assert stats.nx(50) == (0, 0)
+    assert np.isnan(stats.quantile(0.5))
+    assert stats.histogram().empty
+
+
+def write_contigs(tmp_path, sequences):
+    csv = tmp_path / "contigs.csv"
+    pd.DataFrame(
+        {"name": [f"k141_{i}" for i in range(len(sequences))], "length": [len(x) for x in sequences], "sequence": sequences}
+    ).to_csv(csv, index=False)
+    fasta = tmp_path / "contigs.fa.gz"
+    lines = []
+    for i, sequence in enumerate(sequences):
+        # sequences wrapped at 7 bases
+        lines += [f">k141_{i} len={len(sequence)}"] + [sequence[j:j + 7] for j in range(0, len(sequence), 7)]
+    fasta.write_bytes(gzip.compress(("\n" + "\n".join(lines) + "\n").encode()))
+    return csv, fasta
+
+
+SEQUENCES = ["ATGCGC", "GGGGCCCCAT", "ATATATAT", "gcgcAT" * 5]
+
+
+def test_fasta_and_csv_give_the_same_statistics(tmp_path):
+    csv, fasta = write_contigs(tmp_path, SEQUENCES)
+    from_csv = assembly_stats.from_csv(csv)
+    from_fasta = assembly_stats.from_fasta(fasta, chunksize=3)
+    assert from_csv.table().equals(from_fasta.table())
+    assert from_fasta.gc_counts.tolist() == from_csv.gc_counts.tolist()
+    # 67%, 80%, 0% and 67% GC
+    assert {gc: count for gc, count in enumerate(from_fasta.gc_counts) if count} == {0: 1, 67: 2, 80: 1}
+    assert from_fasta.gc_content() == pytest.approx(100 * (4 + 8 + 0 + 20) / 54)
+
+
+def test_sequence_before_the_first_header_is_rejected(tmp_path):
+    fasta = tmp_path / "contigs.fa"
+    fasta.write_text("ACGT\n>k141_0\nACGT\n")
+    with pytest.raises(ValueError, match="before the first FASTA header"):
+        assembly_stats.from_fasta(fasta)
+
+
+def test_gc_content_chart(tmp_path):
+    csv, _ = write_contigs(tmp_path, SEQUENCES)
+    spec = json.loads(contig_quality.gc_content_histogram(str(csv)).to_json())
+    (data,) = spec["datasets"].values()
+    assert {row["gc"]: row["count"] for row in data if row["count"]} == {0: 1, 67: 2, 80: 1}
+    assert spec["encoding"]["x"]["title"] == "GC content (%)"
@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+from utils import cat_lineage
+
+HEADER = "# contig\tclassification\treason\tlineage\tlineage scores\tsuperkingdom\tphylum\tclass\torder\tfamily\tgenus\tspecies\n"
+ROWS = [
+    "k141_0\tno taxid assigned\tno ORFs found\t\t\t\t\t\t\t\t\t\n",
+    "k141_1\ttaxid assigned\tbased on 2/2 ORFs\t1;10239;2731341;2001\t1.00;1.00;0.95;0.91\tViruses: 1.00\tPhylumA: 1.00\tClassA: 0.99\tOrderA: 0.98\tFamily1: 0.97\tGenus1: 0.96\tVirus species 1: 0.91\n",
+    "k141_2\ttaxid assigned\tbased on 1/3 ORFs\t1;2*;1224*\t1.00;0.60;0.40\tBacteria*: 0.60\tno support\tno support\tno support\tno support\tno support\tno support\n",
+    "k141_3\ttaxid assigned\tbased on 2/2 ORFs\t1;10239;2731341;2002\t1.00;1.00;0.95;0.50\tViruses: 1.00\tPhylumA: 1.00\tClassA: 0.99\tOrderA: 0.98\tFamily1: 0.97\tGenus2: 0.96\tno support\n",
+]
+
+
+@pytest.fixture
+def cat_file(tmp_path):
+    file = tmp_path / "contigs_names.txt"
+    file.write_text(HEADER + "".join(ROWS))
+    return file
+
+
+@pytest.fixture(autouse=True)
+def no_cache(monkeypatch):
+    monkeypatch.delenv(cat_lineage.CACHE_VARIABLE, raising=False)
+    monkeypatch.delenv(cat_lineage.CACHE_SIZE_VARIABLE, raising=False)
+    cat_lineage._cached.cache_clear()
+
+
+def test_starred_taxids_are_parsed(cat_file):
+    table = cat_lineage.parse(cat_file)
+    assert table.lineage.tolist() == [
+        [-1, -1, -1, -1],
+        [1, 10239, 2731341, 2001],
+        [1, 2, 1224, -1],
+        [1, 10239, 2731341, 2002],
+    ]
+    assert table.starred.tolist() == [
+        [False] * 4,
+        [False] * 4,
+        [False, True, True, False],
+        [False] * 4,
+    ]
+    np.testing.assert_allclose(table.lineage_scores[2], [1.0, 0.6, 0.4, np.nan])
+
+
+def test_counts_and_last_level(cat_file):
+    table = cat_lineage.parse(cat_file)
+    assert table.counts("superkingdom").to_dict() == {"Viruses": 2, "Bacteria*": 1}
+    assert table.counts("genus", min_score=0.5).to_dict() == {"Genus1": 1, "Genus2": 1}
+    assert table.counts("species").to_dict() == {"Virus species 1": 1}
+    assert table.last_level().tolist() == ["", "Virus species 1", "Bacteria*", "Genus2"]
+
+
+def test_tables_are_not_saved_by_default(cat_file, tmp_path, monkeypatch):
+    monkeypatch.setenv("HOME", str(tmp_path / "home"))
+    cat_lineage.rank_table(cat_file)
+    assert not (tmp_path / "home").exists()
+    assert not list(tmp_path.rglob("*.npz"))
+
+
+def test_cached_table_is_the_parsed_table(cat_file, tmp_path):
+    cat_lineage.set_cache_dir(tmp_path / "cache")
+    parsed = cat_lineage.rank_table(cat_file)
+    assert len(list((tmp_path / "cache").glob("*.npz"))) == 1
+
+    cat_lineage._cached.cache_clear()
+    loaded = cat_lineage.rank_table(cat_file)
+    assert loaded is not parsed
+    for name in ["contigs", "assigned", "lineage", "starred", "codes"]:
+        assert np.array_equal(getattr(loaded, name), getattr(parsed, name))
+    np.testing.assert_array_equal(loaded.lineage_scores, parsed.lineage_scores)
+    assert loaded.counts("genus").equals(parsed.counts("genus"))
+
+
+def test_least_recently_used_table_is_removed(cat_file, tmp_path):
+    cat_lineage.set_cache_dir(tmp_path / "cache")
+    cat_lineage.rank_table(cat_file)
+    (first,) = (tmp_path / "cache").glob("*.npz")
+
+    other = tmp_path / "other.txt"
+    other.write_text(HEADER + "".join(reversed(ROWS)))
+    cat_lineage.set_cache_dir(tmp_path / "cache", max_bytes=int(first.stat().st_size * 1.5))
+    cat_lineage.rank_table(other)
+    (kept,) = (tmp_path / "cache").glob("*.npz")
+    assert kept != first
+
@@ -0,0 +1,100 @@
+import importlib
+import sys
+
+from utils import chart_cache
+
+
+def make_modules(folder):
+    (folder / "chartdeps_helper.py").write_text("def rows():\n    return 3\n")
+    (folder / "chartdeps_other.py").write_text("VALUE = 1\n")
+    (folder / "chartdeps_plot.py").write_text(
+        "import chartdeps_helper\nimport chartdeps_other\nCOLOR = 'red'\n\n"
+        "def build(file):\n    return open(file).read() * chartdeps_helper.rows() + COLOR\n"
+    )
+
+
+def load(name):
+    sys.modules.pop(name, None)
+    return importlib.import_module(name)
+
+
+def test_key_follows_the_modules_the_builder_uses(tmp_path, monkeypatch):
+    monkeypatch.setattr(chart_cache, "REPO_DIR", tmp_path)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    make_modules(tmp_path)
+    data = tmp_path / "data.txt"
+    data.write_text("x")
+
+    plot = load("chartdeps_plot")
+    sources, modules = chart_cache.dependencies(plot.build)
+    # the builder does not use chartdeps_other, although its module imports it
+    assert [x.name for x in modules] == ["chartdeps_helper.py"]
+    assert "COLOR = 'red'" in sources
+
+    cache = chart_cache.ChartCache(tmp_path / "cache")
+    key = cache.key(plot.build, [data], {})
+    assert cache.get_or_build(plot.build, [data]) == "xxxred"
+
+    # an unrelated module changed: same key
+    (tmp_path / "chartdeps_other.py").write_text("VALUE = 2\n")
+    assert chart_cache.ChartCache(tmp_path / "cache").key(plot.build, [data], {}) == key
+
+    # a module the builder uses changed: new key
+    (tmp_path / "chartdeps_helper.py").write_text("def rows():\n    return 4\n")
+    assert chart_cache.ChartCache(tmp_path / "cache").key(plot.build, [data], {}) != key
+
+
+def test_cached_result_is_reused_until_the_input_changes(tmp_path):
+    calls = []
+
+    data = tmp_path / "data.txt"
+    data.write_text("a")
+    cache = chart_cache.ChartCache(tmp_path / "cache")
+    build = lambda file: calls.append(file) or open(file).read().upper()  # noqa: E731
+
+    assert cache.get_or_build(build, [data]) == "A"
+    assert cache.get_or_build(build, [data]) == "A"
+    assert len(calls) == 1
+    data.write_text("b")
+    assert cache.get_or_build(build, [data]) == "B"
+    assert len(calls) == 2
+
+
+def test_eviction_keeps_the_cache_below_max_bytes(tmp_path):
+    cache = chart_cache.ChartCache(tmp_path / "cache", max_bytes=250)
+    for i in range(5):
+        file = tmp_path / f"in{i}.txt"
+        file.write_text(str(i) * 100)
+        cache.get_or_build(lambda x: open(x).read(), [file])
+    assert sum(x.stat().st_size for x in (tmp_path / "cache").glob("*.json")) <= 250
+
+
+def test_folder_is_listed_again_only_above_max_bytes(tmp_path, monkeypatch):
+    cache = chart_cache.ChartCache(tmp_path / "cache", max_bytes=250)
+    scans = []
+    evict = cache.evict
+    monkeypatch.setattr(cache, "evict", lambda: scans.append(1) or evict())
+    for i in range(5):
+        file = tmp_path / f"in{i}.txt"
+        file.write_text(str(i) * 60)
+        cache.get_or_build(lambda x: open(x).read(), [file])
+    # at the first insert, and when the fifth entry goes above 250 bytes
+    assert len(scans) == 2
+    assert len(list((tmp_path / "cache").glob("*.json"))) == 4
+
+
+def test_file_hashes_are_kept_for_the_next_run(tmp_path, monkeypatch):
+    data = tmp_path / "data.txt"
+    data.write_text("a")
+    build = lambda file: open(file).read().upper()  # noqa: E731
+    assert chart_cache.ChartCache(tmp_path / "cache").get_or_build(build, [data]) == "A"
+
+    hashed = []
+    file_hash = chart_cache.file_hash
+    monkeypatch.setattr(chart_cache, "file_hash", lambda file: hashed.append(file) or file_hash(file))
+    assert chart_cache.ChartCache(tmp_path / "cache").get_or_build(build, [data]) == "A"
+    assert hashed == []
+
+    data.write_text("bb")
+    assert chart_cache.ChartCache(tmp_path / "cache").get_or_build(build, [data]) == "BB"
+    assert hashed == [data]
@@ -0,0 +1,77 @@
+import numpy as np
+import pandas as pd
+import pytest
+from plotting import contig_quality
+
+
+@pytest.fixture
+def coverage_file(tmp_path):
+    rng = np.random.default_rng(1)
+    frames = []
+    for contig, length in [("k141_1", 300), ("k141_2", 1800), ("k141_3", 12000)]:
+        frames.append(
+            pd.DataFrame(
+                {
+                    "contig": contig,
+                    "position": np.arange(1, length + 1),
+                    "coverage": rng.integers(0, 100, length),
+                    "length": length,
+                }
+            )
+        )
+    file = tmp_path / "coverage.csv"
+    pd.concat(frames).to_csv(file, index=False)
+    return file
+
+
+def test_lttb_keeps_the_ends_and_the_peaks():
+    x = np.arange(1000, dtype=float)
+    y = np.zeros(1000)
+    y[[137, 512, 901]] = [50, -40, 80]
+    keep = contig_quality.lttb(x, y, 50)
+    assert len(keep) == 50
+    assert keep[0] == 0 and keep[-1] == 999
+    assert np.all(np.diff(keep) > 0)
+    assert {137, 512, 901} <= set(keep)
+
+
+def test_lttb_keeps_short_lines():
+    assert contig_quality.lttb(np.arange(5.0), np.arange(5.0), 10).tolist() == [0, 1, 2, 3, 4]
+
+
+def test_binned_coverage_summarises_every_window(coverage_file):
+    raw = pd.read_csv(coverage_file)
+    binned = contig_quality.binned_coverage(coverage_file, points=50)
+    assert binned.groupby("contig").size().max() <= 50
+    for contig, windows in binned.groupby("contig"):
+        coverage = raw.loc[raw.contig == contig, "coverage"]
+        assert windows["min"].min() == coverage.min()
+        assert windows["max"].max() == coverage.max()
+        # every window of a contig has the same width, except the last
+        assert np.isclose(windows.coverage.mean(), coverage.mean(), rtol=0.05)
+    assert (binned["min"] <= binned.coverage).all() and (binned.coverage <= binned["max"]).all()
+
+
+def test_windows_split_over_chunks_are_merged(coverage_file):
+    whole = contig_quality.binned_coverage(coverage_file, points=50)
+    chunked = contig_quality.binned_coverage(coverage_file, points=50, chunksize=997)
+    # the contig column is categorical when the file is read in one chunk
+    pd.testing.assert_frame_equal(whole.astype({"contig": str}), chunked.astype({"contig": str}))
+
+
+def test_lttb_method_keeps_points_per_contig(coverage_file):
+    binned = contig_quality.binned_coverage(coverage_file, points=40, method="lttb")
+    assert binned.groupby("contig").size().to_dict() == {"k141_1": 40, "k141_2": 40, "k141_3": 40}
+
+
+def test_empty_coverage_file(tmp_path):
+    file = tmp_path / "coverage.csv"
+    file.write_text("contig,position,coverage,length\n")
+    assert contig_quality.binned_coverage(file).empty
+
+
+def test_coverage_facet_plots_the_downsampled_coverage(coverage_file):
+    plots = contig_quality.megahit_contig_coverage_facet(coverage_file, points=50)
+    assert len(plots) == 3
+    data = plots[2].to_dict()["datasets"]
+    assert sum(len(rows) for rows in data.values()) <= 50
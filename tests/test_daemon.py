@@ -0,0 +1,134 @@
+import json
+import socket
+import threading
+from pathlib import Path
+
+import pytest
+from report import daemon, state
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    calls = []
+    monkeypatch.setattr(state, "clear_file_caches", lambda: calls.append("clear_file_caches"))
+    monkeypatch.setattr(state, "reset_panel", lambda: calls.append("reset_panel"))
+    return calls
+
+
+@pytest.fixture
+def backends(monkeypatch):
+    backends = {
+        "html": lambda job: Path(job["output"]) / "html-report.html",
+        "panel": lambda job: Path(job["output"]) / "panel_report.html",
+    }
+    monkeypatch.setattr(daemon, "load_backends", lambda cache=None: backends)
+    return backends
+
+
+def job(backend="html"):
+    return {"sample": "sample1", "output": "out", "backend": backend}
+
+
+def test_jobs_keep_the_file_caches(tmp_path, calls, backends):
+    with daemon.ReportServer(tmp_path / "worker.sock", jobs=2) as server:
+        assert server.build(job("html"))["status"] == "done"
+        assert calls == []
+        assert server.build(job("panel"))["status"] == "done"
+        assert calls == ["reset_panel"]
+
+
+def test_file_caches_are_cleared_above_max_rss(tmp_path, calls, backends):
+    with daemon.ReportServer(tmp_path / "worker.sock", jobs=2, max_rss=0) as server:
+        server.build(job("html"))
+    assert calls == ["clear_file_caches"]
+
+
+def test_file_caches_are_not_cleared_while_another_job_runs(tmp_path, calls, backends):
+    started, release = threading.Event(), threading.Event()
+
+    def slow(job):
+        started.set()
+        release.wait(10)
+        return Path(job["output"]) / "slow-report.html"
+
+    with daemon.ReportServer(tmp_path / "worker.sock", jobs=2, max_rss=0) as server:
+        server.backends["slow"] = slow
+        thread = threading.Thread(target=server.build, args=(job("slow"),))
+        thread.start()
+        assert started.wait(10)
+        assert server.build(job("html"))["status"] == "done"
+        assert calls == []
+        release.set()
+        thread.join(10)
+    assert calls == ["clear_file_caches"]
+
+
+def test_failed_job_still_resets_panel(tmp_path, calls, backends):
+    def broken(job):
+        raise ValueError("broken sample")
+
+    backends["panel"] = broken
+    with daemon.ReportServer(tmp_path / "worker.sock") as server:
+        response = server.build(job("panel"))
+    assert response["status"] == "failed"
+    assert "broken sample" in response["error"]
+    assert server.failed == 1
+    assert calls == ["reset_panel"]
+
+
+@pytest.fixture
+def worker(tmp_path, backends):
+    socket_path = tmp_path / "worker.sock"
+    server = daemon.ReportServer(socket_path, jobs=2)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    yield socket_path
+    server.shutdown()
+    thread.join(10)
+    server.server_close()
+
+
+def test_submit_and_ping(worker, tmp_path):
+    result = daemon.submit(tmp_path / "sample1", tmp_path / "out", socket_path=worker, timeout=10)
+    assert result["status"] == "done"
+    assert result["report"] == str(tmp_path / "out" / "html-report.html")
+    status = daemon.request({"command": "ping"}, worker, timeout=10)
+    assert status["status"] == "running"
+    assert (status["done"], status["failed"]) == (1, 0)
+
+
+def test_invalid_jobs_fail(worker):
+    assert "Unknown backend" in daemon.request({**job(), "backend": "pdf"}, worker, timeout=10)["error"]
+    assert daemon.request({"sample": "sample1"}, worker, timeout=10)["error"] == "The job has no 'output'"
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(str(worker))
+        client.sendall(b"not json\n")
+        response = json.loads(client.makefile("rb").readline())
+    assert response["status"] == "failed"
+    assert response["error"].startswith("Invalid message")
+
+
+def test_stop(tmp_path, backends):
+    socket_path = tmp_path / "worker.sock"
+    server = daemon.ReportServer(socket_path)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    assert daemon.request({"command": "stop"}, socket_path, timeout=10) == {"status": "stopping"}
+    thread.join(10)
+    assert not thread.is_alive()
+    server.server_close()
+    assert not socket_path.exists()
+    with pytest.raises(ConnectionError):
+        daemon.request({"command": "ping"}, socket_path, timeout=10)
+
+
+def test_stale_socket_is_replaced(worker, tmp_path, backends):
+    # a worker is listening
+    with pytest.raises(RuntimeError, match="already listening"):
+        daemon.remove_stale_socket(worker)
+    # a socket file without a worker
+    stale = tmp_path / "stale.sock"
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as dead:
+        dead.bind(str(stale))
+    with daemon.ReportServer(stale) as server:
+        assert server.socket_path == stale
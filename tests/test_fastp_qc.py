@@ -0,0 +1,119 @@
+import subprocess
+import sys
+from pathlib import Path
+import pytest
+from utils import manifest, parse_fastp_report, qc_table
+
+ROOT = Path(__file__).resolve().parent.parent
+
+SECTIONS = {
+    "general": {"fastp version:": "0.23.2", "duplication rate:": "1.5%"},
+    "before_filtering": {"total reads:": "12.3 M", "Q30 bases:": "900.1 M (91.2%)"},
+    "after_filtering": {"total reads:": "11.9 M", "GC content:": "45.6%"},
+    "filtering_result": {"reads passed filters:": "11.9 M (96.7%)", "reads with too many N:": "1.2 K (0.0%)"},
+}
+
+
+def fastp_html(sections=SECTIONS, tail=""):
+    tables = "".join(
+        '<div class="section_div"><table class="summary_table">'
+        + "".join(f'<tr><td class="col1">{k}</td><td class="col2">{v}</td></tr>' for k, v in values.items())
+        + "</table></div>"
+        for values in sections.values()
+    )
+    head = "<html><head><script>var other_table = '</table>';</script></head><body>"
+    return head + tables + "<table><tr><td>plot data</td></tr></table>" + tail + "</body></html>"
+
+
+def reference_summary_html(text):
+    # the summary tables found in the whole report at once
+    end = text.find("summary_table")
+    for _ in SECTIONS:
+        end = text.find("</table>", end + 1)
+    return text[: end + len("</table>")]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 7, 8, 13, 50, 64 * 1024])
+def test_summary_html_across_chunks(tmp_path, chunk_size):
+    text = fastp_html(tail="x" * 500)
+    report = tmp_path / "fastp.html"
+    report.write_text(text)
+    summary = parse_fastp_report._summary_html(report, chunk_size=chunk_size)
+    assert summary == reference_summary_html(text)
+    assert summary.endswith("96.7%)</td></tr><tr><td class=\"col1\">reads with too many N:</td><td class=\"col2\">1.2 K (0.0%)</td></tr></table>")
+
+
+def test_summary_of_a_report_without_summary_tables(tmp_path):
+    report = tmp_path / "fastp.html"
+    report.write_text("<html><body>no summary</body></html>")
+    assert parse_fastp_report._summary_html(report, chunk_size=4) == report.read_text()
+    assert parse_fastp_report.parse_summary(report) == {}
+
+
+def test_parse_summary(tmp_path):
+    report = tmp_path / "fastp.html"
+    report.write_text(fastp_html())
+    assert parse_fastp_report.parse_summary(report) == SECTIONS
+
+
+def write_sample(results, name, fastp):
+    (results / name / "bowtie").mkdir(parents=True)
+    (results / name / "fastp").mkdir()
+    (results / name / "bowtie" / f"{name}_bowtie_raw.log").write_text(
+        "100000 reads; of these:\n  100000 (100.00%) were paired; of these:\n12.50% overall alignment rate\n"
+    )
+    (results / name / "fastp" / f"{name}.html").write_text(fastp)
+
+
+def test_qc_table_returns_the_samples_that_failed(tmp_path):
+    results = tmp_path / "results"
+    write_sample(results, "good_S1", fastp_html())
+    # a summary row without a value
+    write_sample(results, "bad_S2", fastp_html().replace('<td class="col2">0.23.2</td>', ""))
+    table, failures = qc_table.update(results, tmp_path / "qc.csv", tmp_path / "manifest.json", threads=2)
+
+    assert list(table.index) == ["good_S1"]
+    assert table.at["good_S1", "total_reads"] == 100000
+    assert table.at["good_S1", "before_filtering_q30_bases"] == 900.1e6
+    assert table.at["good_S1", "before_filtering_q30_bases_percent"] == 91.2
+    assert list(failures) == ["bad_S2"]
+    assert failures["bad_S2"].startswith("IndexError")
+
+    # the failed sample is parsed again at the next update
+    write_sample(results, "fixed", fastp_html())
+    (results / "bad_S2" / "fastp" / "bad_S2.html").write_text(fastp_html())
+    table, failures = qc_table.update(results, tmp_path / "qc.csv", tmp_path / "manifest.json")
+    assert sorted(table.index) == ["bad_S2", "fixed", "good_S1"]
+    assert failures == {}
+
+
+def test_qc_table_cli_exits_with_an_error_if_a_sample_failed(tmp_path):
+    results = tmp_path / "results"
+    write_sample(results, "good_S1", fastp_html())
+    write_sample(results, "bad_S2", fastp_html().replace('<td class="col2">0.23.2</td>', ""))
+    command = [sys.executable, str(ROOT / "virusHanter-qc-table.py"), "--results", str(results), "--output", str(tmp_path / "qc.csv")]
+    run = subprocess.run(command, capture_output=True, text=True)
+    assert run.returncode != 0
+    assert "bad_S2: IndexError" in run.stderr
+    assert "QC table of 1 samples" in run.stdout
+
+    (results / "bad_S2" / "fastp" / "bad_S2.html").write_text(fastp_html())
+    assert subprocess.run(command, capture_output=True).returncode == 0
+
+
+def test_qc_table_of_a_results_folder_without_samples(tmp_path):
+    results = tmp_path / "results"
+    results.mkdir()
+    table, failures = qc_table.update(results)
+    assert table.empty and list(table.columns) == ["signature"]
+    assert failures == {}
+
+
+def test_default_qc_table_does_not_change_the_results_folder(tmp_path):
+    results = tmp_path / "results"
+    write_sample(results, "good_S1", fastp_html())
+    qc_table.update(results)
+    # so the manifest does not list the samples again at the next update
+    assert manifest.load(results / ".virushanter" / "manifest.json")["root_mtime"] == results.stat().st_mtime
+    table_file = next((results / ".virushanter").glob("qc.*"))
+    assert qc_table.load(table_file).index.tolist() == ["good_S1"]
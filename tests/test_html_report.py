@@ -0,0 +1,158 @@
+import io
+import json
+import re
+import shutil
+import subprocess
+
+import panel as pn
+import pytest
+from report import html_report, panel_report
+
+SPEC = {"mark": "bar", "data": {"values": [{"name": "a</script>", "count": 1}]}}
+
+TABLE = {"columns": ["name", "length"], "chunks": [json.dumps([[0, "k141_1", 1500]])]}
+
+
+@pytest.fixture
+def data():
+    chart = json.dumps(SPEC)
+    return {
+        "sample_name": "sample1",
+        "total_reads": 1000,
+        "number_aligned": 250,
+        "number_unaligned": 750,
+        "bowtie_plot": chart,
+        "fastp_df": "<table><tr><td>fastp</td></tr></table>",
+        "megahit_histogram": chart,
+        "assembly_stats": "<table><tr><td>N50</td></tr></table>",
+        "gc_histogram": chart,
+        "kaiju_raw": chart,
+        "kraken_raw": chart,
+        "kaiju_and_cat": chart,
+        "cat_kaiju_df": json.dumps(TABLE),
+        "svg": "",
+    }
+
+
+def test_build_report_returns_the_report(tmp_path, monkeypatch, data):
+    monkeypatch.chdir(tmp_path)
+    stream = io.BytesIO()
+    report = html_report.build_report(data=data, stream=stream)
+    assert isinstance(report, bytes)
+    assert report.startswith(b"\n    <!DOCTYPE html>")
+    assert b"Report of sample1" in report
+    assert stream.getvalue() == report
+    # nothing is written to disk
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_written_report_is_the_built_report(tmp_path, data):
+    html_report.html_template_report(out_path=tmp_path, **data)
+    assert (tmp_path / "sample1-report.html").read_bytes() == html_report.build_report(data=data)
+    # written atomically, no temporary file is left
+    assert [x.name for x in tmp_path.iterdir()] == ["sample1-report.html"]
+
+
+def test_build_panel_report_returns_the_report():
+    stream = io.BytesIO()
+    layout = pn.Column(pn.pane.Markdown("# Report of sample1"))
+    report = panel_report.build_panel_report("sample1", layout=layout, stream=stream)
+    assert report.lstrip().startswith(b"<!DOCTYPE html>")
+    assert b"<title>Report sample1</title>" in report
+    assert stream.getvalue() == report
+
+
+def containers(report: str) -> dict:
+    # {id of the container: its spec} of the charts and tables stored as json in the page
+    found = re.findall(r'<div id="([^"]+)" data-spec="([^"]+)"', report)
+    return {
+        id: json.loads(re.search(f'<script type="application/json" id="{spec}">(.*?)</script>', report, re.S).group(1))
+        for id, spec in found
+    }
+
+
+def test_charts_are_stored_as_json(data):
+    report = html_report.build_report(data=data).decode()
+    specs = containers(report)
+    assert set(specs) == {"aligned", "kraken_raw", "kaiju_raw", "megahit_histo", "gc_histo", "kaiju_and_cat", "cat_kaiju_df"}
+    assert specs["aligned"] == SPEC
+    assert specs["cat_kaiju_df"] == TABLE
+    # the json does not close its script
+    assert "a</script>" not in report
+    assert report.count('<script defer src="https://cdn.jsdelivr.net/npm/vega') == 3
+
+
+def test_eager_report_does_not_defer_the_vega_scripts(data):
+    report = html_report.build_report(data={**data, "lazy": False}).decode()
+    assert "<script defer" not in report
+    assert "if (!false ||" in report
+
+
+def test_pending_sections_have_no_json(data):
+    report = html_report.build_report(data={**data, "gc_histogram": None, "cat_kaiju_df": None}).decode()
+    assert "gc_histo" not in containers(report)
+    assert 'id="gc_histo" class="pending"' in report
+    assert 'http-equiv="refresh"' in report
+
+
+# Enough DOM to run the script of the report in node: the containers, an IntersectionObserver that is
+# triggered by hand and a vegaEmbed that records what it renders.
+NODE_DOM = """
+const specs = SPECS;
+const elements = {};
+for (const id of Object.keys(specs)) {
+    elements[id] = {id, dataset: {spec: `${id}-spec`}};
+    elements[`${id}-spec`] = {textContent: JSON.stringify(specs[id])};
+}
+const rendered = [];
+let loaded = null;
+let observer = null;
+globalThis.window = globalThis;
+globalThis.document = {
+    getElementById: (id) => elements[id],
+    querySelectorAll: () => Object.keys(specs).map((id) => elements[id]),
+    addEventListener: (type, f) => { loaded = f; },
+};
+globalThis.vegaEmbed = (el, spec) => { rendered.push(el.id); return Promise.resolve(); };
+globalThis.IntersectionObserver = class {
+    constructor(callback) { this.callback = callback; this.observed = []; observer = this; }
+    observe(el) { this.observed.push(el); }
+    unobserve(el) { this.observed.splice(this.observed.indexOf(el), 1); }
+};
+// only observed containers are reported, like a real IntersectionObserver
+const scroll = (id) => observer.callback(
+    observer.observed.filter((el) => el.id === id).map((el) => ({isIntersecting: true, target: el}))
+);
+"""
+
+NODE_CHECK = """
+loaded();
+const atLoad = rendered.slice();
+if (observer) {
+    scroll("kaiju_raw");
+    scroll("kaiju_raw");
+}
+console.log(JSON.stringify({atLoad, rendered, observed: observer ? observer.observed.length : null}));
+"""
+
+
+def run_page(report: str, tmp_path) -> dict:
+    script = re.search(r'<script type="text/javascript">(.*?)</script>', report, re.S).group(1)
+    charts = {id: spec for id, spec in containers(report).items() if id != "cat_kaiju_df"}
+    (tmp_path / "report.js").write_text(NODE_DOM.replace("SPECS", json.dumps(charts)) + script + NODE_CHECK)
+    return json.loads(subprocess.run(["node", str(tmp_path / "report.js")], capture_output=True, check=True).stdout)
+
+
+@pytest.mark.skipif(shutil.which("node") is None, reason="needs node")
+def test_charts_are_rendered_when_they_scroll_into_view(tmp_path, data):
+    report = html_report.build_report(data={**data, "cat_kaiju_df": None}).decode()
+    result = run_page(report, tmp_path)
+    assert result == {"atLoad": [], "rendered": ["kaiju_raw"], "observed": 5}
+
+
+@pytest.mark.skipif(shutil.which("node") is None, reason="needs node")
+def test_eager_report_renders_every_chart_at_load(tmp_path, data):
+    report = html_report.build_report(data={**data, "cat_kaiju_df": None, "lazy": False}).decode()
+    result = run_page(report, tmp_path)
+    charts = ["aligned", "kraken_raw", "kaiju_raw", "megahit_histo", "gc_histo", "kaiju_and_cat"]
+    assert result == {"atLoad": charts, "rendered": charts, "observed": None}
@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+import pytest
+from plotting import kaiju_raw
+from utils import schemas
+
+
+def chart_rows(chart) -> list[dict]:
+    return next(iter(chart.to_dict()["datasets"].values()))
+
+
+def grouped(file: str, cutoff: float, number: int) -> list[dict]:
+    # the list aggregating groupby over the whole table that bar_chart_kaiju_raw replaces
+    df = (
+        schemas.read_table("kaiju_raw", file)
+        .groupby(["taxon_id", "percent", "taxon_name", "reads"], as_index=False, observed=True)
+        .agg(taxonomy=("taxonomy", list))
+        .sort_values("percent", ascending=False)
+        .loc[lambda x: x.percent > cutoff]
+    )
+    return chart_rows(kaiju_raw.alt.Chart(df.head(number)).mark_bar())
+
+
+@pytest.fixture(params=range(3))
+def kaiju_file(request, tmp_path):
+    rng = np.random.default_rng(request.param)
+    taxa = pd.DataFrame(
+        {
+            "taxon_id": np.arange(40),
+            # few distinct values, so there are many ties on percent
+            "percent": rng.choice([0.005, 0.02, 0.05, 0.1], 40),
+            "taxon_name": [f"taxon {i}" for i in rng.permutation(40)],
+            "reads": rng.integers(1, 5, 40),
+        }
+    )
+    rows = taxa.loc[rng.integers(0, 40, 300)].assign(taxonomy=[f"lineage {i}" for i in rng.integers(0, 6, 300)])
+    file = tmp_path / "kaiju_raw.csv"
+    rows.to_csv(file, index=False)
+    return file
+
+
+@pytest.mark.parametrize("cutoff, number", [(0.01, 10), (0.0, 25), (0.06, 10)])
+def test_top_taxa_are_the_same_as_after_grouping(kaiju_file, cutoff, number):
+    rows = chart_rows(kaiju_raw.bar_chart_kaiju_raw(kaiju_file, cutoff=cutoff, number=number))
+    assert rows == grouped(kaiju_file, cutoff, number)
+    assert all(row["percent"] > cutoff for row in rows)
+    assert 0 < len(rows) <= number
@@ -0,0 +1,28 @@
+import os
+from pathlib import Path
+
+from utils import manifest
+
+
+def test_unchanged_results_folder_is_not_listed_again(tmp_path, monkeypatch):
+    results = tmp_path / "results"
+    for name in ["s1", "s2"]:
+        (results / name / "megahit").mkdir(parents=True)
+        (results / name / f"{name}_bowtie_raw.log").write_text("log")
+    first = manifest.update(results)
+    assert list(first["samples"]) == ["s1", "s2"]
+    # writing the manifest did not change the mtime of the results folder
+    assert first["root_mtime"] == results.stat().st_mtime
+
+    listed = []
+    iterdir = Path.iterdir
+    monkeypatch.setattr(Path, "iterdir", lambda self: listed.append(self) or iterdir(self))
+    assert manifest.update(results) == first
+    assert results not in listed
+
+    (results / "s3").mkdir()
+    # mtimes are coarser than the time between the updates
+    os.utime(results, (first["root_mtime"] + 1, first["root_mtime"] + 1))
+    assert list(manifest.update(results)["samples"]) == ["s1", "s2", "s3"]
+    assert results in listed
+    assert manifest.artifacts(first, results, "s1") == {"bowtie2log": results / "s1" / "s1_bowtie_raw.log"}
@@ -0,0 +1,123 @@
+import pandas as pd
+import pytest
+from utils import cat_lineage, native_formats, schemas
+
+# bracken -w report: percent, clade reads, direct reads, rank, taxid, indented name
+KRAKEN_REPORT = [
+    ("10.00", 100, 100, "U", 0, "unclassified"),
+    ("90.00", 900, 0, "R", 1, "root"),
+    ("60.00", 600, 0, "D", 10239, "  Viruses"),
+    ("60.00", 600, 0, "F", 10240, "    Poxviridae"),
+    ("60.00", 600, 600, "S", 10245, '      Vaccinia "virus"'),
+    ("30.00", 300, 0, "D", 2, "  Bacteria"),
+    ("30.00", 300, 300, "S", 562, "    Escherichia coli"),
+]
+
+KAIJU_TABLE = (
+    "file\tpercent\treads\ttaxon_id\ttaxon_name\n"
+    "sample.out\t60.000000\t600\t10245\tViruses;Poxviridae;Orthopoxvirus;Vaccinia \"virus\";\n"
+    "sample.out\t30.000000\t300\t562\tBacteria;NA;Enterobacteriaceae;Escherichia coli;\n"
+    "sample.out\t10.000000\t100\tNA\tunclassified\n"
+)
+
+CAT_NAMES = (
+    "# contig\tclassification\treason\tlineage\tlineage scores\tsuperkingdom\tphylum\tclass\torder\tfamily\tgenus\tspecies\n"
+    "k141_0\ttaxid assigned\tbased on 2/2 ORFs\t1;10239;10240;10245\t1.00;1.00;0.95;0.91\tViruses: 1.00\tno support\tno support\tno support\tPoxviridae: 0.95\tno support\tVaccinia virus: 0.91\n"
+    "k141_1\tno taxid assigned\tno ORFs found\t\t\t\t\t\t\t\t\t\n"
+    "k141_2\ttaxid assigned\tbased on 1/1 ORFs\t1;2;562\t1.00;0.80;0.60\tBacteria: 0.80\tno support\tno support\tno support\tno support\tno support\tno support\n"
+)
+
+
+@pytest.fixture
+def kraken_file(tmp_path):
+    file = tmp_path / "sample.breport"
+    file.write_text("".join("\t".join(map(str, row)) + "\n" for row in KRAKEN_REPORT))
+    return file
+
+
+@pytest.fixture
+def kaiju_file(tmp_path):
+    file = tmp_path / "sample_kaiju.tsv"
+    file.write_text(KAIJU_TABLE)
+    return file
+
+
+def test_detect(tmp_path, kraken_file, kaiju_file):
+    assert native_formats.detect(kraken_file) == "kraken_report"
+    assert native_formats.detect(kaiju_file) == "kaiju_table"
+    minimizers = tmp_path / "minimizers.kreport"
+    minimizers.write_text("60.00\t600\t0\t1200\t800\tD\t10239\t  Viruses\n")
+    assert native_formats.detect(minimizers) == "kraken_report"
+    cleaned = tmp_path / "bracken.csv"
+    cleaned.write_text("name,level,percent,domain,new_est_reads\n")
+    assert native_formats.detect(cleaned) is None
+
+
+def test_bracken_report_is_read_as_the_cleaned_table(kraken_file):
+    table = schemas.read_table("bracken_raw", kraken_file)
+    assert table.dtypes.astype(str).to_dict() == schemas.SCHEMAS["bracken_raw"]["dtypes"]
+    rows = table.set_index("name")
+    assert rows.loc['Vaccinia "virus"', "percent"] == pytest.approx(0.6)
+    assert rows.loc['Vaccinia "virus"', "new_est_reads"] == 600
+    # the domain comes from the indentation, with the names of the cleaned report
+    assert rows.loc['Vaccinia "virus"', "domain"] == "Virus"
+    assert rows.loc["Escherichia coli", "domain"] == "Bacteria"
+    assert rows["domain"].isna()[["unclassified", "root"]].all()
+
+
+def test_kaiju_table_is_read_as_the_cleaned_table(kaiju_file):
+    table = schemas.read_table("kaiju_raw", kaiju_file)
+    assert table.dtypes.astype(str).to_dict() == schemas.SCHEMAS["kaiju_raw"]["dtypes"]
+    vaccinia = table.loc[table.taxon_id == 10245]
+    assert vaccinia["taxonomy"].tolist() == ["Viruses", "Poxviridae", "Orthopoxvirus", 'Vaccinia "virus"']
+    assert set(vaccinia["taxon_name"]) == {'Vaccinia "virus"'}
+    assert vaccinia["percent"].tolist() == pytest.approx([0.6] * 4)
+    # the ranks a taxon does not have are left out
+    assert table.loc[table.taxon_id == 562, "taxonomy"].tolist() == ["Bacteria", "Enterobacteriaceae", "Escherichia coli"]
+    assert table.loc[table.taxon_id.isna(), "taxon_name"].tolist() == ["unclassified"]
+
+
+def test_merge_cat_kaiju(tmp_path, monkeypatch):
+    monkeypatch.delenv(cat_lineage.CACHE_VARIABLE, raising=False)
+    kaiju = tmp_path / "sample_megahit.out"
+    kaiju.write_text(
+        "C\tk141_0\t10245\t120\t10245\tP1\tFRAG\tViruses;Poxviridae;Orthopoxvirus;Vaccinia virus;\n"
+        "U\tk141_1\t0\n"
+        "C\tk141_2\t562\t80\t562\tP2\tFRAG\tBacteria;Enterobacteriaceae;Escherichia coli;\n"
+        "C\tk141_3\t562\t80\t562\tP3\tFRAG\tBacteria;Enterobacteriaceae;Escherichia coli;\n"
+    )
+    cat = tmp_path / "sample_contigs_names.txt"
+    cat.write_text(CAT_NAMES)
+    contigs = tmp_path / "sample_contigs.csv"
+    contigs.write_text("name,length,sequence\nk141_0,1500,ACGT\nk141_1,800,ACGT\nk141_2,600,ACGT\nk141_3,900,ACGT\n")
+
+    with pytest.warns(UserWarning, match="approximated"):
+        merged = cat_lineage.merge_cat_kaiju(kaiju, cat, contigs)
+    assert merged.dtypes.astype(str).to_dict() == schemas.SCHEMAS["cat_kaiju_merged"]["dtypes"]
+    assert merged.astype(object).to_dict("records") == [
+        {
+            "name": "k141_0",
+            "taxon_id": 10245,
+            "length": 1500,
+            "last_level_kaiju": "Vaccinia virus",
+            "last_level_cat": "Vaccinia virus",
+            "sequence": "ACGT",
+        },
+        {
+            "name": "k141_2",
+            "taxon_id": 562,
+            "length": 600,
+            "last_level_kaiju": "Escherichia coli",
+            "last_level_cat": "Bacteria",
+            "sequence": "ACGT",
+        },
+    ]
+
+
+def test_cleaned_csv_is_still_read(tmp_path):
+    file = tmp_path / "kaiju_raw.csv"
+    pd.DataFrame(
+        {"taxon_id": [1], "percent": [0.5], "taxon_name": ["Virus"], "reads": [10], "taxonomy": ["Viruses"]}
+    ).to_csv(file, index=False)
+    assert native_formats.detect(file) is None
+    assert schemas.read_table("kaiju_raw", file)["taxon_name"].tolist() == ["Virus"]
@@ -0,0 +1,98 @@
+import base64
+import gzip
+import json
+import re
+import shutil
+import subprocess
+import pandas as pd
+import panel as pn
+import pytest
+from report import panel_report
+
+
+def deferred_pane():
+    table = pn.widgets.Tabulator(pd.DataFrame({"name": ["a</script>"], "length": [1]}), name="Table")
+    return panel_report.deferred(pn.Column(pn.pane.Markdown("## Contigs"), table), "Contigs")
+
+
+def parts(pane):
+    target = re.search(r'<div id="([^"]+)"', pane.object).group(1)
+    payload = re.search(r'<script type="application/octet-stream" id="[^"]+">(.*?)</script>', pane.object, re.S).group(1)
+    loader = re.search(r'<script type="text/javascript">(.*?)</script>', pane.object, re.S).group(1)
+    return target, payload, loader
+
+
+def test_deferred_tab_is_gzipped_bokeh_json_of_the_tab():
+    target, payload, _ = parts(deferred_pane())
+    item = json.loads(gzip.decompress(base64.b64decode(payload)))
+    assert target == f"deferred-{item['root_id']}"
+    assert item["doc"]["roots"]["root_ids"] == [item["root_id"]]
+    types = {ref["type"] for ref in item["doc"]["roots"]["references"]}
+    assert {"Column", "panel.models.tabulator.DataTabulator"} <= types
+    # the data of the table is in the json
+    assert "a</script>" in json.dumps(item)
+
+
+# DOM with the container of a deferred tab, enough to run the loader in node
+NODE_DOM = """
+const listeners = [];
+const embedded = [];
+const target = {dataset: {}, offsetWidth: 800, visibility: "hidden"};
+const elements = {[TARGET]: target, [TARGET + "-item"]: {textContent: ITEM}};
+globalThis.document = {
+    getElementById: (id) => elements[id] || null,
+    addEventListener: (type, f) => listeners.push(f),
+    removeEventListener: (type, f) => listeners.splice(listeners.indexOf(f), 1),
+};
+globalThis.getComputedStyle = (el) => ({visibility: el.visibility});
+globalThis.requestAnimationFrame = (f) => f();
+// resolved when a tab is rendered, as the json is inflated asynchronously
+let rendered;
+const done = new Promise((resolve) => { rendered = resolve; });
+globalThis.Bokeh = {embed: {embed_item: (item, id) => { embedded.push([item.root_id, id]); rendered(); }}};
+const click = () => listeners.slice().forEach((f) => f());
+"""
+
+NODE_CHECK = """
+const before = embedded.length;
+click();
+const hidden = embedded.length;
+target.visibility = "visible";
+click();
+click();
+done.then(() => console.log(JSON.stringify({before, hidden, embedded, listeners: listeners.length})));
+"""
+
+
+@pytest.mark.skipif(shutil.which("node") is None, reason="needs node")
+def test_deferred_tab_is_rendered_once_when_shown(tmp_path):
+    target, payload, loader = parts(deferred_pane())
+    script = (
+        NODE_DOM.replace("TARGET", json.dumps(target)).replace("ITEM", json.dumps(payload))
+        + loader
+        + NODE_CHECK
+    )
+    (tmp_path / "loader.js").write_text(script)
+    result = json.loads(subprocess.run(["node", str(tmp_path / "loader.js")], capture_output=True, check=True).stdout)
+
+    root_id = json.loads(gzip.decompress(base64.b64decode(payload)))["root_id"]
+    assert result == {"before": 0, "hidden": 0, "embedded": [[root_id, target]], "listeners": 0}
+
+
+def test_deferred_tab_is_in_the_report_page():
+    layout = pn.Column(pn.Tabs(("First", pn.pane.Markdown("first")), ("Second", panel_report.deferred("second", "Second"))))
+    report = panel_report.build_panel_report("sample", layout=layout).decode()
+    assert "deferred-" in report
+    assert "<iframe" not in report
+
+
+def test_panel_job_reports_the_sample_with_its_files(tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setattr(panel_report, "panel_report", lambda sample, **options: calls.append((sample.name, options)))
+    sample_files = {"s1": {"bowtie2log": tmp_path / "s1.log"}}
+    for sample in [tmp_path / "s1", tmp_path / "s2"]:
+        panel_report.panel_job(sample, sample_files, coverage_plot_path=tmp_path, outfolder=tmp_path)
+    assert calls == [
+        ("s1", {"files": sample_files["s1"], "coverage_plot_path": tmp_path, "outfolder": tmp_path}),
+        ("s2", {"files": None, "coverage_plot_path": tmp_path, "outfolder": tmp_path}),
+    ]
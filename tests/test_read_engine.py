@@ -0,0 +1,85 @@
+import subprocess
+import sys
+from pathlib import Path
+import pandas as pd
+import pytest
+from utils import read_engine, schemas
+
+arrow = pytest.mark.skipif(read_engine.pa is None, reason="needs pyarrow")
+
+TABLES = {
+    "kaiju_megahit": (
+        "C\tk141_1\t10239\t1\t2\t3\t4\tViruses;Riboviria;\n"
+        "U\tk141_2\t0\n"
+        "C\tk141_3\t2\t1\t2\t3\t4\tBacteria;\"quoted\" name;\n"
+    ),
+    "cat_megahit": (
+        "# contig\tclassification\treason\tlineage\tlineage scores\tsuperkingdom\tphylum\tclass\torder\tfamily\tgenus\tspecies\n"
+        "k141_0\tno taxid assigned\tno ORFs found\t\t\t\t\t\t\t\t\t\n"
+        "k141_1\ttaxid assigned\tbased on 2/2 ORFs\t1;10239*\t1.00;0.50\tViruses: 1.00\tno support\tno support\tno support\tno support\tno support\tno support\n"
+    ),
+    "bracken_raw": "name,level,percent,domain,new_est_reads\nPhage,S,0.1,Virus,\nE. coli,S,0.30000000000000004,Bacteria,30\nNA,S,1e-3,Virus,7\n",
+    "contig_coverage": "contig,position,coverage,length\nk141_1,1,5,100\nk141_1,2,,100\nk141_2,1,3,50\n",
+}
+
+
+def test_default_engine_is_pandas(monkeypatch):
+    monkeypatch.delenv(read_engine.ENGINE_VARIABLE, raising=False)
+    assert read_engine.get_engine() == "pandas"
+
+
+@arrow
+def test_auto_engine_is_arrow_if_pyarrow_is_installed():
+    assert read_engine.get_engine("auto") == "arrow"
+
+
+def test_set_engine_is_seen_by_worker_processes(monkeypatch):
+    monkeypatch.delenv(read_engine.ENGINE_VARIABLE, raising=False)
+    read_engine.set_engine("auto")
+    code = "from utils import read_engine; print(read_engine.get_engine())"
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                         cwd=Path(__file__).resolve().parent.parent).stdout
+    assert out.strip() == read_engine.get_engine("auto")
+
+
+def test_unknown_engine_raises():
+    with pytest.raises(ValueError, match="Unknown read engine"):
+        read_engine.set_engine("polars")
+
+
+@arrow
+@pytest.mark.parametrize("kind", TABLES)
+def test_engines_read_the_same_table(tmp_path, kind):
+    file = tmp_path / f"{kind}.txt"
+    file.write_text(TABLES[kind])
+    pandas_table = schemas.read_table(kind, file, engine="pandas")
+    arrow_table = schemas.read_table(kind, file, engine="arrow")
+    pd.testing.assert_frame_equal(pandas_table, arrow_table)
+
+
+def test_worker_accepts_the_read_engines():
+    root = Path(__file__).resolve().parent.parent
+    out = subprocess.run(
+        [sys.executable, str(root / "virusHanter-worker.py"), "serve", "--help"], capture_output=True, text=True, check=True
+    ).stdout
+    assert "{" + ",".join(read_engine.ENGINES) + "}" in out
+
+
+@arrow
+@pytest.mark.parametrize("engine, falls_back", [("auto", True), ("arrow", False)])
+def test_only_the_auto_engine_falls_back_to_pandas(tmp_path, monkeypatch, engine, falls_back):
+    file = tmp_path / "table.csv"
+    file.write_text("a,b\n1,2\n3,4\n")
+
+    def invalid(file, **options):
+        raise read_engine.pa.ArrowInvalid("CSV parse error")
+
+    monkeypatch.setattr(read_engine, "_read_arrow", invalid)
+    monkeypatch.setenv(read_engine.ENGINE_VARIABLE, engine)
+    # given, or set in the environment
+    for given in [engine, None]:
+        if falls_back:
+            assert len(read_engine.read_csv(file, engine=given)) == 2
+        else:
+            with pytest.raises(read_engine.pa.ArrowInvalid):
+                read_engine.read_csv(file, engine=given)
@@ -0,0 +1,89 @@
+import json
+import re
+import shutil
+import subprocess
+import pytest
+from report import report_set
+
+
+def rows(name):
+    return [{"sample": name, "total_reads": 10, "aligned": 4, "percent_aligned": 40.0, "unaligned": 6}]
+
+
+def test_sample_name_does_not_close_the_script():
+    name = "x</script><b>bold</b>"
+    page = report_set.render_index(rows(name))
+    script = page.split('<script type="text/javascript">', 1)[1]
+    # the only closing tag of the script is its own
+    assert script.count("</script>") == 1
+    embedded = re.search(r"const samples = (.*);", script).group(1)
+    assert json.loads(embedded)[0]["sample"] == name
+
+
+def test_sample_name_is_not_inserted_as_html():
+    page = report_set.render_index(rows("<img src=x onerror=alert(1)>"))
+    script = page.split('<script type="text/javascript">', 1)[1].split("</script>", 1)[0]
+    cohort = script.split("for (const row of samples)", 1)[1]
+    assert "innerHTML" not in cohort
+    assert "textContent = text" in cohort
+
+
+@pytest.mark.skipif(shutil.which("node") is None, reason="needs node")
+def test_page_script_is_valid_javascript(tmp_path):
+    page = report_set.render_index(rows("a</script>'\"`${b}"))
+    script = page.split('<script type="text/javascript">', 1)[1].split("</script>", 1)[0]
+    (tmp_path / "page.js").write_text(script)
+    subprocess.run(["node", "--check", str(tmp_path / "page.js")], check=True)
+
+
+def test_failed_sample_is_a_row_of_the_cohort_table(tmp_path, monkeypatch):
+    def load(sample, **kwargs):
+        if sample.name == "broken":
+            raise ValueError("no bowtie2 log")
+        return {"sample_name": sample.name, "total_reads": 0, "number_aligned": 0, "number_unaligned": 0}
+
+    monkeypatch.setattr(report_set, "load_report_data", load)
+    monkeypatch.setattr(report_set, "sample_bundle", lambda data: data)
+    failures = report_set.build_report_set([tmp_path / "broken", tmp_path / "empty"], tmp_path / "out")
+    assert failures == {"broken": "ValueError: no bowtie2 log"}
+    assert [x.name for x in (tmp_path / "out" / "data").iterdir()] == ["empty.json.gz"]
+    page = (tmp_path / "out" / "index.html").read_text()
+    embedded = json.loads(re.search(r"const samples = (.*);", page).group(1))
+    assert embedded == [
+        {"sample": "broken", "error": "ValueError: no bowtie2 log"},
+        {"sample": "empty", "total_reads": 0, "aligned": 0, "percent_aligned": None, "unaligned": 0},
+    ]
+
+
+# Enough DOM to fill the cohort table and the picker in node, without showing a sample
+NODE_DOM = """
+const tables = {cohort: [], picker: []};
+const element = (id) => ({
+    insertRow: () => { const tr = {cells: []}; tr.insertCell = () => { const td = {}; tr.cells.push(td); return td; };
+        tr.addEventListener = () => {}; tr.dataset = {}; tables[id].push(tr); return tr; },
+    add: (option) => tables[id].push(option.value),
+    addEventListener: () => {},
+});
+globalThis.document = {getElementById: element, querySelectorAll: () => []};
+globalThis.Option = class { constructor(text, value) { this.value = value; } };
+"""
+
+
+@pytest.mark.skipif(shutil.which("node") is None, reason="needs node")
+def test_cohort_table_shows_failures_and_samples_without_reads(tmp_path):
+    page = report_set.render_index(
+        [
+            report_set.failed_row("broken", "ValueError: no bowtie2 log"),
+            report_set.cohort_row({"sample_name": "empty", "total_reads": 0, "number_aligned": 0, "number_unaligned": 0}),
+        ]
+    )
+    script = page.split('<script type="text/javascript">', 1)[1].split("</script>", 1)[0]
+    # the first sample that did not fail would be shown
+    script = script.replace("if (first) show(first.sample);", "")
+    check = "console.log(JSON.stringify({cohort: tables.cohort.map((tr) => tr.cells.map((td) => td.textContent)), picker: tables.picker}));"
+    (tmp_path / "page.js").write_text(NODE_DOM + script + check)
+    result = json.loads(subprocess.run(["node", str(tmp_path / "page.js")], capture_output=True, check=True).stdout)
+    assert result == {
+        "cohort": [["broken", "Failed: ValueError: no bowtie2 log"], ["empty", "0", "0 (n/a)", "0"]],
+        "picker": ["empty"],
+    }
@@ -0,0 +1,155 @@
+import os
+import pickle
+import signal
+import time
+from pathlib import Path
+
+import pytest
+
+from report import html_report
+from utils import chart_cache, scheduler
+
+
+def write_marker(sample, out_dir, text="done"):
+    Path(out_dir, Path(sample).name).write_text(f"{text} {os.getpid()}")
+
+
+def fail_on_b(sample, out_dir):
+    if Path(sample).name == "b":
+        raise ValueError("broken sample")
+    write_marker(sample, out_dir)
+
+
+def test_run_batch_with_spawned_workers(tmp_path):
+    samples = [tmp_path / name for name in "abc"]
+    results = scheduler.run_batch(
+        samples,
+        write_marker,
+        job_kwargs={"out_dir": tmp_path, "text": "spawned"},
+        max_workers=2,
+        estimates={x: 1 for x in samples},
+        start_method="spawn",
+    )
+    assert {x.name: r["status"] for x, r in results.items()} == {"a": "done", "b": "done", "c": "done"}
+    assert all((tmp_path / name).read_text().startswith("spawned") for name in "abc")
+
+
+def test_failed_sample_does_not_stop_the_batch(tmp_path):
+    samples = [tmp_path / name for name in "abc"]
+    results = scheduler.run_batch(
+        samples, fail_on_b, job_kwargs={"out_dir": tmp_path}, max_workers=2, estimates={x: 1 for x in samples}
+    )
+    assert results[tmp_path / "b"]["status"] == "failed"
+    assert "broken sample" in results[tmp_path / "b"]["error"]
+    assert results[tmp_path / "a"]["status"] == results[tmp_path / "c"]["status"] == "done"
+
+
+def test_report_job_and_its_arguments_are_picklable(tmp_path):
+    cache = chart_cache.ChartCache(tmp_path / "cache")
+    job_kwargs = {"sample_files": {"s1": {"bowtie2log": tmp_path / "x.log"}}, "out_path": tmp_path, "cache": cache}
+    job, kwargs = pickle.loads(pickle.dumps((html_report.report_job, job_kwargs)))
+    assert job is html_report.report_job
+    assert kwargs["cache"].folder == cache.folder
+    with kwargs["cache"]._lock:
+        pass
+
+
+def test_estimate_memory_weights_files_by_pattern(tmp_path):
+    files = {tmp_path / "s_cat_kaiju_merged.csv": 100, tmp_path / "s.log": 1000}
+    assert scheduler.estimate_memory(tmp_path, files) == scheduler.BASE_MEMORY + 800
+
+
+def report_idle_workers(sample, out_dir):
+    write_marker(sample, out_dir)
+    if Path(sample).name == "c":
+        alive = []
+        for name in "ab":
+            pid = int(Path(out_dir, name).read_text().split()[1])
+            try:
+                os.kill(pid, 0)
+                alive.append(pid)
+            except ProcessLookupError:
+                pass
+        Path(out_dir, "alive").write_text(" ".join(map(str, alive)))
+
+
+def test_idle_workers_are_stopped_when_the_sample_does_not_fit(tmp_path):
+    # a and b run together; once their memory is measured, c only fits without the second idle worker
+    samples = [tmp_path / name for name in "abc"]
+    results = scheduler.run_batch(
+        samples,
+        report_idle_workers,
+        job_kwargs={"out_dir": tmp_path},
+        max_workers=2,
+        memory_limit=1000,
+        estimates={x: 1 for x in samples},
+        max_tasks_per_worker=None,
+    )
+    assert all(r["status"] == "done" for r in results.values())
+    c_pid = int((tmp_path / "c").read_text().split()[1])
+    assert (tmp_path / "alive").read_text() == str(c_pid)
+
+
+def test_idle_worker_runs_the_next_sample(tmp_path):
+    samples = [tmp_path / name for name in "abc"]
+    scheduler.run_batch(
+        samples,
+        write_marker,
+        job_kwargs={"out_dir": tmp_path},
+        max_workers=1,
+        estimates={x: 1 for x in samples},
+        max_tasks_per_worker=None,
+    )
+    assert len({(tmp_path / name).read_text() for name in "abc"}) == 1
+
+
+def record_interval(sample, out_dir, fail=None):
+    start = time.time()
+    time.sleep(0.2)
+    Path(out_dir, Path(sample).name).write_text(f"{start} {time.time()}")
+    if fail == "memory" and Path(sample).name == "b":
+        raise MemoryError
+    if fail == "killed" and Path(sample).name == "b":
+        os.kill(os.getpid(), signal.SIGKILL)
+
+
+def intervals(out_dir, names):
+    return {name: tuple(map(float, Path(out_dir, name).read_text().split())) for name in names}
+
+
+def overlaps(interval, others):
+    return any(start < interval[1] and interval[0] < end for start, end in others)
+
+
+def test_samples_that_do_not_fit_run_one_at_a_time(tmp_path):
+    samples = [tmp_path / name for name in "abc"]
+    results = scheduler.run_batch(
+        samples,
+        record_interval,
+        job_kwargs={"out_dir": tmp_path},
+        max_workers=3,
+        memory_limit=10 * 1024**2,
+        estimates={x: 8 * 1024**2 for x in samples},
+    )
+    assert all(r["status"] == "done" for r in results.values())
+    times = intervals(tmp_path, "abc")
+    assert not any(overlaps(times[x], [times[y] for y in "abc" if y != x]) for x in "abc")
+
+
+@pytest.mark.parametrize("fail", ["memory", "killed"])
+def test_out_of_memory_sample_is_retried_alone(tmp_path, fail):
+    samples = [tmp_path / name for name in "abcd"]
+    results = scheduler.run_batch(
+        samples,
+        record_interval,
+        job_kwargs={"out_dir": tmp_path, "fail": fail},
+        max_workers=4,
+        memory_limit=2**40,
+        estimates={x: 1 for x in samples},
+    )
+    assert results[tmp_path / "b"]["status"] == "oom"
+    assert all(results[tmp_path / x]["status"] == "done" for x in "acd")
+    # the retry of b ran last, alone
+    times = intervals(tmp_path, "abcd")
+    assert not overlaps(times["b"], [times[x] for x in "acd"])
+    assert times["b"][0] >= max(times[x][1] for x in "acd")
@@ -0,0 +1,55 @@
+import pandas as pd
+import pytest
+
+from plotting import contig_quality
+from utils import assembly_stats, read_engine, schemas
+
+ENGINES = ["pandas"] + (["arrow"] if read_engine.pa is not None else [])
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_blank_counts_and_lengths_are_missing_values(tmp_path, engine):
+    file = tmp_path / "merged.csv"
+    file.write_text(
+        "name,taxon_id,length,last_level_kaiju,last_level_cat\n"
+        "k141_1,10239,1500,Virus a,Virus a\n"
+        "k141_2,,,Virus b,\n"
+    )
+    table = schemas.read_table("cat_kaiju_merged", file, engine=engine)
+    assert str(table["length"].dtype) == "UInt32"
+    assert table["length"].tolist()[0] == 1500
+    assert table["length"].isna().tolist() == [False, True]
+    assert table["taxon_id"].isna().tolist() == [False, True]
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_schema_dtypes(tmp_path, engine):
+    file = tmp_path / "bracken.csv"
+    file.write_text("name,level,percent,domain,new_est_reads\nPhage,S,0.25,Virus,10\nE. coli,S,0.75,Bacteria,30\n")
+    table = schemas.read_table("bracken_raw", file, engine=engine)
+    assert table.dtypes.astype(str).to_dict() == {
+        "name": "object",
+        "level": "category",
+        "percent": "float64",
+        "domain": "category",
+        "new_est_reads": "UInt32",
+    }
+    assert table["percent"].tolist() == [0.25, 0.75]
+
+
+def test_missing_required_column_raises(tmp_path):
+    file = tmp_path / "bracken.csv"
+    file.write_text("name,level,percent\nPhage,S,0.25\n")
+    with pytest.raises(ValueError):
+        schemas.read_table("bracken_raw", file)
+
+
+def test_rows_with_blank_lengths_are_skipped_by_the_streaming_readers(tmp_path):
+    contigs = tmp_path / "contigs.csv"
+    contigs.write_text("name,length\nk141_1,100\nk141_2,\nk141_3,300\n")
+    assert assembly_stats.from_csv(contigs).contigs == 2
+
+    coverage = tmp_path / "coverage.csv"
+    coverage.write_text("contig,position,coverage,length\nc1,1,5,2\nc1,2,7,2\nc1,,3,\n")
+    binned = contig_quality.binned_coverage(coverage, points=1)
+    assert binned[["min", "max"]].values.tolist() == [[5, 7]]
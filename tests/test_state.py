@@ -0,0 +1,30 @@
+import panel as pn
+from report import state
+from utils import cat_lineage
+
+
+def test_reset_panel_clears_the_saved_documents():
+    pn.state._views["report"] = object()
+    state.reset_panel()
+    assert pn.state._views == {}
+
+
+def test_reset_panel_without_views(monkeypatch):
+    # _views is private to Panel
+    monkeypatch.delattr(type(pn.state), "_views")
+    state.reset_panel()
+    state.reset()
+
+
+def test_clear_file_caches(tmp_path, monkeypatch):
+    monkeypatch.delenv(cat_lineage.CACHE_VARIABLE, raising=False)
+    file = tmp_path / "contigs_names.txt"
+    file.write_text(
+        "# contig\tclassification\treason\tlineage\tlineage scores\tsuperkingdom\tphylum\tclass\torder\tfamily\tgenus\tspecies\n"
+        "k141_1\ttaxid assigned\tbased on 2/2 ORFs\t1;10239\t1.00;1.00\tViruses: 1.00\tno support\tno support\tno support\tno support\tno support\tno support\n"
+    )
+    cat_lineage._cached.cache_clear()
+    cat_lineage.rank_table(file)
+    assert cat_lineage._cached.cache_info().currsize == 1
+    state.clear_file_caches()
+    assert cat_lineage._cached.cache_info().currsize == 0
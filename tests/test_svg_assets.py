@@ -0,0 +1,51 @@
+import numpy as np
+from utils import svg_assets
+
+
+SVG = """<svg xmlns="http://www.w3.org/2000/svg">
+    <!-- made by matplotlib -->
+    <metadata><dc>x</dc></metadata>
+    <g id="axes">
+        <text x="1" y="2"><tspan>Coverage of</tspan> <tspan font-weight="bold">NC_045512</tspan></text>
+        <text x="1" y="4"/>
+        <polyline points="0,0 1,0.01 2,0 3,0.01 4,0 10,10"/>
+    </g>
+</svg>
+"""
+
+
+def test_whitespace_between_tspans_is_kept():
+    svg = svg_assets.optimize_svg(SVG)
+    assert "<tspan>Coverage of</tspan> <tspan font-weight=\"bold\">NC_045512</tspan>" in svg
+
+
+def test_whitespace_between_structural_elements_is_removed():
+    svg = svg_assets.optimize_svg(SVG)
+    assert '<svg xmlns="http://www.w3.org/2000/svg"><g id="axes"><text' in svg
+    assert '<text x="1" y="4"/><polyline' in svg
+    assert "</g></svg>" in svg
+    assert "matplotlib" not in svg and "metadata" not in svg
+
+
+def test_polyline_is_simplified_within_tolerance():
+    svg = svg_assets.optimize_svg(SVG, tolerance=0.5)
+    assert 'points="0,0 4,0 10,10"' in svg
+
+
+def test_rdp_keeps_end_points_and_corners():
+    points = np.array([[0, 0], [1, 0.1], [2, 0], [2, 5], [2.1, 10]])
+    simplified = svg_assets.rdp(points, 0.5)
+    assert simplified[0].tolist() == [0, 0] and simplified[-1].tolist() == [2.1, 10]
+    assert [2, 0] in simplified.tolist()
+
+
+def test_processed_assets_are_cached_by_version(tmp_path, monkeypatch):
+    plot = tmp_path / "plot.svg"
+    plot.write_text(SVG)
+    processor = svg_assets.SvgProcessor(tmp_path / "assets")
+    asset = processor.process(plot)
+    assert processor.process(plot) == asset
+    assert asset.read_text() == svg_assets.optimize_svg(SVG)
+
+    monkeypatch.setattr(svg_assets, "ASSET_VERSION", svg_assets.ASSET_VERSION + 1)
+    assert processor.process(plot) != asset
@@ -0,0 +1,96 @@
+import threading
+import time
+from concurrent.futures import Future
+import pytest
+from utils import task_graph
+
+
+def counted(calls, name, result, wait=None):
+    def task(*args):
+        calls.append(name)
+        if wait is not None:
+            wait.wait(5)
+        return result(*args) if callable(result) else result
+
+    return task
+
+
+def test_tasks_get_the_results_of_their_dependencies():
+    calls = []
+    tasks = {
+        "file": (counted(calls, "file", "a.csv"), []),
+        "table": (counted(calls, "table", lambda file: f"table of {file}"), ["file"]),
+        "plot": (counted(calls, "plot", lambda file, table: (file, table)), ["file", "table"]),
+        "other": (counted(calls, "other", 1), []),
+    }
+    results = task_graph.run_task_graph(tasks, max_workers=2, targets=["plot"])
+    assert results == {"file": "a.csv", "table": "table of a.csv", "plot": ("a.csv", "table of a.csv")}
+    assert "other" not in calls
+
+    again = task_graph.run_task_graph(tasks, results=results)
+    assert again["other"] == 1
+    assert sorted(calls) == ["file", "other", "plot", "table"]
+
+
+def test_unknown_and_circular_dependencies_raise():
+    with pytest.raises(ValueError, match="unknown"):
+        task_graph.run_task_graph({"a": (lambda x: x, ["missing"])})
+    with pytest.raises(ValueError, match="Circular"):
+        task_graph.run_task_graph({"a": (lambda x: x, ["b"]), "b": (lambda x: x, ["a"])})
+
+
+def test_running_tasks_are_handed_to_the_next_call():
+    calls = []
+    release = threading.Event()
+    tasks = {
+        "fast": (counted(calls, "fast", "fast"), []),
+        "slow": (counted(calls, "slow", "slow", wait=release), []),
+        "queued": (counted(calls, "queued", "queued"), []),
+        "after": (counted(calls, "after", lambda slow: slow + " after"), ["slow"]),
+    }
+    # one thread: "fast" finishes, "slow" is running and "queued" is not started at the timeout
+    preview = task_graph.run_task_graph(tasks, max_workers=1, timeout=0.2)
+    assert preview["fast"] == "fast"
+    assert isinstance(preview["slow"], Future)
+    assert "queued" not in preview and "after" not in preview
+    assert task_graph.finished(preview) == {"fast": "fast"}
+
+    release.set()
+    results = task_graph.run_task_graph(tasks, max_workers=1, results=preview)
+    assert results == {"fast": "fast", "slow": "slow", "queued": "queued", "after": "slow after"}
+    # nothing was run twice
+    assert sorted(calls) == ["after", "fast", "queued", "slow"]
+
+
+def test_timeout_returns_without_waiting_for_running_tasks():
+    release = threading.Event()
+    tasks = {"slow": (lambda: release.wait(5), [])}
+    start = time.monotonic()
+    results = task_graph.run_task_graph(tasks, timeout=0.1)
+    assert time.monotonic() - start < 2
+    release.set()
+    assert results["slow"].result(timeout=5) is True
+
+
+def test_threads_per_process(monkeypatch):
+    monkeypatch.setattr(task_graph.os, "cpu_count", lambda: 8)
+    assert task_graph.threads_per_process(1) == 8
+    assert task_graph.threads_per_process(3) == 2
+    assert task_graph.threads_per_process(16) == 1
+
+
+def test_independent_tasks_run_at_the_same_time():
+    # every task waits for the others, so they only finish if they run on their own threads
+    barrier = threading.Barrier(3, timeout=5)
+    tasks = {name: (barrier.wait, []) for name in "abc"}
+    tasks["all"] = (lambda *x: sorted(x), list("abc"))
+    results = task_graph.run_task_graph(tasks, max_workers=3)
+    assert results["all"] == [0, 1, 2]
+
+
+def test_failed_task_raises_its_exception():
+    def broken():
+        raise OSError("unreadable file")
+
+    with pytest.raises(OSError, match="unreadable file"):
+        task_graph.run_task_graph({"file": (broken, []), "table": (len, ["file"])}, max_workers=2)
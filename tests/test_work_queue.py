@@ -0,0 +1,130 @@
+import json
+import multiprocessing
+import os
+import time
+
+from utils import work_queue
+
+
+def make_stale(lease, age=1000):
+    old = work_queue.shared_clock(lease.parent) - age
+    os.utime(lease, (old, old))
+
+
+def test_claim_is_exclusive(tmp_path):
+    assert work_queue.claim(tmp_path, "s1")
+    assert not work_queue.claim(tmp_path, "s1")
+    work_queue.release(tmp_path, "s1")
+    assert not work_queue.claim(tmp_path, "s1")
+    assert (tmp_path / "s1.done").exists()
+
+
+def test_stale_lease_is_reclaimed(tmp_path):
+    lease = tmp_path / "s1.lease"
+    lease.write_text(json.dumps({"worker": "crashed:1", "claimed": 0}))
+    make_stale(lease)
+    assert work_queue.claim(tmp_path, "s1", ttl=300)
+    assert json.loads(lease.read_text())["worker"] == work_queue.worker_id()
+
+
+def test_fresh_lease_is_not_reclaimed(tmp_path):
+    lease = tmp_path / "s1.lease"
+    lease.write_text(json.dumps({"worker": "other:1", "claimed": 0}))
+    assert not work_queue.claim(tmp_path, "s1", ttl=300)
+    assert json.loads(lease.read_text())["worker"] == "other:1"
+
+
+def test_lease_recreated_by_another_worker_is_kept(tmp_path, monkeypatch):
+    # another worker reclaims and recreates the lease after this worker read the stale one: the new lease may
+    # get the same inode number and even the same mtime, but it is a different lease
+    lease = tmp_path / "s1.lease"
+    lease.write_text(json.dumps({"worker": "crashed:1", "claimed": 0}))
+    make_stale(lease)
+    stat = lease.stat()
+    clock = work_queue.shared_clock
+
+    def recreate(queue_dir):
+        now = clock(queue_dir)
+        lease.unlink()
+        lease.write_text(json.dumps({"worker": "other:2", "claimed": 1}))
+        os.utime(lease, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        return now
+
+    monkeypatch.setattr(work_queue, "shared_clock", recreate)
+    assert not work_queue._reclaim_stale(lease, ttl=300)
+    assert json.loads(lease.read_text())["worker"] == "other:2"
+    assert [x.name for x in tmp_path.iterdir() if ".stale." in x.name] == []
+
+
+def test_run_worker_processes_every_sample_once(tmp_path):
+    samples = [tmp_path / "results" / f"s{i}" for i in range(3)]
+    done = []
+    job = lambda sample, suffix: done.append(sample.name + suffix)  # noqa: E731
+    work_queue.run_worker(samples, job, tmp_path / "queue", {"suffix": "!"})
+    assert sorted(done) == ["s0!", "s1!", "s2!"]
+    assert work_queue.progress(tmp_path / "queue", ["s0", "s1", "s2"])["done"] == 3
+
+
+def test_reclaimed_lease_is_neither_renewed_nor_removed_by_its_old_worker(tmp_path):
+    lease = tmp_path / "s1.lease"
+    old = work_queue.claim(tmp_path, "s1", ttl=300)
+    make_stale(lease)
+    new = work_queue.claim(tmp_path, "s1", ttl=300)
+    assert new and new != old
+    make_stale(lease, age=100)
+    mtime = lease.stat().st_mtime_ns
+
+    with work_queue.Heartbeat(lease, interval=0.01, token=old) as heartbeat:
+        time.sleep(0.1)
+    assert heartbeat.lost
+    assert lease.stat().st_mtime_ns == mtime
+
+    work_queue.release(tmp_path, "s1", token=old)
+    assert lease.read_text() == new
+    work_queue.release(tmp_path, "s1", token=new)
+    assert not lease.exists()
+    assert [x.name for x in tmp_path.iterdir() if ".release." in x.name] == []
+
+
+def test_heartbeat_survives_the_lease_being_moved_aside(tmp_path):
+    lease = tmp_path / "s1.lease"
+    token = work_queue.claim(tmp_path, "s1")
+    aside = tmp_path / "s1.lease.stale.other"
+    with work_queue.Heartbeat(lease, interval=0.01, token=token) as heartbeat:
+        # another worker checks whether the lease is stale
+        os.rename(lease, aside)
+        time.sleep(0.1)
+        os.rename(aside, lease)
+        make_stale(lease)
+        time.sleep(0.1)
+        assert heartbeat.thread.is_alive()
+    assert not heartbeat.lost
+    assert work_queue.shared_clock(tmp_path) - lease.stat().st_mtime < 10
+
+
+def record_sample(sample, log):
+    # O_APPEND writes of one line are atomic, so the processes do not mix their lines
+    with open(log, "a") as f:
+        f.write(f"{sample.name} {os.getpid()}\n")
+    time.sleep(0.02)
+
+
+def test_workers_in_several_processes_process_every_sample_once(tmp_path):
+    samples = [tmp_path / "results" / f"s{i}" for i in range(30)]
+    log = tmp_path / "processed.log"
+    workers = [
+        multiprocessing.Process(
+            target=work_queue.run_worker, args=(samples, record_sample, tmp_path / "queue", {"log": log}, 5)
+        )
+        for _ in range(4)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(60)
+        assert worker.exitcode == 0
+
+    processed = [line.split()[0] for line in log.read_text().splitlines()]
+    assert sorted(processed) == sorted(x.name for x in samples)
+    assert work_queue.progress(tmp_path / "queue", [x.name for x in samples])["done"] == 30
+    assert [x.name for x in (tmp_path / "queue").iterdir() if ".lease" in x.name] == []
@@ -0,0 +1,231 @@
+import functools
+import gzip
+import os
+
+import numpy as np
+import pandas as pd
+
+from utils import schemas
+
+# Files with these suffixes are read as FASTA, other files as the megahit contig csv
+FASTA_SUFFIXES = (".fa", ".fasta", ".fna", ".fa.gz", ".fasta.gz", ".fna.gz")
+
+# Contig lengths the number of contigs (and bases) above are counted for
+THRESHOLDS = [1000, 5000, 10000]
+
+
+class AssemblyStats:
+    """
+    Statistics of the contigs of an assembly, accumulated in one pass over the contigs with `add`.
+    Only the number of contigs of every distinct length (`lengths` and `length_counts`) and of every GC percent are
+    kept, so the memory is bounded by the number of distinct lengths, not by the number of contigs or the length of
+    the longest contig, and every statistic (histogram, quantiles, N50 ...) is exact.
+    """
+
+    def __init__(self):
+        self.lengths = np.zeros(0, dtype="int64")
+        self.length_counts = np.zeros(0, dtype="int64")
+        self.gc_counts = np.zeros(101, dtype="int64")
+        self.gc_bases = 0
+        self.sequence_bases = 0
+
+    def add(self, lengths: np.ndarray, gc: np.ndarray = None, bases: np.ndarray = None) -> None:
+        """
+        Adds contigs: their lengths and, if their sequences are known, their number of G and C bases
+        and the length of their sequences (`bases`, default = `lengths`).
+        """
+        lengths = np.asarray(lengths, dtype="int64")
+        # the counts of the new lengths merged into the sorted counts
+        merged, inverse = np.unique(np.concatenate([self.lengths, lengths]), return_inverse=True)
+        counts = np.bincount(inverse, weights=np.concatenate([self.length_counts, np.ones(len(lengths), "int64")]))
+        self.lengths, self.length_counts = merged, counts.astype("int64")
+
+        if gc is not None:
+            gc = np.asarray(gc, dtype="int64")
+            bases = lengths if bases is None else np.asarray(bases, dtype="int64")
+            known = bases > 0
+            percent = np.rint(gc[known] * 100 / bases[known]).astype("int64")
+            self.gc_counts += np.bincount(percent, minlength=101)
+            self.gc_bases += int(gc.sum())
+            self.sequence_bases += int(bases.sum())
+
+    @property
+    def contigs(self) -> int:
+        return int(self.length_counts.sum())
+
+    @property
+    def total_length(self) -> int:
+        return int(np.dot(self.lengths, self.length_counts))
+
+    def _lengths(self) -> tuple[np.ndarray, np.ndarray]:
+        # the lengths that occur, ascending, and their number of contigs
+        return self.lengths, self.length_counts
+
+    def quantile(self, q: float) -> float:
+        """
+        Returns the q-quantile of the contig lengths (linear interpolation, like np.quantile).
+        """
+        lengths, counts = self._lengths()
+        if len(lengths) == 0:
+            return np.nan
+        position = (self.contigs - 1) * q
+        below = np.cumsum(counts)
+        lower, upper = lengths[np.searchsorted(below, [np.floor(position), np.ceil(position)], side="right")]
+        return float(lower + (upper - lower) * (position - np.floor(position)))
+
+    def nx(self, x: float) -> tuple[int, int]:
+        """
+        Returns Nx and Lx: the length of the shortest contig, and the number of contigs, such that the contigs at
+        least that long have x percent of the bases of the assembly (N50 and L50 for x=50).
+        """
+        lengths, counts = self._lengths()
+        if len(lengths) == 0:
+            return 0, 0
+        lengths, counts = lengths[::-1], counts[::-1]
+        target = self.total_length * x / 100
+        bases = np.cumsum(lengths * counts)
+        i = np.searchsorted(bases, target)
+        # only as many of the contigs of length Nx as are needed to reach the target
+        before = bases[i - 1] if i else 0
+        needed = int(np.ceil((target - before) / lengths[i]))
+        return int(lengths[i]), int(counts[:i].sum()) + max(needed, 1)
+
+    def above(self, threshold: int) -> tuple[int, int]:
+        """
+        Returns the number of contigs at least `threshold` long and their number of bases.
+        """
+        first = np.searchsorted(self.lengths, threshold)
+        counts = self.length_counts[first:]
+        return int(counts.sum()), int(np.dot(self.lengths[first:], counts))
+
+    def histogram(self, step: int = 500) -> pd.DataFrame:
+        """
+        Returns the number of contigs in bins of `step` nt: start, end and count, from the bin of the shortest to
+        the bin of the longest contig.
+        """
+        lengths, counts = self._lengths()
+        if len(lengths) == 0:
+            return pd.DataFrame({"start": [], "end": [], "count": []})
+        first = lengths[0] // step
+        bins = np.bincount(lengths // step - first, weights=counts).astype("int64")
+        start = (first + np.arange(len(bins))) * step
+        return pd.DataFrame({"start": start, "end": start + step, "count": bins})
+
+    def gc_histogram(self) -> pd.DataFrame:
+        """
+        Returns the number of contigs with every GC content (percent, rounded).
+        """
+        return pd.DataFrame({"gc": np.arange(101), "count": self.gc_counts})
+
+    def gc_content(self) -> float:
+        """
+        Returns the GC content (percent) of the contigs with a sequence, NaN if there are none.
+        """
+        return self.gc_bases * 100 / self.sequence_bases if self.sequence_bases else np.nan
+
+    def table(self, thresholds: list = THRESHOLDS) -> pd.DataFrame:
+        """
+        Returns the statistics as a table: statistic, value.
+        """
+        lengths, _ = self._lengths()
+        n50, l50 = self.nx(50)
+        n90, l90 = self.nx(90)
+        rows = {
+            "Contigs": self.contigs,
+            "Total length (nt)": self.total_length,
+            "Longest contig (nt)": int(lengths[-1]) if len(lengths) else 0,
+            "Shortest contig (nt)": int(lengths[0]) if len(lengths) else 0,
+            "Mean length (nt)": round(self.total_length / self.contigs, 1) if self.contigs else np.nan,
+            "Median length (nt)": self.quantile(0.5),
+            "N50 (nt)": n50,
+            "L50": l50,
+            "N90 (nt)": n90,
+            "L90": l90,
+            "GC content (%)": round(self.gc_content(), 2),
+        }
+        for threshold in thresholds:
+            contigs, bases = self.above(threshold)
+            rows[f"Contigs >= {threshold:,} nt"] = contigs
+            rows[f"Bases in contigs >= {threshold:,} nt"] = bases
+        return pd.DataFrame({"statistic": list(rows), "value": pd.Series(list(rows.values()), dtype="object")})
+
+
+def gc_bases(sequences: pd.Series) -> np.ndarray:
+    """
+    Returns the number of G and C bases of each sequence.
+    """
+    return np.fromiter(
+        (x.count("G") + x.count("C") + x.count("g") + x.count("c") for x in sequences.fillna("")),
+        dtype="int64",
+        count=len(sequences),
+    )
+
+
+def from_csv(file: str, chunksize: int = 100_000) -> AssemblyStats:
+    """
+    Computes the statistics from the megahit contig csv (length and, if present, sequence), read in chunks
+    of `chunksize` contigs (the memory is bounded by the sequences of one chunk).
+    """
+    columns = list(pd.read_csv(file, nrows=0).columns)
+    usecols = ["length", "sequence"] if "sequence" in columns else ["length"]
+
+    stats = AssemblyStats()
+    for chunk in schemas.read_table("megahit_contigs", file, usecols=usecols, chunksize=chunksize):
+        chunk = chunk[chunk["length"].notna()]
+        lengths = chunk["length"].to_numpy("int64")
+        if "sequence" in chunk:
+            stats.add(lengths, gc_bases(chunk["sequence"]), chunk["sequence"].str.len().fillna(0))
+        else:
+            stats.add(lengths)
+    return stats
+
+
+def from_fasta(file: str, chunksize: int = 100_000) -> AssemblyStats:
+    """
+    Computes the statistics from a FASTA file of contigs (optionally gzipped), read line by line.
+    Raises ValueError if there is a sequence before the first header (empty lines are skipped).
+    """
+    stats = AssemblyStats()
+    lengths, gcs = [], []
+    length = gc = None
+
+    opener = gzip.open if str(file).endswith(".gz") else open
+    with opener(file, "rb") as f:
+        for line in f:
+            if line.startswith(b">"):
+                if length is not None:
+                    lengths.append(length)
+                    gcs.append(gc)
+                    if len(lengths) == chunksize:
+                        stats.add(lengths, gcs)
+                        lengths, gcs = [], []
+                length = gc = 0
+            else:
+                line = line.rstrip()
+                if length is None:
+                    if line:
+                        raise ValueError(f"{file} has a sequence before the first FASTA header")
+                    continue
+                length += len(line)
+                gc += line.count(b"G") + line.count(b"C") + line.count(b"g") + line.count(b"c")
+    if length is not None:
+        lengths.append(length)
+        gcs.append(gc)
+    stats.add(lengths, gcs)
+    return stats
+
+
+@functools.lru_cache(maxsize=32)
+def _cached(file: str, size: int, mtime_ns: int) -> AssemblyStats:
+    if file.endswith(FASTA_SUFFIXES):
+        return from_fasta(file)
+    return from_csv(file)
+
+
+def assembly_stats(file: str) -> AssemblyStats:
+    """
+    Returns the statistics of the contigs in a megahit contig csv or FASTA file.
+    The statistics are kept in memory for the process, so the charts and the table of a sample share one pass.
+    """
+    stat = os.stat(file)
+    return _cached(str(file), stat.st_size, stat.st_mtime_ns)
@@ -0,0 +1,23 @@
+import os
+import tempfile
+from pathlib import Path
+
+
+def write_atomic(path: str, data: bytes) -> None:
+    """
+    Writes the data to a temporary file in the same folder and renames it to `path`,
+    so readers never see a half written file.
+
+    :param str path: Path to the output file.
+    :param bytes data: Content of the file.
+    """
+    path = Path(path)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
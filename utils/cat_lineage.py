@@ -0,0 +1,321 @@
+import functools
+import io
+import os
+import warnings
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from utils import atomic_write, chart_cache, read_engine, schemas
+
+# Environment variables with the folder the parsed tables are cached in and its maximum size (bytes).
+# The tables are only cached on disk if the folder is set (see set_cache_dir).
+CACHE_VARIABLE = "VIRUSHANTER_CAT_CACHE"
+CACHE_SIZE_VARIABLE = "VIRUSHANTER_CAT_CACHE_BYTES"
+# Part of the name of the cached tables, change it when the layout of the arrays changes
+VERSION = 2
+
+# Artifacts the table of the contigs classified by kaiju and CAT is merged from, if there is no merged csv
+CAT_KAIJU_SOURCES = ["kaiju_megahit_report", "cat_megahit_out", "megahit_csv"]
+
+
+class RankTable:
+    """
+    The CAT output of a sample as numeric arrays, parsed once:
+
+    * `lineage` and `lineage_scores`: (contigs, depth) arrays with the taxids of the lineage and their scores,
+      padded with -1 and NaN. `starred` marks the taxids CAT wrote with a "*" (e.g. "10239*").
+    * `codes`: (contigs, ranks) array with, for each rank in schemas.RANKS, the index of the label of the contig
+      in `labels[rank]` (-1 if the contig has no label). The labels are the values of the CAT file
+      ("Viruses: 1.00" or "no support"); `names` and `label_scores` are the name and score of each label.
+
+    Counts at any rank and score-thresholded views are computed from the arrays.
+    """
+
+    def __init__(
+        self,
+        contigs: np.ndarray,
+        assigned: np.ndarray,
+        lineage: np.ndarray,
+        lineage_scores: np.ndarray,
+        starred: np.ndarray,
+        codes: np.ndarray,
+        labels: dict,
+    ):
+        self.contigs = contigs
+        self.assigned = assigned
+        self.lineage = lineage
+        self.lineage_scores = lineage_scores
+        self.starred = starred
+        self.codes = codes
+        self.labels = labels
+        self.names = {}
+        self.label_scores = {}
+        for rank, rank_labels in labels.items():
+            parts = pd.Series(rank_labels, dtype="object").str.rsplit(": ", n=1)
+            self.names[rank] = parts.str[0].to_numpy(dtype="str")
+            self.label_scores[rank] = pd.to_numeric(parts.str[1], errors="coerce").to_numpy(dtype="float32")
+
+    def __len__(self) -> int:
+        return len(self.contigs)
+
+    def _rank_codes(self, rank: str) -> np.ndarray:
+        return self.codes[:, schemas.RANKS.index(rank)]
+
+    def scores(self, rank: str) -> np.ndarray:
+        """
+        Returns the score of each contig at the rank (NaN if the contig has no score at the rank).
+        """
+        codes = self._rank_codes(rank)
+        return np.append(self.label_scores[rank], np.float32("nan"))[codes]
+
+    def supported(self, rank: str) -> np.ndarray:
+        """
+        Returns a mask of the contigs whose label at the rank is not "no support".
+        """
+        no_support = np.flatnonzero(self.names[rank] == "no support")
+        return ~np.isin(self._rank_codes(rank), no_support)
+
+    def mask(self, supported: list = (), min_score: float = None, rank: str = None) -> np.ndarray:
+        """
+        Returns a mask of the contigs with a taxid assigned, support at all `supported` ranks and, if `min_score`
+        is given, at least that score at `rank`.
+        """
+        mask = self.assigned.copy()
+        for supported_rank in supported:
+            mask &= self.supported(supported_rank)
+        if min_score is not None:
+            mask &= self.scores(rank) >= min_score
+        return mask
+
+    def counts(self, rank: str, min_score: float = None, mask: np.ndarray = None) -> pd.Series:
+        """
+        Returns the number of contigs per name at the rank, optionally only counting the contigs with at least
+        `min_score` at the rank.
+        """
+        if mask is None:
+            mask = self.mask(supported=[rank], min_score=min_score, rank=rank)
+        codes = self._rank_codes(rank)[mask]
+        codes = codes[codes >= 0]
+        counts = (
+            pd.Series(np.bincount(codes, minlength=len(self.labels[rank])), index=self.names[rank])
+            .groupby(level=0, sort=False)
+            .sum()
+        )
+        return counts.loc[lambda x: x > 0].sort_values(ascending=False)
+
+    def view(self, columns: dict, mask: np.ndarray = None) -> pd.DataFrame:
+        """
+        Returns a dataframe with the contig name and the labels at the ranks of `columns` ({rank: column name}).
+        """
+        if mask is None:
+            mask = np.ones(len(self), dtype=bool)
+        frame = {"name": self.contigs[mask]}
+        for rank, column in columns.items():
+            frame[column] = pd.Categorical.from_codes(self._rank_codes(rank)[mask], categories=self.labels[rank])
+        return pd.DataFrame(frame)
+
+    def last_level(self) -> np.ndarray:
+        """
+        Returns the name of the lowest supported rank of each contig ("" if no rank is supported).
+        """
+        last = np.full(len(self), "", dtype="object")
+        for rank in schemas.RANKS:
+            names = np.append(self.names[rank], "").astype("object")[self._rank_codes(rank)]
+            last = np.where(self.supported(rank) & (self._rank_codes(rank) >= 0), names, last)
+        return last
+
+    def save(self, file: str) -> None:
+        """
+        Saves the table (atomically) as a npz file.
+        """
+        arrays = {
+            "contigs": self.contigs,
+            "assigned": self.assigned,
+            "lineage": self.lineage,
+            "lineage_scores": self.lineage_scores,
+            "starred": self.starred,
+            "codes": self.codes,
+            **{f"labels_{rank}": labels for rank, labels in self.labels.items()},
+        }
+        buffer = io.BytesIO()
+        np.savez_compressed(buffer, **arrays)
+        atomic_write.write_atomic(file, buffer.getvalue())
+
+    @classmethod
+    def load(cls, file: str) -> "RankTable":
+        """
+        Loads a table saved with `save`.
+        """
+        with np.load(file) as arrays:
+            return cls(
+                arrays["contigs"],
+                arrays["assigned"],
+                arrays["lineage"],
+                arrays["lineage_scores"],
+                arrays["starred"],
+                arrays["codes"],
+                {rank: arrays[f"labels_{rank}"] for rank in schemas.RANKS},
+            )
+
+
+def _number(parts: pd.Series) -> pd.Series:
+    # taxids can be starred ("10239*")
+    return pd.to_numeric(parts.str.rstrip("*"), errors="coerce")
+
+
+def _star(parts: pd.Series) -> pd.Series:
+    return parts.str.endswith("*")
+
+
+def _split(categories: pd.Index, sep: str, dtype: str, pad, value=_number) -> np.ndarray:
+    # (categories + 1, depth) array with the value of each split part of each category and a padding row last,
+    # so that the category code -1 picks the padding row
+    if len(categories) == 0:
+        return np.full((1, 0), pad, dtype=dtype)
+    parts = categories.to_series().str.split(sep, expand=True)
+    values = parts.apply(value).fillna(pad).to_numpy(dtype=dtype)
+    return np.vstack([values, np.full((1, values.shape[1]), pad, dtype=dtype)])
+
+
+def parse(file: str) -> RankTable:
+    """
+    Parses the CAT output (contig2classification with names) into a RankTable.
+    Every distinct lineage and label is only parsed once and the contigs index into them.
+
+    :param str file: Path to the CAT file made on megahit contigs.
+    :return: RankTable
+    """
+    cat = schemas.read_table("cat_megahit", file)
+
+    lineage = cat["lineage"].astype("category")
+    lineage_scores = cat["lineage scores"].astype("category")
+    lineage_taxids = _split(lineage.cat.categories, ";", "int64", -1)[lineage.cat.codes.to_numpy()]
+    starred = _split(lineage.cat.categories, ";", "bool", False, _star)[lineage.cat.codes.to_numpy()]
+    lineage_values = _split(lineage_scores.cat.categories, ";", "float32", np.nan)[
+        lineage_scores.cat.codes.to_numpy()
+    ]
+
+    labels = {}
+    codes = np.empty((len(cat), len(schemas.RANKS)), dtype="int32")
+    for i, rank in enumerate(schemas.RANKS):
+        column = cat[rank].astype("category")
+        labels[rank] = column.cat.categories.to_numpy(dtype="str")
+        codes[:, i] = column.cat.codes.to_numpy()
+
+    return RankTable(
+        contigs=cat["# contig"].to_numpy(dtype="str"),
+        assigned=cat["classification"].ne("no taxid assigned").to_numpy(),
+        lineage=lineage_taxids,
+        lineage_scores=lineage_values,
+        starred=starred,
+        codes=codes,
+        labels=labels,
+    )
+
+
+def _evict(folder: Path, max_bytes: int) -> None:
+    # removes the least recently used tables until the folder is smaller than max_bytes
+    entries = []
+    for entry in folder.glob("*.npz"):
+        try:
+            stat = entry.stat()
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, entry))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, entry in sorted(entries):
+        if total <= max_bytes:
+            break
+        entry.unlink(missing_ok=True)
+        total -= size
+
+
+@functools.lru_cache(maxsize=32)
+def _cached(file: str, size: int, mtime_ns: int, cache_dir: str, max_bytes: int) -> RankTable:
+    if cache_dir is None:
+        return parse(file)
+
+    cached = Path(cache_dir) / f"{chart_cache.file_hash(file)}-v{VERSION}.npz"
+    try:
+        table = RankTable.load(cached)
+        # mtime is used as the time of last use for the LRU eviction
+        os.utime(cached)
+        return table
+    except FileNotFoundError:
+        pass
+    table = parse(file)
+    cached.parent.mkdir(parents=True, exist_ok=True)
+    table.save(cached)
+    _evict(cached.parent, max_bytes)
+    return table
+
+
+def set_cache_dir(folder: str, max_bytes: int = 1024**3) -> None:
+    """
+    Sets the folder the parsed tables are cached in and its maximum size (in the environment, so that worker
+    processes use it too). The least recently used tables are removed when the folder grows above `max_bytes`.
+    """
+    os.environ[CACHE_VARIABLE] = str(folder)
+    os.environ[CACHE_SIZE_VARIABLE] = str(max_bytes)
+
+
+def rank_table(file: str, cache_dir: str = None) -> RankTable:
+    """
+    Returns the RankTable of a CAT file. The table is kept in memory for the process and, if `cache_dir` or the
+    folder of set_cache_dir is given, saved there (by the hash of the file), so each sample is only parsed once.
+    """
+    cache_dir = cache_dir or os.environ.get(CACHE_VARIABLE)
+    max_bytes = int(os.environ.get(CACHE_SIZE_VARIABLE, 1024**3))
+    stat = os.stat(file)
+    return _cached(str(file), stat.st_size, stat.st_mtime_ns, None if cache_dir is None else str(cache_dir), max_bytes)
+
+
+def merge_cat_kaiju(kaiju_file: str, cat_file: str, contigs_file: str) -> pd.DataFrame:
+    """
+    Merges the kaiju and CAT classification of the contigs with the megahit contigs into the table of the
+    cleaned cat_kaiju_merged csv: the contigs classified by both, with the last level of their kaiju taxonomy
+    and their lowest supported CAT rank.
+    This is an approximation of the merged csv of the pipeline, which it has not been checked against: the
+    contigs and ranks kept may differ (e.g. for contigs CAT classified without a supported rank), so a warning
+    is given when it is used instead of the merged csv.
+
+    :param str kaiju_file: Path to the kaiju output on the megahit contigs.
+    :param str cat_file: Path to the CAT file made on megahit contigs.
+    :param str contigs_file: Path to the megahit contigs csv.
+    :return: pd.DataFrame
+    """
+    warnings.warn(
+        f"The table of the contigs is approximated from {kaiju_file} and {cat_file} (no cat_kaiju_merged csv)",
+        stacklevel=2,
+    )
+    kaiju = (
+        schemas.read_table("kaiju_megahit", kaiju_file)
+        .dropna()
+        .assign(last_level_kaiju=lambda x: x.taxonomy.str.split(";").str[:-1].str[-1])
+    )
+
+    table = rank_table(cat_file)
+    last_level = table.last_level()
+    classified = table.assigned & (last_level != "")
+    cat = pd.DataFrame({"name": table.contigs[classified].astype("object"), "last_level_cat": last_level[classified]})
+
+    contigs = schemas.read_table("megahit_contigs", contigs_file)
+    merged = (
+        contigs[["name", "length", "sequence"]]
+        .merge(kaiju[["name", "taxon_id", "last_level_kaiju"]], on="name")
+        .merge(cat, on="name")[["name", "taxon_id", "length", "last_level_kaiju", "last_level_cat", "sequence"]]
+    )
+    return read_engine.sort_categories(merged.astype(schemas.SCHEMAS["cat_kaiju_merged"]["dtypes"]))
+
+
+def read_cat_kaiju(*files: str) -> pd.DataFrame:
+    """
+    Returns the table of the contigs classified by kaiju and CAT, from the merged csv (one file)
+    or merged from the files of CAT_KAIJU_SOURCES.
+    """
+    if len(files) == 1:
+        return schemas.read_table("cat_kaiju_merged", files[0])
+    return merge_cat_kaiju(*files)
@@ -0,0 +1,258 @@
+import hashlib
+import inspect
+import json
+import os
+import threading
+import types
+from pathlib import Path
+from typing import Callable
+
+from utils import atomic_write
+
+CACHE_DIR = Path.home() / ".cache" / "virushanter" / "charts"
+# Only the modules of the repository are dependencies of the charts (not pandas, altair ...)
+REPO_DIR = Path(__file__).resolve().parent.parent
+CONSTANT_TYPES = (bool, int, float, str, bytes, tuple, list, dict, set, frozenset)
+# Hashes of the input files, kept next to the entries ([path, size, mtime_ns, sha256] per line)
+HASHES_NAME = "file-hashes.jsonl"
+
+
+def _repo_module(obj) -> types.ModuleType:
+    # the module of the repository an object is (or is defined in), None for other objects
+    module = obj if isinstance(obj, types.ModuleType) else inspect.getmodule(obj)
+    file = getattr(module, "__file__", None)
+    if file is None or not Path(file).resolve().is_relative_to(REPO_DIR):
+        return None
+    return module
+
+
+def _code_names(code: types.CodeType) -> set:
+    # the global names used by the code, and by the functions, lambdas and comprehensions in it
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            names |= _code_names(const)
+    return names
+
+
+def dependencies(func: Callable) -> tuple[list[str], list[Path]]:
+    """
+    Returns what a chart built by `func` depends on: the source code of `func` and of the functions of its
+    module that it calls, the constants they use, and the files of the other modules of the repository it uses, with the modules
+    those import. A change to any other module (e.g. the html template or the batch runners) does not
+    change the charts.
+
+    :return: (sources of the functions, files of the modules)
+    """
+    sources, modules = {}, {}
+
+    def visit_module(module):
+        if module.__name__ in modules:
+            return
+        modules[module.__name__] = Path(module.__file__)
+        for value in vars(module).values():
+            dependency = _repo_module(value)
+            if dependency is not None and dependency is not module:
+                visit_module(dependency)
+
+    def visit_function(function):
+        name = f"{function.__module__}.{function.__qualname__}"
+        if name in sources:
+            return
+        sources[name] = inspect.getsource(function)
+        for used in sorted(_code_names(function.__code__)):
+            value = function.__globals__.get(used)
+            if isinstance(value, CONSTANT_TYPES):
+                # constants of the module, e.g. the colors of a chart
+                sources[f"{name}.{used}"] = f"{used} = {value!r}"
+                continue
+            module = _repo_module(value) if value is not None else None
+            if module is None:
+                continue
+            if isinstance(value, types.FunctionType) and module.__name__ == function.__module__:
+                visit_function(value)
+            else:
+                visit_module(module)
+
+    visit_function(func)
+    return [sources[x] for x in sorted(sources)], [modules[x] for x in sorted(modules)]
+
+
+def file_hash(file: str) -> str:
+    """
+    Returns the sha256 of the content of a file.
+    """
+    sha = hashlib.sha256()
+    with open(file, "rb") as f:
+        for block in iter(lambda: f.read(1024**2), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+class ChartCache:
+    """
+    On disk cache of serialized charts (Vega-Lite json) and other strings put in the reports.
+    An entry is keyed by the content of the input files, the function, its parameters and the source code the
+    function depends on (see dependencies), so changing a plotting module or parser invalidates the charts built
+    with it, but changing the html template or an unrelated module does not.
+    The least recently used entries are removed when the cache grows above `max_bytes`.
+    The hashes of the input files are stored in the cache folder, so unchanged files are not read again by the
+    next run.
+    """
+
+    def __init__(self, folder: str = CACHE_DIR, max_bytes: int = 1024**3):
+        self.folder = Path(folder)
+        self.folder.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._hashes = None
+        self._size = None
+        self._dependencies = {}
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # the cache is passed to worker processes, which get their own lock
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _load_hashes(self) -> dict:
+        # {path: [size, mtime_ns, sha256]}, the last line of a file wins
+        hashes, lines = {}, 0
+        try:
+            with open(self.folder / HASHES_NAME) as f:
+                for line in f:
+                    try:
+                        path, size, mtime_ns, sha = json.loads(line)
+                    except ValueError:
+                        # a line cut short by a crash
+                        continue
+                    hashes[path] = [size, mtime_ns, sha]
+                    lines += 1
+        except FileNotFoundError:
+            pass
+        if lines > 2 * len(hashes) + 1000:
+            # most lines are of files that changed since
+            data = "".join(json.dumps([path, *memo]) + "\n" for path, memo in hashes.items())
+            atomic_write.write_atomic(self.folder / HASHES_NAME, data.encode())
+        return hashes
+
+    def _file_hash(self, file: str) -> str:
+        # the hash is only computed again if the file changed
+        if self._hashes is None:
+            with self._lock:
+                if self._hashes is None:
+                    self._hashes = self._load_hashes()
+        stat = os.stat(file)
+        path = str(Path(file).resolve())
+        memo = self._hashes.get(path)
+        if memo is not None and memo[:2] == [stat.st_size, stat.st_mtime_ns]:
+            return memo[2]
+        sha = file_hash(file)
+        self._hashes[path] = [stat.st_size, stat.st_mtime_ns, sha]
+        # one short line per write, so the lines of other processes are not mixed in
+        with open(self.folder / HASHES_NAME, "a") as f:
+            f.write(json.dumps([path, stat.st_size, stat.st_mtime_ns, sha]) + "\n")
+        return sha
+
+    def source_version(self, func: Callable) -> str:
+        """
+        Returns a hash of the source code the function depends on.
+        """
+        name = f"{func.__module__}.{func.__qualname__}"
+        if name not in self._dependencies:
+            self._dependencies[name] = dependencies(func)
+        sources, modules = self._dependencies[name]
+        sha = hashlib.sha256()
+        for source in sources:
+            sha.update(hashlib.sha256(source.encode()).hexdigest().encode())
+        for module in modules:
+            sha.update(self._file_hash(module).encode())
+        return sha.hexdigest()
+
+    def key(self, func: Callable, files: list, params: dict) -> str:
+        """
+        Returns the cache key of the function called with the files and parameters.
+        """
+        parts = {
+            "function": f"{func.__module__}.{func.__qualname__}",
+            "source": self.source_version(func),
+            "files": [self._file_hash(file) for file in files],
+            "params": params,
+        }
+        return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+    def get_or_build(self, func: Callable, files: list, params: dict = None) -> str:
+        """
+        Returns the cached result of `func(*files, **params)`, or builds and caches it.
+        Altair charts are stored as their Vega-Lite json.
+
+        :param Callable func: Function building the chart (or other string) from the files.
+        :param list files: Paths to the input files, passed as positional arguments.
+        :param dict params: Keyword arguments to the function, e.g. level, cutoff, number and virus_only. Default = None
+        :return: str
+        """
+        params = params or {}
+        entry = self.folder / f"{self.key(func, files, params)}.json"
+
+        try:
+            text = entry.read_text()
+            # mtime is used as the time of last use for the LRU eviction
+            os.utime(entry)
+            return text
+        except FileNotFoundError:
+            pass
+
+        result = func(*files, **params)
+        text = result if isinstance(result, str) else result.to_json()
+
+        tmp = entry.with_name(f"{entry.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_text(text)
+        os.replace(tmp, entry)
+        self._added(len(text.encode()))
+
+        return text
+
+    def _added(self, size: int) -> None:
+        # the size of the cache is counted from the entries added since the last eviction, so the folder is
+        # only listed at the first insert and when the cache may be above max_bytes
+        with self._lock:
+            if self._size is not None:
+                self._size += size
+                if self._size <= self.max_bytes:
+                    return
+        self.evict()
+
+    def evict(self) -> None:
+        """
+        Removes the least recently used entries until the cache is smaller than max_bytes.
+        """
+        with self._lock:
+            entries = []
+            for entry in self.folder.glob("*.json"):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry))
+
+            total = sum(size for _, size, _ in entries)
+            for _, size, entry in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                entry.unlink(missing_ok=True)
+                total -= size
+            self._size = total
+
+
+def build_chart(func: Callable, files: list, params: dict = None, cache: ChartCache = None) -> str:
+    """
+    Returns `func(*files, **params)` as a string (Vega-Lite json for altair charts), from the cache if one is given.
+    """
+    if cache is not None:
+        return cache.get_or_build(func, files, params)
+    result = func(*files, **(params or {}))
+    return result if isinstance(result, str) else result.to_json()
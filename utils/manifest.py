@@ -0,0 +1,165 @@
+import json
+import os
+from pathlib import Path, PurePath
+
+# The manifest is kept in a hidden subfolder of the results folder: writing it there does not change the mtime of
+# the results folder, which tells whether samples were added or removed
+STATE_DIR = ".virushanter"
+MANIFEST_NAME = "manifest.json"
+MANIFEST_VERSION = 1
+
+# Patterns (relative to the sample folder) of the files used in the reports
+ARTIFACTS = {
+    "bowtie2log": "*bowtie_raw.log",
+    "fastp_report": "*fastp/*.html",
+    "cleaned_bracken_report": "*bracken_raw.csv",
+    "cleaned_kaiju_report": "*kaiju_raw.csv",
+    "megahit_csv": "megahit/*.csv",
+    "kaiju_megahit_report": "*megahit.out",
+    "cat_megahit_out": "*contigs_names.txt",
+    "cat_kaiju_csv": "*cat_kaiju_merged.csv",
+}
+
+# Native classifier outputs used for an artifact when its cleaned csv is missing (parsed by utils/native_formats.py)
+ALTERNATIVES = {
+    "cleaned_bracken_report": ["*bracken*.report", "*.breport"],
+    "cleaned_kaiju_report": ["*kaiju*.tsv"],
+}
+
+
+def patterns(name: str) -> list[str]:
+    """
+    Returns the patterns of an artifact, in order of preference.
+    """
+    return [ARTIFACTS[name], *ALTERNATIVES.get(name, [])]
+
+
+def _scan_dir(path: Path, old: dict, entries: dict, rel: str) -> None:
+    """
+    Adds the folder and its subfolders to `entries`.
+    A folder is only listed again if its mtime differs from the one in the old manifest.
+    """
+    mtime = path.stat().st_mtime
+    cached = old.get(rel)
+
+    if cached is not None and cached["mtime"] == mtime:
+        entry = cached
+    else:
+        files, subdirs = {}, []
+        with os.scandir(path) as it:
+            for x in it:
+                if x.name.startswith("."):
+                    continue
+                if x.is_dir():
+                    subdirs.append(x.name)
+                elif x.is_file():
+                    stat = x.stat()
+                    files[x.name] = [stat.st_size, stat.st_mtime]
+        entry = {"mtime": mtime, "files": files, "subdirs": sorted(subdirs)}
+
+    entries[rel] = entry
+    for subdir in entry["subdirs"]:
+        try:
+            _scan_dir(path / subdir, old, entries, f"{rel}/{subdir}" if rel else subdir)
+        except FileNotFoundError:
+            # removed since the last scan
+            continue
+
+
+def load(manifest_file: Path) -> dict:
+    """
+    Reads the manifest. Returns an empty manifest if the file does not exist or is from another version.
+    """
+    try:
+        with open(manifest_file) as f:
+            manifest = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {"version": MANIFEST_VERSION, "root_mtime": None, "samples": {}}
+    if manifest.get("version") != MANIFEST_VERSION:
+        return {"version": MANIFEST_VERSION, "root_mtime": None, "samples": {}}
+    return manifest
+
+
+def update(results: Path, manifest_file: Path = None) -> dict:
+    """
+    Updates the manifest of the results folder ({sample: {folder: {mtime, files: {name: [size, mtime]}, subdirs}}})
+    and writes it to `manifest_file`.
+    Only the folders whose mtime changed since the last update are listed again, so an update of an unchanged
+    results folder costs one stat per folder.
+    Note that a file that is overwritten in place does not change the mtime of its folder.
+
+    :param Path results: Folder with one subfolder per sample.
+    :param Path manifest_file: Where the manifest is stored, not directly in `results` (as writing it would change
+        the mtime of the folder, so the samples are listed at every update). Default = <results>/.virushanter/manifest.json
+    :return: dict with the manifest
+    """
+    results = Path(results)
+    manifest_file = Path(manifest_file) if manifest_file else results / STATE_DIR / MANIFEST_NAME
+    # created before the mtime of the results folder is read
+    manifest_file.parent.mkdir(parents=True, exist_ok=True)
+    old = load(manifest_file)
+
+    root_mtime = results.stat().st_mtime
+    if root_mtime == old["root_mtime"]:
+        sample_names = list(old["samples"])
+    else:
+        sample_names = sorted(
+            x.name for x in results.iterdir() if x.is_dir() and not x.name.startswith(".")
+        )
+
+    samples = {}
+    for name in sample_names:
+        entries = {}
+        try:
+            _scan_dir(results / name, old["samples"].get(name, {}), entries, "")
+        except FileNotFoundError:
+            continue
+        samples[name] = entries
+
+    manifest = {"version": MANIFEST_VERSION, "root_mtime": root_mtime, "samples": samples}
+
+    # write to a temporary file first, so readers never see a half written manifest
+    tmp = manifest_file.with_name(f"{manifest_file.name}.{os.getpid()}.tmp")
+    with open(tmp, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp, manifest_file)
+
+    return manifest
+
+
+def sample_files(manifest: dict, results: Path, sample_name: str) -> dict[Path, int]:
+    """
+    Returns {path: size} of all files of the sample in the manifest.
+    """
+    sample = Path(results) / sample_name
+    return {
+        sample / rel / name: size
+        for rel, entry in manifest["samples"][sample_name].items()
+        for name, (size, _) in entry["files"].items()
+    }
+
+
+def find(manifest: dict, results: Path, sample_name: str, pattern: str) -> list[Path]:
+    """
+    Returns the files of the sample matching the pattern, like `sample.rglob(pattern)`.
+    """
+    sample = Path(results) / sample_name
+    return sorted(
+        path
+        for path in sample_files(manifest, results, sample_name)
+        if PurePath(path.relative_to(sample)).match(pattern)
+    )
+
+
+def artifacts(manifest: dict, results: Path, sample_name: str) -> dict[str, Path]:
+    """
+    Returns {artifact: path} for the artifacts in ARTIFACTS (or their ALTERNATIVES) that exist for the sample.
+    """
+    found = {}
+    for name in ARTIFACTS:
+        for pattern in patterns(name):
+            matches = find(manifest, results, sample_name, pattern)
+            if matches:
+                found[name] = matches[0]
+                break
+    return found
@@ -0,0 +1,132 @@
+import csv
+import re
+
+import pandas as pd
+
+from utils import read_engine
+
+# Columns of the kraken style report written by bracken (-w) and kraken2 (--report),
+# with and without the minimizer columns of kraken2 --report-minimizer-data
+KRAKEN_REPORT_COLUMNS = {
+    6: ["percent", "clade_reads", "direct_reads", "rank", "taxid", "name"],
+    8: ["percent", "clade_reads", "direct_reads", "minimizers", "distinct_minimizers", "rank", "taxid", "name"],
+}
+KAIJU_TABLE_COLUMNS = ["file", "percent", "reads", "taxon_id", "taxon_name"]
+
+RANK_CODE = re.compile(r"^[URDKPCOFGS]\d*$")
+
+# Names of the domains as in the cleaned bracken report
+DOMAINS = {"Viruses": "Virus"}
+
+
+def detect(file: str) -> str:
+    """
+    Returns the native format of a file from its first line: "kraken_report", "kaiju_table",
+    or None for other files (e.g. the cleaned csv files).
+    """
+    with open(file) as f:
+        fields = f.readline().rstrip("\r\n").split("\t")
+    if fields[: len(KAIJU_TABLE_COLUMNS)] == KAIJU_TABLE_COLUMNS:
+        return "kaiju_table"
+    if len(fields) in KRAKEN_REPORT_COLUMNS and RANK_CODE.match(fields[-3]):
+        try:
+            float(fields[0])
+        except ValueError:
+            return None
+        return "kraken_report"
+    return None
+
+
+def read_kraken_report(file: str) -> pd.DataFrame:
+    """
+    Parses a kraken style report (the bracken report) into the columns of the cleaned bracken report:
+    name, level (rank code), percent (fraction of the reads), domain and new_est_reads (reads of the clade).
+    The domain of a taxon is the "D" rank above it in the tree, found from the indentation of the names.
+
+    :param str file: Path to the report.
+    :return: pd.DataFrame
+    """
+    with open(file) as f:
+        names = KRAKEN_REPORT_COLUMNS[len(f.readline().rstrip("\r\n").split("\t"))]
+
+    report = read_engine.read_csv(
+        file,
+        sep="\t",
+        header=None,
+        names=names,
+        usecols=["percent", "clade_reads", "rank", "name"],
+        dtype={"rank": "object", "name": "object"},
+        quoting=csv.QUOTE_NONE,
+    )
+
+    # the names are indented with two spaces per level of the tree
+    name = report["name"].str.lstrip(" ")
+    depth = report["name"].str.len() - name.str.len()
+    is_domain = report["rank"].eq("D")
+    domain = name.where(is_domain).ffill()
+    domain_depth = depth.where(is_domain).ffill()
+    domain = domain.where(is_domain | (depth > domain_depth)).replace(DOMAINS)
+
+    return pd.DataFrame(
+        {
+            "name": name,
+            "level": report["rank"],
+            "percent": report["percent"] / 100,
+            "domain": domain,
+            "new_est_reads": report["clade_reads"],
+        }
+    )
+
+
+def read_kaiju_table(file: str) -> pd.DataFrame:
+    """
+    Parses the output of kaiju2table (with the taxon path, -p, or the ranks, -l) into the columns of the cleaned
+    kaiju report: taxon_id, percent (fraction of the reads), taxon_name (the last name of the path), reads and
+    taxonomy, with one row per name in the path.
+
+    :param str file: Path to the kaiju2table output.
+    :return: pd.DataFrame
+    """
+    table = read_engine.read_csv(
+        file,
+        sep="\t",
+        usecols=["percent", "reads", "taxon_id", "taxon_name"],
+        dtype={"taxon_name": "object"},
+        quoting=csv.QUOTE_NONE,
+    )
+
+    # "NA" are the ranks a taxon does not have (with -l)
+    taxonomy = (
+        table["taxon_name"].str.split(";").explode().str.strip().loc[lambda x: x.ne("") & x.ne("NA")].dropna()
+    )
+    taxon_name = taxonomy.groupby(level=0).last()
+
+    return (
+        pd.DataFrame(
+            {
+                "taxon_id": table["taxon_id"],
+                "percent": table["percent"] / 100,
+                "taxon_name": taxon_name.reindex(table.index).fillna(table["taxon_name"]),
+                "reads": table["reads"],
+            }
+        )
+        .join(taxonomy.rename("taxonomy"))
+        .reset_index(drop=True)
+    )
+
+
+# {kind of table in schemas.SCHEMAS: (native format, parser)}
+PARSERS = {
+    "bracken_raw": ("kraken_report", read_kraken_report),
+    "kaiju_raw": ("kaiju_table", read_kaiju_table),
+}
+
+
+def parser(kind: str, file: str):
+    """
+    Returns the parser of the file if it is in the native format of its kind of table, otherwise None.
+    """
+    if kind not in PARSERS:
+        return None
+    native, parse = PARSERS[kind]
+    return parse if detect(file) == native else None
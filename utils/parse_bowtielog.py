@@ -1,7 +1,12 @@
 import re
 
+PATTERN_TOTAL = re.compile(r"^(\d+) reads; of these:$")
+PATTERN_ALIGNED = re.compile(r"^([\d.]+)\% overall alignment rate$")
+
+
 def parse_alignments(log_file: str) -> tuple[int, float]:
     """Parses out the total number of reads and the percentage of reads that were aligned to the reference genome from a bowtie2 log file.
+    The log is read until both have been found.
     
     Args:
         log_file: The path to the log file.
@@ -12,15 +17,18 @@ def parse_alignments(log_file: str) -> tuple[int, float]:
     """
     total_reads = 0
     percent_aligned = None
-    pattern_total = r"^(\d+) reads; of these:$"
-    pattern_aligned = r"^[\d.]+\% overall alignment rate$"
+    found_total = False
     with open(log_file) as f:
         for line in f:
-            match = re.search(pattern_total, line)
+            if not found_total:
+                match = PATTERN_TOTAL.match(line)
+                if match:
+                    total_reads = int(match.group(1))
+                    found_total = True
+                    continue
+            match = PATTERN_ALIGNED.match(line)
             if match:
-                total_reads = int(match.group(1))
-            match = re.search(pattern_aligned, line)
-            if match:
-                percent_aligned = float(match.group(0).split("%")[0])
+                percent_aligned = float(match.group(1))
+                if found_total:
+                    break
     return total_reads, percent_aligned
-
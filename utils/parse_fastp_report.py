@@ -1,23 +1,77 @@
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
 import pandas as pd
 
+# The summary tables at the top of the fastp report, in order
+SUMMARY_SECTIONS = ["general", "before_filtering", "after_filtering", "filtering_result"]
+
+
+def _summary_html(fastp_report: str, chunk_size: int = 64 * 1024) -> str:
+    # The fastp report is mostly the data of its plots, after the summary tables.
+    # Returns the start of the report up to the end of the last summary table.
+    # Each chunk is only searched once, with the end of the previous chunk in front of it for a match
+    # across the two.
+    chunks = []
+    offset = 0  # position of the chunk in the report
+    overlap = ""
+    start = None
+    tables = 0
+    with open(fastp_report, "r") as f:
+        for chunk in iter(lambda: f.read(chunk_size), ""):
+            chunks.append(chunk)
+            region = overlap + chunk
+            region_start = offset - len(overlap)
+            offset += len(chunk)
+
+            position = 0
+            if start is None:
+                found = region.find("summary_table")
+                if found < 0:
+                    overlap = region[-(len("summary_table") - 1):]
+                    continue
+                start = region_start + found
+                position = found + 1
+            while tables < len(SUMMARY_SECTIONS):
+                found = region.find("</table>", position)
+                if found < 0:
+                    break
+                tables += 1
+                end = region_start + found
+                position = found + 1
+            if tables == len(SUMMARY_SECTIONS):
+                return "".join(chunks)[: end + len("</table>")]
+            overlap = region[-(len("</table>") - 1):]
+    return "".join(chunks)
+
+
+def parse_summary(fastp_report: str) -> dict[str, dict[str, str]]:
+    """
+    Parses the summary tables of a fastp report: {section: {description: value}} for the SUMMARY_SECTIONS.
+    Only the start of the report is read and only the summary tables are parsed.
+    """
+    soup = BeautifulSoup(
+        _summary_html(fastp_report),
+        "html.parser",
+        parse_only=SoupStrainer("table", class_="summary_table"),
+    )
+
+    summary = {}
+    for section, table in zip(SUMMARY_SECTIONS, soup.find_all("table", class_="summary_table")):
+        summary[section] = {}
+        for row in table.find_all("tr"):
+            cells = row.find_all("td")
+            summary[section][cells[0].text] = cells[1].text
+    return summary
+
+
 def parse_fastp(fastp_report: str) -> pd.DataFrame:
     """
     Parses the relevant information about reads from fastp report
     """
-    
-    summary_information = {}
 
-    with open(fastp_report, "r") as f:
-        soup = BeautifulSoup(f, "html.parser")
+    summary_information = {}
+    for section in parse_summary(fastp_report).values():
+        summary_information.update(section)
 
-    for table in soup.find_all("table", class_="summary_table")[:4]:
-        for row in table.find_all("tr"):
-            cells = row.find_all("td")
-            key = cells[0].text
-            value = cells[1].text
-            summary_information[key] = value
-            
     df = pd.DataFrame.from_dict(summary_information, orient="index", columns=["value"])
     df = df.rename_axis("description").reset_index()
-    return df
\ No newline at end of file
+    return df
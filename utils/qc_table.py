@@ -0,0 +1,158 @@
+import io
+import json
+import re
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pandas as pd
+
+from utils import atomic_write, manifest, parse_bowtielog, parse_fastp_report, read_engine
+
+# The table is stored as parquet if pyarrow is installed, otherwise as csv, next to the manifest (so writing it does
+# not change the mtime of the results folder)
+QC_NAME = "qc"
+
+# Artifacts the QC table is made from
+QC_ARTIFACTS = ["bowtie2log", "fastp_report"]
+
+# fastp values: a number with an optional unit (K, M, G) or percent sign, optionally followed by a percent
+# in parentheses, e.g. "12.3 M (95.1%)"
+FASTP_NUMBER = re.compile(r"^(-?\d+(?:\.\d+)?)\s*([KMG])?%?(?:\s*\((\d+(?:\.\d+)?)%\))?$")
+UNITS = {None: 1, "K": 1e3, "M": 1e6, "G": 1e9}
+
+
+def column_name(section: str, description: str) -> str:
+    """
+    Returns the column of a fastp value, e.g. ("before_filtering", "total reads:") -> "before_filtering_total_reads"
+    """
+    return f"{section}_{re.sub(r'[^a-z0-9]+', '_', description.lower()).strip('_')}"
+
+
+def fastp_row(fastp_report: str) -> dict:
+    """
+    Returns the summary of a fastp report as one row: {column: value}.
+    Numbers are converted (with their unit, so "1.2 M" is 1200000.0) and a percent in parentheses gets
+    its own "_percent" column; other values are kept as strings.
+    """
+    row = {}
+    for section, values in parse_fastp_report.parse_summary(fastp_report).items():
+        for description, value in values.items():
+            column = column_name(section, description)
+            match = FASTP_NUMBER.match(value.strip())
+            if match is None:
+                row[column] = value
+                continue
+            number, unit, percent = match.groups()
+            row[column] = float(number) * UNITS[unit]
+            if percent is not None:
+                row[f"{column}_percent"] = float(percent)
+    return row
+
+
+def sample_row(files: dict) -> dict:
+    """
+    Returns the QC row of a sample from its artifacts ({artifact: path}).
+    """
+    row = {}
+    if "bowtie2log" in files:
+        row["total_reads"], row["alignment_rate"] = parse_bowtielog.parse_alignments(files["bowtie2log"])
+    if "fastp_report" in files:
+        row |= fastp_row(files["fastp_report"])
+    return row
+
+
+def signature(results_manifest: dict, results: Path, sample_name: str, files: dict) -> str:
+    """
+    Returns the paths, sizes and mtimes of the artifacts of a sample, from the manifest.
+    A row of the QC table is parsed again when the signature of its sample changes.
+    """
+    sample = Path(results) / sample_name
+    entries = results_manifest["samples"][sample_name]
+    files_signature = {}
+    for name, path in sorted(files.items()):
+        rel = path.relative_to(sample)
+        folder = rel.parent.as_posix()
+        files_signature[name] = [rel.as_posix(), *entries["" if folder == "." else folder]["files"][path.name]]
+    return json.dumps(files_signature)
+
+
+def load(table_file: Path) -> pd.DataFrame:
+    """
+    Loads a QC table (parquet or csv). Returns an empty table if the file does not exist.
+    """
+    if not table_file.exists():
+        return pd.DataFrame(columns=["signature"]).rename_axis("sample")
+    if table_file.suffix == ".parquet":
+        return pd.read_parquet(table_file)
+    return pd.read_csv(table_file, index_col="sample")
+
+
+def save(table: pd.DataFrame, table_file: Path) -> None:
+    """
+    Writes the QC table (atomically), as parquet or csv depending on the suffix of the file.
+    """
+    buffer = io.BytesIO()
+    if table_file.suffix == ".parquet":
+        table = table.copy()
+        for column in table.columns[table.dtypes == "object"]:
+            # a column can have numbers for some samples and text for others
+            table[column] = table[column].map(lambda x: x if pd.isna(x) else str(x))
+        table.to_parquet(buffer)
+    else:
+        table.to_csv(buffer)
+    atomic_write.write_atomic(table_file, buffer.getvalue())
+
+
+def update(
+    results: Path, table_file: Path = None, manifest_file: Path = None, threads: int = 8
+) -> tuple[pd.DataFrame, dict]:
+    """
+    Updates the run-level QC table of a results folder: one row per sample with the number of reads and the
+    alignment rate from the bowtie2 log and the summary of the fastp report (before and after filtering).
+    Only the samples that are new or whose logs or reports changed (according to the manifest) are parsed,
+    concurrently on `threads` threads; samples that were removed are dropped.
+    Samples whose logs or reports can not be parsed are left out of the table (and parsed again at the next
+    update) and returned with their error.
+
+    :param Path results: Folder with one subfolder per sample.
+    :param Path table_file: Where the table is stored. Default = <results>/.virushanter/qc.parquet (.csv without pyarrow)
+    :param Path manifest_file: Manifest of the results folder. Default = <results>/.virushanter/manifest.json
+    :param int threads: Number of files parsed at the same time. Default = 8
+    :return: (pd.DataFrame indexed by sample, {sample: error} of the samples that could not be parsed)
+    """
+    results = Path(results)
+    suffix = ".csv" if read_engine.pa is None else ".parquet"
+    table_file = Path(table_file) if table_file else results / manifest.STATE_DIR / f"{QC_NAME}{suffix}"
+    # created before the manifest reads the mtime of the results folder
+    table_file.parent.mkdir(parents=True, exist_ok=True)
+    results_manifest = manifest.update(results, manifest_file)
+    old = load(table_file)
+
+    rows, pending, failures = {}, {}, {}
+    for name in results_manifest["samples"]:
+        files = {
+            artifact: path
+            for artifact, path in manifest.artifacts(results_manifest, results, name).items()
+            if artifact in QC_ARTIFACTS
+        }
+        files_signature = signature(results_manifest, results, name, files)
+        if name in old.index and old.at[name, "signature"] == files_signature:
+            rows[name] = old.loc[name].dropna().to_dict()
+        else:
+            pending[name] = (files, files_signature)
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        futures = {name: pool.submit(sample_row, files) for name, (files, _) in pending.items()}
+        for name, future in futures.items():
+            try:
+                rows[name] = {**future.result(), "signature": pending[name][1]}
+            except Exception as e:
+                # not stored, so the sample is parsed again at the next update
+                failures[name] = f"{type(e).__name__}: {e}"
+
+    table = pd.DataFrame.from_dict(rows, orient="index").rename_axis("sample").sort_index()
+    # the signature last, after the QC columns (and also in a table without samples)
+    table = table.reindex(columns=[x for x in table.columns if x != "signature"] + ["signature"])
+    if pending or set(old.index) != set(table.index):
+        save(table, table_file)
+    return table, failures
@@ -0,0 +1,221 @@
+import csv
+import os
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.csv as pa_csv
+except ImportError:
+    pa = None
+
+# Environment variable with the engine used to read the tables: "auto", "pandas" or "arrow"
+ENGINE_VARIABLE = "VIRUSHANTER_READ_ENGINE"
+ENGINES = ["auto", "pandas", "arrow"]
+
+# Keyword arguments of pd.read_csv the arrow engine supports; with any other (e.g. chunksize) pandas is used
+ARROW_OPTIONS = {"sep", "header", "names", "usecols", "dtype", "quoting"}
+
+# Strings pandas reads as missing values, so that both engines give the same tables
+NA_VALUES = [
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN",
+    "<NA>", "N/A", "NA", "NULL", "NaN", "n/a", "nan", "null",
+]
+
+# dtypes of the schemas that are read as strings
+TEXT_DTYPES = {"object", "category"}
+
+
+def text_type(dtype: str) -> "pa.DataType":
+    # categories are read dictionary encoded, so they are not converted from strings
+    return pa.dictionary(pa.int32(), pa.string()) if dtype == "category" else pa.string()
+
+
+def get_engine(engine: str = None) -> str:
+    """
+    Returns the engine to read with: `engine`, or the one set in VIRUSHANTER_READ_ENGINE (default "pandas").
+    "auto" is "arrow" if pyarrow can be imported, otherwise "pandas".
+    Raises ImportError if "arrow" is asked for and pyarrow can not be imported.
+    """
+    engine = engine or os.environ.get(ENGINE_VARIABLE, "pandas")
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown read engine '{engine}', use one of {ENGINES}")
+    if engine == "auto":
+        return "arrow" if pa is not None else "pandas"
+    if engine == "arrow" and pa is None:
+        raise ImportError("The arrow read engine needs pyarrow")
+    return engine
+
+
+def set_engine(engine: str) -> None:
+    """
+    Sets the default engine (in the environment, so that worker processes use it too).
+    """
+    get_engine(engine)
+    os.environ[ENGINE_VARIABLE] = engine
+
+
+def _read_lines(file: str, sep: str, names: list, usecols: list, dtype: dict) -> "pa.Table":
+    # Reads a file without header whose rows can have different numbers of fields (like the kaiju output,
+    # where the unclassified contigs only have 3 columns), which the arrow csv reader does not allow.
+    # Each line is read as one string (split on the unit separator, which is not in the text files)
+    # and split; missing fields are null, as with pandas.
+    lines = pa_csv.read_csv(
+        file,
+        read_options=pa_csv.ReadOptions(column_names=["line"], use_threads=True),
+        parse_options=pa_csv.ParseOptions(delimiter="\x1f", quote_char=False),
+        convert_options=pa_csv.ConvertOptions(column_types={"line": pa.string()}),
+    )["line"]
+
+    # {name: index of the field}, as pandas uses names and usecols
+    if usecols is None:
+        selected = dict(zip(names, range(len(names))))
+    elif len(names) == len(usecols):
+        selected = dict(zip(names, sorted(usecols)))
+    else:
+        selected = {x: i for i, x in enumerate(names) if x in usecols or i in usecols}
+
+    padded = pc.binary_join_element_wise(lines, sep * (max(selected.values()) + 1), "")
+    fields = pc.split_pattern(padded, sep)
+
+    columns = {}
+    for name, index in selected.items():
+        column = pc.list_element(fields, index)
+        column = pc.if_else(pc.is_in(column, value_set=pa.array(NA_VALUES)), pa.scalar(None, pa.string()), column)
+        if dtype.get(name) == "category":
+            column = pc.dictionary_encode(column)
+        elif dtype.get(name) != "object":
+            # numbers are inferred like the csv reader does
+            for candidate in (pa.int64(), pa.float64()):
+                try:
+                    column = pc.cast(column, candidate)
+                    break
+                except pa.ArrowInvalid:
+                    pass
+        columns[name] = column
+    return pa.table(columns)
+
+
+def _read_arrow(
+    file: str,
+    sep: str = ",",
+    header="infer",
+    names: list = None,
+    usecols: list = None,
+    dtype: dict = None,
+    quoting: int = csv.QUOTE_MINIMAL,
+) -> "pa.Table":
+    # Reads the file with the arrow reader. Text columns are strings and numbers are int64/float64,
+    # the dtypes are applied by to_pandas/to_arrow.
+    dtype = dtype or {}
+
+    if header is None or (header == "infer" and names is not None):
+        if names is None:
+            raise ValueError("The arrow engine needs names to read a file without header")
+        # the lines are read without quoting
+        return _read_lines(file, sep, list(names), usecols, dtype)
+
+    # the header is read with pandas, so the names of the columns are the same (e.g. "Unnamed: 0")
+    columns = list(names) if names is not None else list(pd.read_csv(file, nrows=0, sep=sep, quoting=quoting).columns)
+    if usecols is None:
+        include = columns
+    else:
+        include = [x for i, x in enumerate(columns) if x in usecols or i in usecols]
+
+    return pa_csv.read_csv(
+        file,
+        read_options=pa_csv.ReadOptions(column_names=columns, skip_rows=1, use_threads=True),
+        parse_options=pa_csv.ParseOptions(delimiter=sep, quote_char=False if quoting == csv.QUOTE_NONE else '"'),
+        convert_options=pa_csv.ConvertOptions(
+            include_columns=include,
+            column_types={x: text_type(dtype[x]) for x in include if dtype.get(x) in TEXT_DTYPES},
+            null_values=NA_VALUES,
+            strings_can_be_null=True,
+        ),
+    )
+
+
+def sort_categories(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Sorts the categories of the categorical columns. pandas reads large files in chunks and puts the categories
+    in the order of the chunks, so sorting them makes the order the same for both engines (and any file size).
+    """
+    for column in df.columns[df.dtypes == "category"]:
+        df[column] = df[column].cat.reorder_categories(df[column].cat.categories.sort_values())
+    return df
+
+
+def to_pandas(table: "pa.Table", dtype: dict = None) -> pd.DataFrame:
+    """
+    Converts a table read by the arrow engine to the DataFrame pd.read_csv gives with the dtypes.
+    """
+    df = table.to_pandas()
+    for column in df.columns[df.dtypes == "object"]:
+        # missing strings are NaN in pandas, None in arrow
+        df[column] = df[column].fillna(np.nan)
+    dtype = {k: v for k, v in (dtype or {}).items() if k in df.columns and v != "category"}
+    return sort_categories(df.astype(dtype) if dtype else df)
+
+
+def to_arrow(table: "pa.Table", dtype: dict = None) -> "pa.Table":
+    """
+    Casts the columns of a table read by the arrow engine to the arrow types of the dtypes
+    (categories are dictionary encoded).
+    """
+    types = {
+        "object": pa.string(),
+        "float64": pa.float64(),
+        "uint32": pa.uint32(),
+        "Int32": pa.int32(),
+        "UInt32": pa.uint32(),
+    }
+    for column, kind in (dtype or {}).items():
+        if column not in table.column_names:
+            continue
+        i = table.column_names.index(column)
+        if kind == "category" and not pa.types.is_dictionary(table[column].type):
+            table = table.set_column(i, column, pc.dictionary_encode(table[column]))
+        elif kind in types:
+            table = table.set_column(i, column, table[column].cast(types[kind]))
+    return table
+
+
+def read_csv(file: str, engine: str = None, output: str = "pandas", **options):
+    """
+    Reads a csv (or tab separated) file with the pandas or the multithreaded arrow csv reader.
+    Both engines give the same pandas table (same columns, dtypes, sorted categories and exactly parsed floats).
+    The arrow engine supports the options in ARROW_OPTIONS; with other options (e.g. chunksize), or if the arrow
+    reader can not parse the file and the engine is "auto" (given or set), the file is read with pandas.
+
+    :param str file: Path to the file.
+    :param str engine: "auto", "pandas" or "arrow". Default = the engine from get_engine()
+    :param str output: "pandas" for a pd.DataFrame or "arrow" for a pa.Table. Default = "pandas"
+    :param options: Keyword arguments to pd.read_csv.
+    :return: pd.DataFrame or pa.Table (or a reader of DataFrames if chunksize is given)
+    """
+    if output == "arrow" and pa is None:
+        raise ImportError("Arrow tables need pyarrow")
+
+    # the engine asked for, here or in VIRUSHANTER_READ_ENGINE: only "auto" falls back to pandas
+    requested = engine or os.environ.get(ENGINE_VARIABLE, "pandas")
+    if get_engine(requested) == "arrow" and set(options) <= ARROW_OPTIONS:
+        try:
+            table = _read_arrow(file, **options)
+        except pa.ArrowInvalid:
+            if requested != "auto":
+                raise
+        else:
+            if output == "arrow":
+                return to_arrow(table, options.get("dtype"))
+            return to_pandas(table, options.get("dtype"))
+
+    # the round trip converter parses the floats exactly, like arrow
+    df = pd.read_csv(file, **{"float_precision": "round_trip", **options})
+    if "chunksize" in options:
+        return df
+    df = sort_categories(df)
+    if output == "arrow":
+        return pa.Table.from_pandas(df, preserve_index=False)
+    return df
@@ -0,0 +1,300 @@
+import fnmatch
+import multiprocessing as mp
+import os
+import resource
+import signal
+import sys
+import traceback
+from collections import deque
+from multiprocessing.connection import wait
+from pathlib import Path
+from typing import Callable
+
+# Memory used by a worker before it has read any file (interpreter, pandas, altair)
+BASE_MEMORY = 300 * 1024**2
+
+# How many bytes of memory pandas needs per byte of file. The first matching pattern is used.
+ARTIFACT_WEIGHTS = [
+    ("*cat_kaiju_merged.csv", 8),
+    ("*megahit.out", 6),
+    ("*contigs_names.txt", 6),
+    ("*.csv", 5),
+    ("*.html", 2),
+    ("*", 0),
+]
+
+
+def estimate_memory(sample: Path, files: dict[Path, int] = None) -> int:
+    """
+    Estimates the memory (bytes) needed to generate the report of a sample from the size of its files.
+
+    :param Path sample: Path to the sample folder.
+    :param dict files: {path: size} of the files of the sample, e.g. from the manifest. Default = found in the sample folder
+    :return: int
+    """
+    if files is None:
+        files = {x: x.stat().st_size for x in Path(sample).rglob("*") if x.is_file()}
+
+    estimate = BASE_MEMORY
+    for file, size in files.items():
+        for pattern, weight in ARTIFACT_WEIGHTS:
+            if fnmatch.fnmatch(Path(file).name, pattern):
+                estimate += size * weight
+                break
+    return estimate
+
+
+def available_memory() -> int:
+    """
+    Returns the memory (bytes) that is available for new processes.
+    """
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+
+
+def peak_rss() -> int:
+    """
+    Returns the peak resident memory (bytes) of the current process, since the last reset_peak_rss() on Linux.
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def reset_peak_rss() -> None:
+    """
+    Resets the peak resident memory of the current process to its current memory (Linux only; elsewhere
+    peak_rss() stays the peak of the whole process).
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def current_rss() -> int:
+    """
+    Returns the resident memory (bytes) of the current process.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return peak_rss()
+
+
+def _run_jobs(
+    job: Callable, job_kwargs: dict, conn, max_tasks: int, max_rss: int, reset: Callable
+) -> None:
+    """
+    Worker process: runs the jobs of the samples the scheduler sends, one at a time, and sends
+    (status, peak rss, rss growth, error, recycled, rss) back for each, until it is sent None.
+    The worker exits (is recycled) after `max_tasks` samples, when its memory is above `max_rss`
+    after a sample, or after a MemoryError.
+    """
+    tasks = 0
+    try:
+        while True:
+            sample = conn.recv()
+            if sample is None:
+                break
+            reset_peak_rss()
+            before = current_rss()
+            try:
+                job(sample, **job_kwargs)
+                status, error = "done", None
+            except MemoryError:
+                status, error = "oom", "MemoryError"
+            except Exception:
+                status, error = "failed", traceback.format_exc()
+            if reset is not None:
+                reset()
+            after = current_rss()
+
+            tasks += 1
+            recycled = (
+                status == "oom"
+                or (max_tasks is not None and tasks >= max_tasks)
+                or (max_rss is not None and after > max_rss)
+            )
+            conn.send((status, peak_rss(), after - before, error, recycled, after))
+            if recycled:
+                break
+    except EOFError:
+        # the scheduler has exited
+        pass
+    finally:
+        conn.close()
+
+
+def run_batch(
+    samples: list,
+    job: Callable,
+    job_kwargs: dict = None,
+    max_workers: int = 4,
+    memory_limit: int = None,
+    reserve: int = 512 * 1024**2,
+    estimates: dict = None,
+    max_tasks_per_worker: int = 1,
+    max_worker_rss: int = None,
+    reset: Callable = None,
+    start_method: str = None,
+) -> dict:
+    """
+    Runs `job(sample, **job_kwargs)` for every sample in worker processes.
+    A new sample is only started while the estimated memory of the running samples and the memory held by the idle
+    workers fits in the memory limit; idle workers are stopped when the sample does not fit otherwise.
+    The estimates are scaled with the ratio between the measured peak memory and the estimate of the finished samples.
+    Samples that run out of memory (killed by the OOM killer or raising MemoryError) are retried alone,
+    without any other sample running at the same time.
+    A worker runs up to `max_tasks_per_worker` samples one after the other and is then replaced by a new process;
+    it is replaced earlier if its memory is above `max_worker_rss` after a sample. `reset` is called in the worker
+    after every sample to free the global state the job leaves behind.
+
+    :param list samples: Paths to the sample folders.
+    :param Callable job: Function generating the report of one sample.
+    :param dict job_kwargs: Keyword arguments to the job. Default = None
+    :param int max_workers: Maximum number of samples running at the same time. Default = 4
+    :param int memory_limit: Memory (bytes) the running samples may use. Default = available memory - reserve
+    :param int reserve: Memory (bytes) that is always kept free. Default = 512 MB
+    :param dict estimates: {sample: estimated memory (bytes)}. Default = estimate_memory(sample)
+    :param int max_tasks_per_worker: Samples a worker runs before it is recycled (None = no limit). Default = 1
+    :param int max_worker_rss: Memory (bytes) above which a worker is recycled after a sample. Default = no limit
+    :param Callable reset: Function called in the worker after every sample. Default = None
+    :param str start_method: How the workers are started: "fork", "spawn" or "forkserver". With spawn and forkserver
+                             the job, its arguments and reset are pickled. Default = the default of multiprocessing
+    :return: dict with {sample: {"status": "done" | "oom" | "failed", "peak_rss": int, "rss_growth": int,
+             "error": str}}, where rss_growth is how much the memory of the worker grew with the sample
+    """
+    job_kwargs = job_kwargs or {}
+    context = mp.get_context(start_method)
+    if memory_limit is None:
+        memory_limit = available_memory() - reserve
+
+    pending = deque(Path(sample) for sample in samples)
+    retry = deque()
+    estimates = {Path(k): v for k, v in estimates.items()} if estimates else {}
+    for sample in pending:
+        if sample not in estimates:
+            estimates[sample] = estimate_memory(sample)
+    ratios = []
+    # {connection: [process, sample (None while idle), alone, rss after the last sample]}
+    workers = {}
+    results = {}
+
+    def scaled(sample):
+        # the largest measured / estimated ratio so far is used to be on the safe side
+        return int(estimates[sample] * max(ratios, default=1.0))
+
+    def running():
+        return {conn: worker for conn, worker in workers.items() if worker[1] is not None}
+
+    def stop(conn):
+        process = workers.pop(conn)[0]
+        # the connection is not closed on the worker's side when it is closed here: workers started later
+        # inherit it, so the worker is told to exit
+        try:
+            conn.send(None)
+        except OSError:
+            pass
+        conn.close()
+        process.join()
+
+    def start(sample, alone=False):
+        for conn in [conn for conn, worker in workers.items() if worker[1] is None and not alone]:
+            try:
+                conn.send(sample)
+            except OSError:
+                # the idle worker has died
+                stop(conn)
+                continue
+            workers[conn][1:3] = [sample, alone]
+            return
+
+        conn, child_conn = context.Pipe()
+        # retried samples get a new worker that runs only them
+        max_tasks = 1 if alone else max_tasks_per_worker
+        process = context.Process(
+            target=_run_jobs, args=(job, job_kwargs, child_conn, max_tasks, max_worker_rss, reset)
+        )
+        process.start()
+        child_conn.close()
+        workers[conn] = [process, sample, alone, 0]
+        conn.send(sample)
+
+    try:
+        while pending or retry or running():
+            # retried samples run alone, without idle workers holding memory
+            if retry and not running():
+                for conn in list(workers):
+                    stop(conn)
+                start(retry.popleft(), alone=True)
+
+            alone = any(worker[2] for worker in running().values())
+            while pending and not retry and not alone and len(running()) < max_workers:
+                sample = pending[0]
+                used = sum(scaled(worker[1]) for worker in running().values())
+                # the sample runs in the first idle worker (its memory is in the estimate), the others keep theirs
+                idle = [conn for conn, worker in workers.items() if worker[1] is None][1:]
+                fits = used + sum(workers[conn][3] for conn in idle) + scaled(sample) <= memory_limit
+                if not fits and idle:
+                    for conn in idle:
+                        stop(conn)
+                    fits = used + scaled(sample) <= memory_limit
+                headroom = available_memory() - reserve >= scaled(sample)
+                # one sample is always allowed to run
+                if running() and not (fits and headroom):
+                    break
+                start(pending.popleft())
+
+            if not running():
+                continue
+
+            for conn in wait(list(running())):
+                process, sample, alone, _ = workers[conn]
+                try:
+                    status, rss, growth, error, recycled, current = conn.recv()
+                except EOFError:
+                    # the worker died without sending anything
+                    process.join()
+                    status, rss, growth, recycled = "failed", None, None, True
+                    error = f"exit code {process.exitcode}"
+                    # killed by the OOM killer
+                    if process.exitcode == -signal.SIGKILL:
+                        status, error = "oom", "killed (SIGKILL)"
+
+                if recycled:
+                    stop(conn)
+                else:
+                    workers[conn][1:] = [None, False, current]
+
+                if rss:
+                    ratios.append(rss / estimates[sample])
+
+                if status == "oom" and not alone:
+                    retry.append(sample)
+                    continue
+
+                results[sample] = {"status": status, "peak_rss": rss, "rss_growth": growth, "error": error}
+    finally:
+        for conn, (process, sample, *_) in list(workers.items()):
+            if sample is not None:
+                # interrupted while the worker is running a sample
+                process.terminate()
+            stop(conn)
+
+    return results
@@ -0,0 +1,143 @@
+import pandas as pd
+from utils import native_formats, read_engine
+
+# Schemas of the tables read for the reports.
+# "read": keyword arguments to pd.read_csv (the files are read with utils/read_engine.py)
+# "dtypes": explicit dtypes. Repeated taxonomy strings are categoricals, counts and lengths are downcast.
+#           Nullable integers (Int32/UInt32) are used for every id, count and length, since any cell can be blank.
+#           percent stays float64, so the cutoffs compare exactly as before.
+# "required": columns that must exist in the file
+# bracken_raw and kaiju_raw are also read from the native bracken report and kaiju2table output (utils/native_formats.py)
+RANKS = ["superkingdom", "phylum", "class", "order", "family", "genus", "species"]
+
+SCHEMAS = {
+    "bracken_raw": {
+        "read": {},
+        "dtypes": {
+            "name": "object",
+            "level": "category",
+            "percent": "float64",
+            "domain": "category",
+            "new_est_reads": "UInt32",
+        },
+        "required": ["name", "level", "percent", "domain", "new_est_reads"],
+    },
+    "kaiju_raw": {
+        "read": {},
+        "dtypes": {
+            "taxon_id": "Int32",
+            "percent": "float64",
+            "taxon_name": "category",
+            "reads": "UInt32",
+            "taxonomy": "category",
+        },
+        "required": ["taxon_id", "percent", "taxon_name", "reads", "taxonomy"],
+    },
+    "kaiju_megahit": {
+        # all columns are named, so that a first line with only 3 columns (an unclassified contig)
+        # does not make pandas drop the taxonomy column
+        "read": {
+            "sep": "\t",
+            "header": None,
+            "usecols": ["name", "taxon_id", "taxonomy"],
+            "names": ["classified", "name", "taxon_id", "score", "taxon_ids", "accessions", "fragments", "taxonomy"],
+        },
+        "dtypes": {
+            "name": "object",
+            "taxon_id": "UInt32",
+            "taxonomy": "category",
+        },
+        "required": [],
+    },
+    "cat_megahit": {
+        "read": {"sep": "\t"},
+        "dtypes": {
+            "# contig": "object",
+            "classification": "category",
+            "reason": "category",
+            "lineage": "category",
+            "lineage scores": "category",
+            **{rank: "category" for rank in RANKS},
+        },
+        "required": ["# contig", "classification", "lineage", "lineage scores", *RANKS],
+    },
+    "megahit_contigs": {
+        "read": {},
+        "dtypes": {"length": "UInt32"},
+        "required": ["length"],
+    },
+    "contig_coverage": {
+        "read": {},
+        "dtypes": {
+            "contig": "category",
+            "position": "UInt32",
+            "coverage": "UInt32",
+            "length": "UInt32",
+        },
+        "required": ["contig", "position", "coverage", "length"],
+    },
+    "cat_kaiju_merged": {
+        "read": {},
+        "dtypes": {
+            "name": "object",
+            "taxon_id": "UInt32",
+            "length": "UInt32",
+            "last_level_kaiju": "category",
+            "last_level_cat": "category",
+            "sequence": "object",
+        },
+        "required": ["name", "taxon_id", "length", "last_level_kaiju", "last_level_cat"],
+    },
+}
+
+
+def read_table(kind: str, file: str, engine: str = None, output: str = "pandas", **kwargs) -> pd.DataFrame:
+    """
+    Reads a table with the schema of its kind.
+    Raises ValueError if the file does not have the columns the schema requires.
+
+    Files in the native format of their kind (see native_formats.PARSERS) are parsed into the same table.
+
+    :param str kind: Kind of table, one of the keys in SCHEMAS.
+    :param str file: Path to the file.
+    :param str engine: Read engine, see read_engine.read_csv. Default = the configured engine
+    :param str output: "pandas" or "arrow". Default = "pandas"
+    :param kwargs: Extra keyword arguments to pd.read_csv, e.g. usecols or chunksize.
+    :return: pd.DataFrame (a pa.Table with output="arrow", or a reader of DataFrames if chunksize is given)
+    """
+    schema = SCHEMAS[kind]
+
+    parse = native_formats.parser(kind, file)
+    if parse is not None:
+        return _read_native(kind, parse(file), output, **kwargs)
+
+    options = {**schema["read"], **kwargs}
+
+    if options.get("names") is not None:
+        columns = list(options["names"])
+    else:
+        header = pd.read_csv(file, nrows=0, sep=options.get("sep", ","))
+        columns = list(header.columns)
+        missing = [x for x in schema["required"] if x not in columns]
+        if missing:
+            raise ValueError(f"{file} is missing the columns {missing} of a {kind} table")
+
+    usecols = options.get("usecols")
+    if usecols is not None and options.get("names") is None:
+        columns = [x for x in columns if x in usecols]
+
+    options["dtype"] = {k: v for k, v in schema["dtypes"].items() if k in columns}
+
+    return read_engine.read_csv(file, engine=engine, output=output, **options)
+
+
+def _read_native(kind: str, df: pd.DataFrame, output: str, usecols: list = None, **kwargs):
+    # applies the schema to a table parsed from a native format
+    if kwargs:
+        raise ValueError(f"Native {kind} files can not be read with {sorted(kwargs)}")
+    if usecols is not None:
+        df = df[[x for x in df.columns if x in usecols]]
+    df = read_engine.sort_categories(df.astype({k: v for k, v in SCHEMAS[kind]["dtypes"].items() if k in df.columns}))
+    if output == "arrow":
+        return read_engine.pa.Table.from_pandas(df, preserve_index=False)
+    return df
@@ -0,0 +1,202 @@
+import hashlib
+import io
+import os
+import re
+from pathlib import Path
+
+import numpy as np
+
+CACHE_DIR = Path.home() / ".cache" / "virushanter" / "assets"
+
+# Version of the optimization, part of the key of the cached assets so they are made again when it changes
+ASSET_VERSION = 2
+
+NUMBER = r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?"
+
+
+def rdp(points: np.ndarray, tolerance: float) -> np.ndarray:
+    """
+    Ramer-Douglas-Peucker simplification of a polyline.
+
+    :param np.ndarray points: (n, 2) array with the points of the line.
+    :param float tolerance: Maximum distance (in svg units, i.e. pixels) between the line and the simplified line.
+    :return: np.ndarray with the kept points.
+    """
+    n = len(points)
+    if n < 3:
+        return points
+
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+
+    while stack:
+        start, end = stack.pop()
+        if end <= start + 1:
+            continue
+        a, b = points[start], points[end]
+        between = points[start + 1 : end]
+        direction = b - a
+        length = np.hypot(*direction)
+        if length == 0:
+            distance = np.hypot(*(between - a).T)
+        else:
+            distance = np.abs(
+                direction[0] * (between[:, 1] - a[1]) - direction[1] * (between[:, 0] - a[0])
+            ) / length
+        i = distance.argmax()
+        if distance[i] > tolerance:
+            index = start + 1 + i
+            keep[index] = True
+            stack.append((start, index))
+            stack.append((index, end))
+
+    return points[keep]
+
+
+def _format(x: float, precision: int) -> str:
+    text = f"{x:.{precision}f}".rstrip("0").rstrip(".")
+    return "0" if text in ("", "-0") else text
+
+
+def _format_points(points: np.ndarray, precision: int) -> list[str]:
+    return [f"{_format(x, precision)} {_format(y, precision)}" for x, y in points]
+
+
+def simplify_path(d: str, tolerance: float, precision: int) -> str:
+    """
+    Simplifies a path made of absolute moveto and lineto commands (the lines of a plot).
+    Paths with any other command are returned unchanged.
+    """
+    if re.search(r"[A-DF-KN-Za-df-z]", d):
+        return d
+
+    subpaths = []
+    for part in re.split(r"(?=M)", d):
+        numbers = re.findall(NUMBER, part)
+        if not numbers:
+            continue
+        if len(numbers) % 2:
+            return d
+        points = rdp(np.array(numbers, dtype=float).reshape(-1, 2), tolerance)
+        first, *rest = _format_points(points, precision)
+        subpaths.append(f"M{first}" + "".join(f"L{x}" for x in rest))
+
+    return "".join(subpaths)
+
+
+def simplify_points(points: str, tolerance: float, precision: int) -> str:
+    """
+    Simplifies the points of a <polyline>.
+    """
+    numbers = re.findall(NUMBER, points)
+    if len(numbers) % 2:
+        return points
+    simplified = rdp(np.array(numbers, dtype=float).reshape(-1, 2), tolerance)
+    return " ".join(x.replace(" ", ",") for x in _format_points(simplified, precision))
+
+
+def optimize_svg(svg: str, tolerance: float = 0.5, precision: int = 1) -> str:
+    """
+    Minifies the svg and simplifies its polylines.
+
+    :param str svg: The svg code.
+    :param float tolerance: Maximum distance (pixels) between a simplified line and the original. Default = 0.5
+    :param int precision: Number of decimals kept in the coordinates of the lines. Default = 1
+    :return: str with the optimized svg
+    """
+    svg = re.sub(r"<!--.*?-->", "", svg, flags=re.S)
+    svg = re.sub(r"<metadata.*?</metadata>", "", svg, flags=re.S)
+    svg = re.sub(
+        r'(<path\b[^>]*?\sd=")([^"]*)(")',
+        lambda m: m.group(1) + simplify_path(m.group(2), tolerance, precision) + m.group(3),
+        svg,
+        flags=re.S,
+    )
+    svg = re.sub(
+        r'(<polyline\b[^>]*?\spoints=")([^"]*)(")',
+        lambda m: m.group(1) + simplify_points(m.group(2), tolerance, precision) + m.group(3),
+        svg,
+        flags=re.S,
+    )
+    # whitespace between the tags of a <text> (e.g. between two <tspan>) is shown, so it is kept
+    svg = re.sub(
+        r"(<text\b(?:[^>]*/>|.*?</text>))|(?<=>)\s+(?=<)",
+        lambda m: m.group(1) or "",
+        svg,
+        flags=re.S,
+    )
+    return svg.strip()
+
+
+def rasterize(svg: str, raster_format: str = "png") -> bytes:
+    """
+    Renders the svg to a compressed png or webp.
+    Needs cairosvg (and Pillow for webp). Returns None if they are not installed.
+    """
+    try:
+        import cairosvg
+    except ImportError:
+        return None
+
+    png = cairosvg.svg2png(bytestring=svg.encode())
+    if raster_format == "png":
+        return png
+
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+
+    image = io.BytesIO()
+    Image.open(io.BytesIO(png)).save(image, format="WEBP", quality=90, method=6)
+    return image.getvalue()
+
+
+class SvgProcessor:
+    """
+    Optimizes svg plots before they are put in a report. The svg is minified and its lines are simplified.
+    If the result is still larger than `max_bytes` it is rasterized to png or webp (if cairosvg is installed).
+    The processed assets are cached by the hash of the svg and the options, so unchanged plots are not processed again.
+    """
+
+    def __init__(
+        self,
+        folder: str = CACHE_DIR,
+        tolerance: float = 0.5,
+        precision: int = 1,
+        max_bytes: int = 500_000,
+        raster_format: str = "png",
+    ):
+        self.folder = Path(folder)
+        self.folder.mkdir(parents=True, exist_ok=True)
+        self.tolerance = tolerance
+        self.precision = precision
+        self.max_bytes = max_bytes
+        self.raster_format = raster_format
+
+    def process(self, svg_file: str) -> Path:
+        """
+        Returns the path to the processed asset (.svg, .png or .webp) of the svg file.
+        """
+        content = Path(svg_file).read_bytes()
+        options = f"{ASSET_VERSION}:{self.tolerance}:{self.precision}:{self.max_bytes}:{self.raster_format}"
+        key = hashlib.sha256(content + options.encode()).hexdigest()
+
+        for suffix in (".svg", f".{self.raster_format}"):
+            cached = self.folder / f"{key}{suffix}"
+            if cached.exists():
+                return cached
+
+        svg = optimize_svg(content.decode(), self.tolerance, self.precision)
+        data, suffix = svg.encode(), ".svg"
+        if len(data) > self.max_bytes:
+            raster = rasterize(svg, self.raster_format)
+            if raster is not None:
+                data, suffix = raster, f".{self.raster_format}"
+
+        asset = self.folder / f"{key}{suffix}"
+        tmp = asset.with_name(f"{asset.name}.{os.getpid()}.tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, asset)
+        return asset
@@ -0,0 +1,103 @@
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable
+
+
+def threads_per_process(processes: int = 1, max_threads: int = 8) -> int:
+    """
+    Returns the number of loader threads a single report can use when `processes`
+    reports are generated at the same time, so that the thread pools of all the
+    processes together do not use more threads than there are cores.
+
+    :param int processes: Number of report processes running at the same time. Default = 1
+    :param int max_threads: Upper limit of threads for one report. Default = 8
+    :return: int
+    """
+    cores = os.cpu_count() or 1
+    return max(1, min(max_threads, cores // max(1, processes)))
+
+
+def run_task_graph(
+    tasks: dict[str, tuple[Callable, list[str]]],
+    max_workers: int = 1,
+    results: dict[str, Any] = None,
+    targets: list[str] = None,
+    timeout: float = None,
+) -> dict[str, Any]:
+    """
+    Runs a small dependency graph of tasks on a bounded thread pool.
+    A task is started as soon as all of its dependencies are finished, and is called
+    with the results of the dependencies as positional arguments (in the listed order).
+
+    :param dict tasks: {name: (function, [names of dependencies])}
+    :param int max_workers: Number of threads in the pool. Default = 1
+    :param dict results: Already computed results. These tasks are not run again. Results that are futures
+        (tasks still running when an earlier call timed out) are waited for instead. Default = None
+    :param list targets: Only run these tasks and their dependencies. Default = all tasks
+    :param float timeout: Seconds to wait for the tasks. Tasks not started by then are cancelled and left out of
+        the results, tasks still running are returned as their Future (see finished). Default = no limit
+    :return: dict with {name: result} for all tasks
+    """
+    results = dict(results or {})
+    started = {name: value for name, value in results.items() if isinstance(value, Future)}
+    for name in started:
+        del results[name]
+    if targets is not None:
+        needed, stack = set(), list(targets)
+        while stack:
+            name = stack.pop()
+            if name not in needed and name in tasks:
+                needed.add(name)
+                stack.extend(tasks[name][1])
+        tasks = {name: task for name, task in tasks.items() if name in needed}
+    pending = {name: task for name, task in tasks.items() if name not in results and name not in started}
+
+    for name, (_, deps) in pending.items():
+        missing = [dep for dep in deps if dep not in tasks and dep not in results and dep not in started]
+        if missing:
+            raise ValueError(f"Task '{name}' depends on unknown tasks: {missing}")
+
+    deadline = None if timeout is None else time.monotonic() + timeout
+    # the tasks started by an earlier call are finished rather than run again
+    running = {future: name for name, future in started.items() if name in tasks}
+    results |= {name: future for name, future in started.items() if name not in tasks}
+    timed_out = False
+    pool = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        while pending or running:
+            # submit every task whose dependencies are done
+            for name, (func, deps) in list(pending.items()):
+                if all(dep in results for dep in deps):
+                    args = [results[dep] for dep in deps]
+                    running[pool.submit(func, *args)] = name
+                    del pending[name]
+
+            if not running:
+                raise ValueError(f"Circular dependencies between tasks: {list(pending)}")
+
+            remaining = None if deadline is None else max(0, deadline - time.monotonic())
+            done, _ = wait(running, timeout=remaining, return_when=FIRST_COMPLETED)
+            if not done:
+                timed_out = True
+                # the tasks that are already running are handed to the next call
+                for future, name in running.items():
+                    if not future.cancel():
+                        results[name] = future
+                break
+            for future in done:
+                name = running.pop(future)
+                # raises the exception of the task if it failed
+                results[name] = future.result()
+    finally:
+        # after a timeout, do not wait for the tasks that are still running
+        pool.shutdown(wait=not timed_out)
+
+    return results
+
+
+def finished(results: dict[str, Any]) -> dict[str, Any]:
+    """
+    Returns the results of run_task_graph without the tasks that were still running at the timeout.
+    """
+    return {name: value for name, value in results.items() if not isinstance(value, Future)}
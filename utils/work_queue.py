@@ -0,0 +1,254 @@
+import json
+import os
+import socket
+import threading
+import time
+import traceback
+from pathlib import Path
+from typing import Callable
+
+# Default time (seconds) without heartbeat after which a lease is seen as abandoned
+LEASE_TTL = 300
+
+
+def worker_id() -> str:
+    """
+    Returns an id for this worker that is unique in the cluster (host:pid).
+    """
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def shared_clock(queue_dir: Path) -> float:
+    """
+    Returns the current time of the shared filesystem.
+    The lease ages are measured against this clock so that the clocks of the nodes do not need to agree.
+    """
+    clock = Path(queue_dir) / ".clock"
+    clock.touch()
+    return clock.stat().st_mtime
+
+
+def claim(queue_dir: Path, sample_name: str, ttl: float = LEASE_TTL) -> str:
+    """
+    Tries to claim a sample by atomically creating its lease file.
+    A lease which has not been renewed for `ttl` seconds (the worker crashed) is reclaimed.
+
+    :param Path queue_dir: Folder with the lease files on the shared filesystem.
+    :param str sample_name: Name of the sample.
+    :param float ttl: Age (seconds) after which a lease is stale. Default = 300
+    :return: The content of the lease (worker and time of the claim) if the sample was claimed by this worker,
+             otherwise None. It is passed to Heartbeat and release, which only touch the lease of this claim.
+    """
+    queue_dir = Path(queue_dir)
+    lease = queue_dir / f"{sample_name}.lease"
+
+    if (queue_dir / f"{sample_name}.done").exists() or (queue_dir / f"{sample_name}.failed").exists():
+        return None
+
+    try:
+        fd = os.open(lease, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        if not _reclaim_stale(lease, ttl):
+            return None
+        return claim(queue_dir, sample_name, ttl)
+
+    token = json.dumps({"worker": worker_id(), "claimed": time.time()})
+    with os.fdopen(fd, "w") as f:
+        f.write(token)
+    return token
+
+
+def _read_lease(lease: Path) -> tuple[str, int]:
+    # the content (worker and time of the claim, unique for every claim) and the time of the last heartbeat
+    with open(lease) as f:
+        return f.read(), os.fstat(f.fileno()).st_mtime_ns
+
+
+def _reclaim_stale(lease: Path, ttl: float) -> bool:
+    """
+    Removes the lease if it is stale. Returns True if it was removed by this worker.
+    """
+    try:
+        content, mtime_ns = _read_lease(lease)
+    except FileNotFoundError:
+        # released in the meantime
+        return True
+
+    if shared_clock(lease.parent) - mtime_ns / 1e9 < ttl:
+        return False
+
+    # Only one worker can rename the stale lease
+    stale = lease.with_name(f"{lease.name}.stale.{worker_id()}")
+    try:
+        os.rename(lease, stale)
+    except FileNotFoundError:
+        return False
+
+    # Another worker may have reclaimed and recreated the lease between reading and renaming it, or its worker
+    # may have renewed it. The lease is only removed if it is still the stale lease that was read (the inode
+    # number is not enough: it is reused as soon as a file is removed); otherwise it is put back.
+    if _read_lease(stale) != (content, mtime_ns):
+        try:
+            os.link(stale, lease)
+        except FileExistsError:
+            pass
+        stale.unlink()
+        return False
+
+    stale.unlink()
+    return True
+
+
+def _remove_lease(lease: Path, token: str) -> bool:
+    """
+    Removes the lease if it is still the lease of the claim `token`. Returns True if it was removed.
+    """
+    # like in _reclaim_stale, the lease is moved aside first, so it can not be replaced between checking and removing it
+    own = lease.with_name(f"{lease.name}.release.{worker_id()}")
+    try:
+        os.rename(lease, own)
+    except FileNotFoundError:
+        return False
+    if own.read_text() != token:
+        # the lease was reclaimed by another worker
+        try:
+            os.link(own, lease)
+        except FileExistsError:
+            pass
+        own.unlink()
+        return False
+    own.unlink()
+    return True
+
+
+def release(queue_dir: Path, sample_name: str, status: str = "done", message: str = "", token: str = None) -> None:
+    """
+    Marks the sample as done (or failed) and removes the lease.
+
+    :param Path queue_dir: Folder with the lease files on the shared filesystem.
+    :param str sample_name: Name of the sample.
+    :param str status: "done" or "failed". Default = "done"
+    :param str message: Written to the marker file, e.g. the traceback. Default = ""
+    :param str token: The claim (from claim). The lease is only removed if it is still the lease of this claim,
+                      not if another worker has reclaimed it. Default = None (the lease is removed)
+    """
+    queue_dir = Path(queue_dir)
+    marker = queue_dir / f"{sample_name}.{status}"
+    marker.write_text(f"{worker_id()}\n{message}")
+    lease = queue_dir / f"{sample_name}.lease"
+    if token is None:
+        lease.unlink(missing_ok=True)
+    else:
+        _remove_lease(lease, token)
+
+
+class Heartbeat:
+    """
+    Renews the lease of a sample in a background thread while the sample is processed.
+    With the `token` of the claim, only the lease of this claim is renewed: if the lease was reclaimed by another
+    worker (this worker was too slow), the heartbeat stops and `lost` is set.
+    """
+
+    def __init__(self, lease: Path, interval: float, token: str = None):
+        self.lease = Path(lease)
+        self.interval = interval
+        self.token = token
+        self.lost = False
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._beat, daemon=True)
+
+    def _beat(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                with open(self.lease) as f:
+                    if self.token is not None and f.read() != self.token:
+                        self.lost = True
+                        return
+                    # the file that was checked is renewed, even if the lease is replaced meanwhile
+                    os.utime(f.fileno())
+            except FileNotFoundError:
+                # the lease is moved aside for a moment while another worker checks whether it is stale
+                continue
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stopped.set()
+        self.thread.join()
+
+
+def progress(queue_dir: Path, sample_names: list[str]) -> dict[str, int]:
+    """
+    Returns the progress of all workers in the cluster.
+
+    :param Path queue_dir: Folder with the lease files on the shared filesystem.
+    :param list sample_names: Names of all samples.
+    :return: dict with the number of samples that are done, failed, running and waiting
+    """
+    files = {x.name for x in Path(queue_dir).iterdir()}
+    counts = {"total": len(sample_names), "done": 0, "failed": 0, "running": 0, "waiting": 0}
+    for name in sample_names:
+        if f"{name}.done" in files:
+            counts["done"] += 1
+        elif f"{name}.failed" in files:
+            counts["failed"] += 1
+        elif f"{name}.lease" in files:
+            counts["running"] += 1
+        else:
+            counts["waiting"] += 1
+    return counts
+
+
+def run_worker(
+    samples: list,
+    job: Callable,
+    queue_dir: Path,
+    job_kwargs: dict = None,
+    ttl: float = LEASE_TTL,
+) -> None:
+    """
+    Claims and processes samples until every sample is done or failed.
+    Any number of workers, on any host, can run at the same time with the same queue folder.
+    While other workers hold leases this worker waits, and takes over the leases that become stale.
+
+    :param list samples: Paths to the sample folders.
+    :param Callable job: Function generating the report of one sample, called as job(sample, **job_kwargs).
+    :param Path queue_dir: Folder with the lease files on the shared filesystem.
+    :param dict job_kwargs: Keyword arguments to the job. Default = None
+    :param float ttl: Age (seconds) after which a lease is stale. Default = 300
+    """
+    job_kwargs = job_kwargs or {}
+    queue_dir = Path(queue_dir)
+    queue_dir.mkdir(parents=True, exist_ok=True)
+    samples = [Path(x) for x in samples]
+    names = [x.name for x in samples]
+
+    while True:
+        for sample in samples:
+            token = claim(queue_dir, sample.name, ttl)
+            if token is None:
+                continue
+
+            with Heartbeat(queue_dir / f"{sample.name}.lease", interval=ttl / 3, token=token) as heartbeat:
+                try:
+                    job(sample, **job_kwargs)
+                    release(queue_dir, sample.name, "done", token=token)
+                except Exception:
+                    release(queue_dir, sample.name, "failed", traceback.format_exc(), token=token)
+            if heartbeat.lost:
+                print(f"[{worker_id()}] the lease of {sample.name} was reclaimed by another worker while it ran")
+
+            counts = progress(queue_dir, names)
+            print(
+                f"[{worker_id()}] {sample.name} finished. "
+                f"{counts['done']}/{counts['total']} done, {counts['running']} running, "
+                f"{counts['waiting']} waiting, {counts['failed']} failed"
+            )
+
+        counts = progress(queue_dir, names)
+        if counts["running"] == 0 and counts["waiting"] == 0:
+            return
+        # wait for the other workers, or for their leases to become stale
+        time.sleep(min(ttl / 2, 30))
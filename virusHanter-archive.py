@@ -0,0 +1,51 @@
+import argparse
+import sys
+from report import archive
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Archive of reports: one pack file in which the parts that the reports share are stored once")
+    parser.add_argument("pack", help="Pack file of the archive")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    add = commands.add_parser("add", help="Add reports to the archive (created if it does not exist). Changed reports are added as a new version")
+    add.add_argument("reports", nargs="+", help="Report files, or folders whose files are added with their path relative to the folder")
+    add.add_argument("--new-dictionary", action="store_true", help="Compress the new reports with a new dictionary, e.g. after the layout of the reports changed")
+
+    extract = commands.add_parser("extract", help="Write reports from the archive")
+    extract.add_argument("names", nargs="*", help="Reports to extract. Default: all")
+    extract.add_argument("--outdir", default=".", help="Folder to write the reports to")
+    extract.add_argument("--version", type=int, default=-1, help="Version of the reports, 0 is the first. Default: the latest")
+
+    commands.add_parser("list", help="List the reports in the archive")
+
+    serve = commands.add_parser("serve", help="Serve the reports of the archive over http")
+    serve.add_argument("--host", default="127.0.0.1", help="Default: 127.0.0.1")
+    serve.add_argument("--port", type=int, default=8000, help="Default: 8000")
+    args = parser.parse_args()
+
+    if args.command == "add":
+        status = archive.add(args.pack, archive.report_files(args.reports), args.new_dictionary)
+        for name, result in status.items():
+            print(f"{name}: {result}")
+        sys.exit(0)
+
+    if args.command == "serve":
+        archive.serve(args.pack, args.host, args.port)
+        sys.exit(0)
+
+    with archive.Archive(args.pack) as pack:
+        if args.command == "list":
+            for name, versions in pack.reports().items():
+                print(f"{name}\t{versions[-1]['size']}\t{len(versions)} version(s)")
+            stats = pack.stats()
+            print(
+                f"{stats['reports']} reports ({stats['versions']} versions, {stats['report_bytes'] / 1024**2:.1f} MB)"
+                f" in {stats['pack_bytes'] / 1024**2:.1f} MB"
+            )
+        else:
+            for name in args.names or pack.names():
+                try:
+                    print(pack.extract(name, args.outdir, args.version))
+                except (KeyError, IndexError):
+                    sys.exit(f"No version {args.version} of {name} in {args.pack}")
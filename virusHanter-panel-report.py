@@ -1,338 +1,106 @@
-import pandas as pd
-import numpy as np
-import panel as pn
-import altair as alt
 from pathlib import Path
+import argparse
+from report import archive, state
+from report.panel_report import panel_job, panel_preview, panel_report
+from utils import cat_lineage, manifest, read_engine, scheduler, svg_assets
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate Panel reports for the samples in the results folder")
+    parser.add_argument("--results", default="../virusclassification_nextflow/results/", help="Folder with one subfolder per sample")
+    parser.add_argument("--coverage-plots", default="../virusclassification_nextflow/results/", help="Folder with the coverage plots (<folder>/<sample>/*.svg)")
+    parser.add_argument("--outdir", default=".", help="Folder to write the reports to")
+    parser.add_argument("--processes", type=int, default=1, help="Maximum number of samples to generate reports for at the same time")
+    parser.add_argument("--memory-limit", type=float, default=None, help="Memory (GB) the running samples may use. Default: available memory")
+    parser.add_argument("--max-samples-per-worker", type=int, default=1, help="Samples a worker process generates reports for before it is replaced by a new process (with --processes > 1). Default: 1")
+    parser.add_argument("--max-worker-rss", type=float, default=None, help="Memory (GB) above which a worker process is replaced after a sample (with --processes > 1). Default: no limit")
+    parser.add_argument("--deferred-tabs", action="store_true", help="Store the hidden tabs as gzipped json and only render them when they are clicked")
+    parser.add_argument("--optimize-svg", action="store_true", help="Minify the coverage plots and simplify their lines before they are embedded")
+    parser.add_argument("--svg-tolerance", type=float, default=0.5, help="Maximum distance (pixels) between a simplified line and the original. Default: 0.5")
+    parser.add_argument("--svg-max-kb", type=int, default=500, help="Coverage plots still larger than this (KB) after optimization are rasterized, if cairosvg is installed. Default: 500")
+    parser.add_argument("--svg-raster-format", choices=["png", "webp"], default="png", help="Format of the rasterized coverage plots. Default: png")
+    parser.add_argument("--asset-cache", default=svg_assets.CACHE_DIR, help=f"Folder with the processed coverage plots. Default: {svg_assets.CACHE_DIR}")
+    parser.add_argument("--cat-cache", default=None, help="Folder to cache the parsed CAT tables in, so that each CAT file is only parsed once")
+    parser.add_argument("--cat-cache-size", type=float, default=1, help="Maximum size (GB) of the CAT table cache")
+    parser.add_argument("--preview", action="store_true", help="First write a preview of the reports with the read statistics and the raw read classification, then the full reports")
+    parser.add_argument("--preview-budget", type=float, default=30, help="Seconds to build the preview of a report in. Tabs not started by then are pending until the full report. Default: 30")
+    parser.add_argument("--manifest", default=None, help="File with the manifest of the results folder, which is updated incrementally. Default: <results>/.virushanter/manifest.json")
+    parser.add_argument("--archive", default=None, help="Pack file of a report archive to add the reports to (see virusHanter-archive.py). Unchanged reports are not added again")
+    parser.add_argument("--archive-run", default=None, help="Name the reports are stored under in the archive (<run>/<report>). Default: the name of the output folder")
+    parser.add_argument("--read-engine", choices=read_engine.ENGINES, default=None, help=f"Engine to read the tables with: pandas, or the multithreaded arrow reader (needs pyarrow). Default: ${read_engine.ENGINE_VARIABLE} or pandas (auto: arrow if pyarrow is installed)")
+    args = parser.parse_args()
+    if args.read_engine:
+        read_engine.set_engine(args.read_engine)
+    if args.cat_cache:
+        cat_lineage.set_cache_dir(args.cat_cache, max_bytes=int(args.cat_cache_size * 1024**3))
+
+    # read in the data
+    sample_folder = Path(args.results)
+    results_manifest = manifest.update(sample_folder, args.manifest)
+    svg_processor = None
+    if args.optimize_svg:
+        svg_processor = svg_assets.SvgProcessor(
+            args.asset_cache,
+            tolerance=args.svg_tolerance,
+            max_bytes=args.svg_max_kb * 1000,
+            raster_format=args.svg_raster_format,
+        )
 
-# Import plotting functions from plotting
-from plotting import (
-    bracken_raw,
-    contig_quality,
-    kaiju_raw,
-    kaiju_megahit,
-    cat_megahit,
-    bowtie2_alignment_plot,
-)
-from utils import parse_bowtielog, parse_fastp_report
-
-pn.extension("tabulator")
-pn.extension("vega", sizing_mode="stretch_width", template="fast")
-pn.widgets.Tabulator.theme = "modern"
-
-
-# Header
-def header(
-    text: str,
-    bg_color: str = "#04c273",
-    height: int = 150,
-    fontsize: str = "px20",
-    textalign: str = "center",
-):
-    """
-    Template for markdown header like block
-    """
-    return pn.pane.Markdown(
-        f"""
-        {text}
-        """,
-        background=bg_color,
-        height=height,
-        margin=10,
-        style={
-            "color": "white",
-            "padding": "10px",
-            "text-align": f"{textalign}",
-            "font-size": f"{fontsize}",
-        },
-    )
-
-
-# Generate the report
-def panel_report(
-    sample: str,
-    coverage_plot_path: str,
-    outfolder: str,
-) -> None:
-    """
-    Generates Panel report
-    """
-    # --- IO --- #
-    sample = Path(sample)
-    outfolder = Path(outfolder)
-    sample_name = sample.parts[-1]
-
-    # --- Alignment and Read Statistics --- #
-
-    # Number of reads and number of reads aligned to reference genome (from bowtie2logfile)
-    bowtie2log = list(sample.rglob("*bowtie_raw.log"))[0]
-
-    total_reads, percent_aligned = parse_bowtielog.parse_alignments(bowtie2log)
-    number_aligned = int(total_reads * percent_aligned / 100)
-    number_unaligned = total_reads - number_aligned
-
-    # Markdown with above text
-    alignment_stats = pn.pane.Markdown(
-        f"""
-        ### Total Number of Reads: 
-        {total_reads}
-        ### Reads aligned to Human Genome: 
-        {number_aligned} ({percent_aligned}%)
-        ### Reads NOT aligned to Human Genome:
-        {number_unaligned} ({100 - percent_aligned}%)
-        """,
-        name="Alignment Stats",
-    )
-
-    # Bowtie2 alignment plot:
-    bowtie_plot = bowtie2_alignment_plot.plot_alignment(bowtie2log).interactive()
-    bowtie_plot_pane = pn.pane.Vega(
-        bowtie_plot, sizing_mode="stretch_both", name="Alignment Plot"
-    )
-
-    # fastp report
-    fastp_report = list(sample.rglob("*fastp/*.html"))[0]
-
-    fastp_df = parse_fastp_report.parse_fastp(fastp_report)
-
-    fastp_table = pn.widgets.Tabulator(
-        fastp_df, layout="fit_columns", show_index=False, name="Read Summary from FASTP"
-    )
-
-    # Header for this section
-    alignment_subheader = header(
-        text=f"## Alignment and Read statistics",
-        bg_color="#04c273",
-        height=80,
-        textalign="left",
-    )
-
-    bowtie_and_stats = pn.Column(
-        alignment_stats, pn.layout.Divider(), bowtie_plot_pane, name="Alignment"
-    )
-
-    # Section
-    alignment_tab = pn.Tabs(bowtie_and_stats, fastp_table)
-    alignment_section = pn.Column(alignment_subheader, alignment_tab)
-
-    # --- Raw Classification --- #
-
-    number = 10
-    # Raw bracken and kaiju report
-    cleaned_bracken_report = list(sample.rglob("*bracken_raw.csv"))[0]
-    cleaned_kaiju_report = list(sample.rglob("*kaiju_raw.csv"))[0]
-
-    # Raw bracken and kaiju plots
-    bracken_bar_plot = bracken_raw.bar_chart_bracken_raw(
-        cleaned_bracken_report, number=number, virus_only=True
-    ).interactive()
-
-    bracken_domain_bar_plot = bracken_raw.bar_chart_bracken_raw(
-        cleaned_bracken_report, level="domain", virus_only=False
-    ).interactive()
-
-    kaiju_raw_plot = kaiju_raw.bar_chart_kaiju_raw(
-        file=cleaned_kaiju_report
-    ).interactive()
-
-    # Vega panes
-    bracken_bar_plot_pane = pn.pane.Vega(
-        bracken_bar_plot, sizing_mode="stretch_both", name="Kraken Virus Only"
-    )
-    bracken_domain_bar_plot_pane = pn.pane.Vega(
-        bracken_domain_bar_plot, sizing_mode="stretch_both", name="Kraken All Domains"
-    )
-    kaiju_raw_plot_pane = pn.pane.Vega(
-        kaiju_raw_plot, sizing_mode="stretch_both", name="Kaiju"
-    )
-
-    # Header for this section
-    raw_header = header(
-        text=f"## Classification of Raw Reads",
-        bg_color="#04c273",
-        height=80,
-        textalign="left",
-    )
-
-    # Section
-    raw_tab = pn.Tabs(
-        bracken_bar_plot_pane, bracken_domain_bar_plot_pane, kaiju_raw_plot_pane
-    )
-    raw_section = pn.Column(raw_header, raw_tab)
-
-    # --- Contig Classification --- #
-
-    # Contigs (Megahit)
-    megahit_csv = list(sample.rglob("megahit/*.csv"))[0]
-    megahit_histogram = contig_quality.megahit_contig_histogram(
-        file=megahit_csv
-    ).interactive()
-
-    # Contigs (CAT and Kaiju)
-    kaiju_megahit_report = list(sample.rglob("*megahit.out"))[0]
-    cat_megahit_out = list(sample.rglob("*contigs_names.txt"))[0]
-    cat_kaiju_csv = list(sample.rglob("*cat_kaiju_merged.csv"))[0]
-
-    # plots
-    kaiju_bar_plot = kaiju_megahit.bar_chart_kaiju_megahit(
-        file=kaiju_megahit_report
-    ).interactive()
-    cat_bar_plot = cat_megahit.bar_chart_cat_megahit(file=cat_megahit_out).interactive()
-
-    # Vega panes
-    megahit_histogram_pane = pn.pane.Vega(
-        megahit_histogram, sizing_mode="stretch_both", name="Contig Histogram"
-    )
-    kaiju_bar_plot_pane = pn.pane.Vega(
-        kaiju_bar_plot, sizing_mode="stretch_both", name="Kaiju"
-    )
-    cat_bar_plot_pane = pn.pane.Vega(
-        cat_bar_plot, sizing_mode="stretch_both", name="CAT"
-    )
-
-    # cat and kaiju dataframe
-    cat_kaiju_csv = list(sample.rglob("*cat_kaiju_merged.csv"))[0]
-    cat_kaiju_df = pd.read_csv(cat_kaiju_csv)[
-        ["name", "taxon_id", "length", "last_level_kaiju", "last_level_cat", "sequence"]
-    ]
-    cat_kaiju_table = pn.widgets.Tabulator(
-        cat_kaiju_df,
-        editors={"sequence": {"type": "editable", "value": False}},
-        layout="fit_columns",
-        pagination="local",
-        page_size=15,
-        show_index=False,
-        name="Contig Table",
-    )
-
-    # Header for this section
-    contig_header = header(
-        text=f"## Classification of Contigs",
-        bg_color="#04c273",
-        height=80,
-        textalign="left",
-    )
-
-    # Section
-    contig_tab = pn.Tabs(
-        megahit_histogram_pane, kaiju_bar_plot_pane, cat_bar_plot_pane, cat_kaiju_table
-    )
-    contig_section = pn.Column(contig_header, contig_tab)
-
-    # --- Coverage plots --- #
-
-    # IO
-    coverage_plot_path = Path(coverage_plot_path)
-    coverage_plots = [
-        x
-        for x in coverage_plot_path.rglob(f"{sample_name}/*.svg")
-        if not "ipynb" in str(x)
-    ]
-
-    coverage_tab = pn.Tabs()
-    if coverage_plots:
-        for plot in coverage_plots:
-            name = plot.stem.split("_")[-1].replace(".", " ")
-            SVG_pane = pn.pane.SVG(plot, name=name)
-            coverage_tab.append(SVG_pane)
+    files = {name: manifest.artifacts(results_manifest, sample_folder, name) for name in results_manifest["samples"]}
+    options = {"deferred_tabs": args.deferred_tabs, "svg_processor": svg_processor}
+
+    if args.processes == 1:
+        # the previews of all samples first, then the full reports (reusing the sections of the previews)
+        previews = {}
+        if args.preview:
+            for name in results_manifest["samples"]:
+                previews[name] = panel_preview(
+                    sample_folder / name, args.coverage_plots, args.outdir, files[name], budget=args.preview_budget, **options
+                )
+
+        for name in results_manifest["samples"]:
+            sample = sample_folder / name
+            before = scheduler.current_rss()
+            panel_report(sample, args.coverage_plots, args.outdir, files=files[name], sections=previews.pop(name, None), **options)
+            # Panel keeps every saved report in memory
+            state.reset()
+            print(f"{name}: memory growth {(scheduler.current_rss() - before) / 1024**2:+.1f} MB")
     else:
-        no_plots = pn.pane.Markdown(
-            "## No Coverage plots Available", name="No Coverage Plots"
+        samples = [sample_folder / name for name in results_manifest["samples"]]
+        memory_limit = int(args.memory_limit * 1024**3) if args.memory_limit else None
+        results = scheduler.run_batch(
+            samples,
+            panel_job,
+            job_kwargs={
+                "sample_files": files,
+                "coverage_plot_path": args.coverage_plots,
+                "outfolder": args.outdir,
+                "preview": args.preview,
+                "budget": args.preview_budget,
+                **options,
+            },
+            max_workers=args.processes,
+            memory_limit=memory_limit,
+            estimates={
+                sample: scheduler.estimate_memory(
+                    sample, manifest.sample_files(results_manifest, sample_folder, sample.name)
+                )
+                for sample in samples
+            },
+            max_tasks_per_worker=args.max_samples_per_worker,
+            max_worker_rss=int(args.max_worker_rss * 1024**3) if args.max_worker_rss else None,
+            reset=state.reset,
         )
-        coverage_tab.append(no_plots)
-
-    # Header for this section
-    coverage_header = header(
-        text=f"## Alignment Coverage", bg_color="#04c273", height=80, textalign="left"
-    )
-
-    # Section
-    coverage_section = pn.Column(coverage_header, coverage_tab)
-
-    # --- Information about programs used --- #
-
-    kaiju_and_kraken_info = pn.pane.Markdown(
-        f"""
-        ## Kaiju and Kraken2
-        Kaiju and Kraken2 are both programs for taxonomic classification of DNA sequences.
-        They both use a database of known genetic markers and a sequence alignment algorithm to compare a query sequence to the reference 
-        index and score the alignments between the two
-        
-        * Algorithms: Kaiju uses the MEGAN algorithm for taxonomic classification, while Kraken2 uses a custom algorithm called "k-mer counting." 
-        The specific algorithm used can affect the speed and accuracy of the classification.
-        * Reference database: Kaiju and Kraken2 use different reference databases for taxonomic classification. 
-        Kaiju uses a database called "NINJA" (Non-redundant Improved and Normalized Just-in-time Annotations), 
-        which includes annotations for a wide variety of organisms.
-        Kraken2 uses a database called "Minikraken," 
-        which includes annotations for a more limited set of organisms but is more comprehensive for those organisms.
-        """,
-        name="Kaiju and Kraken",
-    )
-    megahit_info = pn.pane.Markdown(
-        f"""
-        ## MEGAHIT
-        MegaHit is a program for assembling DNA sequences, also known as "contigs," from raw sequencing data. 
-        It is designed to take a large number of short DNA sequences, called reads, 
-        and use them to reconstruct the full-length sequences from which they were derived.
-        
-        * MEGAHIT processes the raw sequencing data to filter out low-quality reads and remove contaminants.
-        * It aligns the reads to a set of known sequences called "k-mers," which are short, fixed-length substrings of the genome.
-        * Based on the alignments, MegaHit identifies overlaps between the reads and assembles them into longer contigs using a de Bruijn graph algorithm.
-        * The final output of MegaHit is a set of assembled contigs, which can be used for further analysis such as gene prediction or phylogenetic analysis.
-        """,
-        name="MEGAHIT",
-    )
-
-    cat_info = pn.pane.Markdown(
-        f"""
-        ## CAT
-        CAT is designed to identify the species or other taxonomic group of origin for a given DNA sequence, 
-        based on the presence or absence of specific genetic markers.
-        
-        * CAT uses a database of known genetic markers for different taxonomic groups to create a reference index.
-        * The DNA sequence to be classified is compared to the reference index using a sequence alignment algorithm, such as BLAST.
-        * CAT scores each alignment between the amplicon and the reference markers based on how well they match.
-        * The taxonomic group with the highest score is considered the most likely origin of the sequence.
-        """,
-        name="CAT",
-    )
-
-    # Header for this section
-    information_header = header(
-        text=f"## Information About Programs Used",
-        bg_color="#04c273",
-        height=80,
-        textalign="left",
-    )
-
-    # Section
-    information_tab = pn.Tabs(kaiju_and_kraken_info, megahit_info, cat_info)
-    information_section = pn.Column(information_header, information_tab)
-
-    # --- Create the report --- #
-
-    # header
-    head = header(
-        text=f"""
-        # Pandemic Preparedness Report
-        ## Report of Sample {sample.parts[-1]}
-        """,
-        fontsize="20px",
-        bg_color="#011a01",
-        height=185,
-    )
-
-    all_tabs = pn.Tabs(
-        ("Alignment Stats", alignment_section),
-        ("Classification of Raw Reads", raw_section),
-        ("Classification of Contigs", contig_section),
-        ("Alignment Coverage", coverage_section),
-        ("Information About Programs", information_section),
-        tabs_location="left",
-    )
-
-    outfile = outfolder / f"{sample_name}_report.html"
-    report = pn.Column(
-        head,
-        pn.layout.Divider(),
-        all_tabs,
-    ).save(outfile, title=f"Report {sample_name}")
+        for sample, result in results.items():
+            if result["peak_rss"] is not None:
+                print(
+                    f"{sample.name}: peak memory {result['peak_rss'] / 1024**2:.1f} MB,"
+                    f" memory growth {result['rss_growth'] / 1024**2:+.1f} MB"
+                )
+            if result["status"] != "done":
+                print(f"{sample.name}: {result['status']}\n{result['error']}")
+
+    if args.archive:
+        names = [f"{name}_report.html" for name in results_manifest["samples"]]
+        for name, status in archive.add(args.archive, archive.run_names(args.outdir, names, args.archive_run)).items():
+            print(f"{args.archive}: {name} {status}")
@@ -0,0 +1,23 @@
+from pathlib import Path
+import argparse
+import sys
+from utils import qc_table
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Collect the read statistics (bowtie2 and fastp) of all samples in the results folder into one QC table")
+    parser.add_argument("--results", default="../virusclassification_nextflow/results/", help="Folder with one subfolder per sample")
+    parser.add_argument("--output", default=None, help="File with the QC table, which is updated incrementally (.parquet or .csv). Default: <results>/.virushanter/qc.parquet (.csv without pyarrow)")
+    parser.add_argument("--manifest", default=None, help="File with the manifest of the results folder, which is updated incrementally. Default: <results>/.virushanter/manifest.json")
+    parser.add_argument("--threads", type=int, default=8, help="Number of logs and reports parsed at the same time. Default: 8")
+    parser.add_argument("--print", action="store_true", help="Print the table")
+    args = parser.parse_args()
+
+    table, failures = qc_table.update(Path(args.results), args.output, args.manifest, args.threads)
+    print(f"QC table of {len(table)} samples")
+    if args.print:
+        print(table.drop(columns="signature").to_string())
+    if failures:
+        for name, error in failures.items():
+            print(f"{name}: {error}", file=sys.stderr)
+        sys.exit(f"{len(failures)} samples could not be parsed")
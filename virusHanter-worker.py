@@ -0,0 +1,75 @@
+import argparse
+import json
+import sys
+from report import daemon
+from utils import read_engine
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report worker that keeps the report libraries loaded and builds reports submitted over a Unix socket")
+    parser.add_argument("--socket", default=daemon.SOCKET_PATH, help=f"Socket of the worker. Default: {daemon.SOCKET_PATH}")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve = commands.add_parser("serve", help="Run the worker")
+    serve.add_argument("--jobs", type=int, default=1, help="Maximum number of reports built at the same time")
+    serve.add_argument("--chart-cache", default=None, help="Folder to cache the charts of the html reports in")
+    serve.add_argument("--chart-cache-size", type=float, default=1, help="Maximum size (GB) of the chart cache")
+    serve.add_argument("--cat-cache", default=None, help="Folder to cache the parsed CAT tables in")
+    serve.add_argument("--cat-cache-size", type=float, default=1, help="Maximum size (GB) of the CAT table cache")
+    serve.add_argument("--max-rss", type=float, default=2, help="Memory (GB) of the worker above which the parsed files it keeps cached are freed after a job")
+    serve.add_argument("--read-engine", choices=read_engine.ENGINES, default=None, help=f"Engine to read the tables with. Default: ${read_engine.ENGINE_VARIABLE} or pandas")
+
+    submit = commands.add_parser("submit", help="Submit a report and wait until it is written")
+    submit.add_argument("sample", help="Sample folder")
+    submit.add_argument("--backend", choices=daemon.BACKENDS, default="html", help="Report to build. Default: html")
+    submit.add_argument("--outdir", default=".", help="Folder to write the report to")
+    submit.add_argument("--threads", type=int, default=1, help="Number of threads to load the sample with (html)")
+    submit.add_argument("--coverage-plots", default=None, help="Folder with the coverage plots (panel). Default: the sample folder")
+    submit.add_argument("--deferred-tabs", action="store_true", help="Only render the hidden tabs when they are clicked (panel)")
+    submit.add_argument("--timeout", type=float, default=None, help="Seconds to wait for the report")
+    submit.add_argument("--local-fallback", action="store_true", help="Build the report in this process if no worker is running")
+
+    commands.add_parser("ping", help="Show the status of the worker")
+    commands.add_parser("stop", help="Stop the worker")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        if args.read_engine:
+            read_engine.set_engine(args.read_engine)
+        # imported here so that the other commands do not load the report libraries
+        from utils import cat_lineage, chart_cache
+
+        if args.cat_cache:
+            cat_lineage.set_cache_dir(args.cat_cache, max_bytes=int(args.cat_cache_size * 1024**3))
+        cache = None
+        if args.chart_cache:
+            cache = chart_cache.ChartCache(args.chart_cache, max_bytes=int(args.chart_cache_size * 1024**3))
+        daemon.serve(args.socket, args.jobs, cache, max_rss=int(args.max_rss * 1024**3))
+        sys.exit(0)
+
+    if args.command in ("ping", "stop"):
+        try:
+            print(json.dumps(daemon.request({"command": args.command}, args.socket)))
+        except ConnectionError as e:
+            sys.exit(str(e))
+        sys.exit(0)
+
+    options = {"threads": args.threads} if args.backend == "html" else {"deferred_tabs": args.deferred_tabs}
+    if args.backend == "panel" and args.coverage_plots:
+        options["coverage_plots"] = args.coverage_plots
+
+    try:
+        result = daemon.submit(args.sample, args.outdir, args.backend, args.socket, args.timeout, **options)
+    except ConnectionError as e:
+        if not args.local_fallback:
+            sys.exit(str(e))
+        print(f"{e}, building the report in this process", file=sys.stderr)
+        job = {"sample": args.sample, "output": args.outdir, "backend": args.backend, **options}
+        try:
+            result = {"status": "done", "report": str(daemon.load_backends()[args.backend](job))}
+        except Exception as error:
+            result = {"status": "failed", "error": repr(error)}
+
+    if result["status"] != "done":
+        sys.exit(f"{args.sample}: {result['status']}\n{result.get('error', '')}")
+    print(result["report"])